@@ -26,3 +26,35 @@ class ReviewClassifier:
         self.bert_model = AutoModelForSequenceClassification.from_pretrained(str(bert_dir))
         self.bert_model.eval()
 
+
+
+# ---------- per-location dashboard (backed by src/location_index.py) ----------
+from src.location_index import LocationIndex, INDEX_DB
+
+_location_index = None
+
+def location_index():
+    global _location_index
+    if _location_index is None:
+        _location_index = LocationIndex(INDEX_DB)
+    return _location_index
+
+@app.route("/api/locations/search")
+def search_locations():
+    q = request.args.get("q", "")
+    limit = min(request.args.get("limit", 10, type=int), 50)
+    return jsonify(location_index().search(q, limit))
+
+@app.route("/api/locations/<int:loc_id>")
+def location_summary(loc_id):
+    summary = location_index().summary(loc_id)
+    if summary is None:
+        return jsonify({"error": f"unknown location {loc_id}"}), 404
+    return jsonify(summary)
+
+@app.route("/api/locations/<int:loc_id>/reviews")
+def location_reviews(loc_id):
+    label = request.args.get("label", type=int)
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", 20, type=int)
+    return jsonify(location_index().reviews(loc_id, label, page, per_page))
@@ -1,8 +1,11 @@
-import glob, os
+import glob, os, sys
 import pandas as pd
 from pathlib import Path
 from sklearn.model_selection import train_test_split
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import TFIDF_MODEL
+
 RAW = Path("data/raw/reviews.csv")  # prefer this if present
 OUT = Path("data/processed"); OUT.mkdir(parents=True, exist_ok=True)
 
@@ -109,7 +112,14 @@ def main():
     # else prepare unlabeled / to_label
     unl = df[["id", text_col]].copy()
     unl.to_csv(OUT/"unlabeled.csv", index=False, encoding="utf-8")
-    samp = unl.sample(n=min(400, len(unl)), random_state=42).copy()
+    if TFIDF_MODEL.exists():
+        # spend the labeling budget on uncertain, diverse rows (src/active_learning.py)
+        from src.active_learning import sample_to_label
+        from src.feature_store import default_store
+        samp = sample_to_label(OUT/"unlabeled.csv", n=400, text_col=text_col,
+                               store=default_store())[["id", text_col]]
+    else:
+        samp = unl.sample(n=min(400, len(unl)), random_state=42).copy()
     samp["label"] = ""
     samp.to_csv(OUT/"to_label.csv", index=False, encoding="utf-8")
     print(f"No (sufficient) labels. Wrote unlabeled.csv and to_label.csv (text column='{text_col}').")
@@ -1,10 +1,21 @@
 from pathlib import Path
-import json, numpy as np, pandas as pd, torch
+import argparse, json, sys, numpy as np, pandas as pd, torch
 from sklearn.metrics import classification_report
 from datasets import Dataset, DatasetDict
 from transformers import (AutoTokenizer, AutoModelForSequenceClassification,
                           DataCollatorWithPadding, TrainingArguments, Trainer)
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import HOLDOUT_IDS, holdout_mask, pool_windows
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--stride", type=int, default=None,
+                help="train/evaluate on overlapping 512-token windows (this many tokens of overlap) instead of truncating")
+ap.add_argument("--pool", choices=["mean", "max"], default="mean", help="how window probabilities are combined at eval")
+ap.add_argument("--no-holdout", action="store_true",
+                help="train on all of train.csv (11_stack.py then keeps the default triple weights)")
+args = ap.parse_args()
+
 PROC = Path("data/processed")
 OUT  = Path("outputs"); (OUT/"metrics").mkdir(parents=True, exist_ok=True); (OUT/"preds").mkdir(parents=True, exist_ok=True)
 MODEL_DIR = Path("models/distilbert"); MODEL_DIR.mkdir(parents=True, exist_ok=True)
@@ -20,13 +31,28 @@ test_df  = pd.read_csv(test_csv) if test_csv.exists() else pd.read_csv(train_csv
 train_df["label"] = pd.to_numeric(train_df["label"], errors="coerce").astype("Int64")
 test_df["label"]  = pd.to_numeric(test_df["label"], errors="coerce").astype("Int64")
 
+# leave the stacking holdout out of training: 11_stack.py fits the triple blend on it
+holdout = train_df.iloc[:0]
+if not args.no_holdout:
+    hold = holdout_mask(train_df["label"].astype(int))
+    holdout, train_df = train_df[hold], train_df[~hold].reset_index(drop=True)
+
 MODEL_NAME = "distilbert-base-uncased"
 tok = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
 
-def tokenize(batch): return tok(batch["text"], truncation=True)
-
-train_ds = Dataset.from_pandas(train_df[["text","label"]], preserve_index=False)
-eval_ds  = Dataset.from_pandas(test_df[["text","label"]], preserve_index=False)
+def tokenize(batch):
+    if args.stride is None:
+        return tok(batch["text"], truncation=True)
+    # every window of a long review becomes an example carrying the review's label
+    enc = tok(batch["text"], truncation=True, max_length=tok.model_max_length, stride=args.stride,
+              return_overflowing_tokens=True)
+    owner = enc.pop("overflow_to_sample_mapping")
+    enc["label"] = [batch["label"][i] for i in owner]
+    enc["review"] = [batch["review"][i] for i in owner]
+    return enc
+
+train_ds = Dataset.from_pandas(train_df[["text","label"]].assign(review=np.arange(len(train_df))), preserve_index=False)
+eval_ds  = Dataset.from_pandas(test_df[["text","label"]].assign(review=np.arange(len(test_df))), preserve_index=False)
 ds_tok_train = train_ds.map(tokenize, batched=True, remove_columns=["text"])
 ds_tok_eval  = eval_ds.map(tokenize, batched=True, remove_columns=["text"])
 collator = DataCollatorWithPadding(tokenizer=tok)
@@ -73,6 +99,8 @@ trainer.train()
 pred = trainer.predict(ds_tok_eval)
 logits = pred.predictions
 probs = torch.softmax(torch.tensor(logits), dim=-1).numpy()
+if args.stride is not None:
+    probs = pool_windows(probs, np.asarray(ds_tok_eval["review"]), len(test_df), args.pool)
 pred_labels = probs.argmax(axis=1)
 
 rep = classification_report(test_df["label"].values, pred_labels, output_dict=True, zero_division=0)
@@ -85,6 +113,10 @@ pred_df.to_csv(OUT/"preds"/"distilbert_val.csv", index=False)
 # Save model + tokenizer
 trainer.save_model(str(MODEL_DIR))
 tok.save_pretrained(str(MODEL_DIR))
+if len(holdout):
+    HOLDOUT_IDS.write_text(json.dumps(holdout["id"].astype(str).tolist()))
+elif HOLDOUT_IDS.exists():
+    HOLDOUT_IDS.unlink()
 
 print("[distilbert] saved model ->", MODEL_DIR)
 print("[distilbert] metrics ->", OUT/"metrics"/"distilbert_val.json")
@@ -1,61 +1,147 @@
 from pathlib import Path
-import re, numpy as np, pandas as pd, joblib
+import sys, json, argparse, numpy as np, pandas as pd, joblib, scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import load_blend, rule_ids, onehot_ids, expand_proba_matrix
+from src.feature_store import default_store
 
 PROC = Path("data/processed"); PROC.mkdir(parents=True, exist_ok=True)
 OUT_PSEUDO = PROC/"pseudo_train.csv"
 OUT_MERGED = PROC/"train_plus_pseudo.csv"
 TFIDF_MODEL = Path("models/tfidf_lr/model.joblib")
+METRICS = Path("outputs/metrics"); METRICS.mkdir(parents=True, exist_ok=True)
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--rounds", type=int, default=10)
+ap.add_argument("--thresh", type=float, default=0.80, help="confidence floor for every class")
+ap.add_argument("--growth", type=float, default=0.25,
+                help="per round, a class may grow by at most this fraction of its current size")
+ap.add_argument("--min-new", type=int, default=5, help="stop once a round adds fewer rows than this")
+ap.add_argument("--chunk", type=int, default=50_000, help="rows scored per chunk")
+ap.add_argument("--val-frac", type=float, default=0.2,
+                help="share of train.csv held out to pick the best round (stratified)")
+args = ap.parse_args()
 
-# 1) load unlabeled and optional labeled train
+# 1) load unlabeled and labeled train (test rows are held out so the retrained model stays comparable)
 unl = pd.read_csv(PROC/"unlabeled.csv")
 base_train = pd.read_csv(PROC/"train.csv") if (PROC/"train.csv").exists() else None
+test = pd.read_csv(PROC/"test.csv") if (PROC/"test.csv").exists() else None
+seen = set(base_train["id"]) if base_train is not None else set()
+if test is not None: seen |= set(test["id"])
+unl = unl[~unl["id"].isin(seen)].reset_index(drop=True)
+texts = unl["text"].astype(str).tolist()
 
-# 2) rules
-ADS = re.compile(r"(http|www|promo|discount|use code|follow\s*@)", re.I)
-NOV = re.compile(r"(never been|haven't been|didn't go|won't go|heard it(?:'s| is))", re.I)
-IRR = re.compile(r"(my phone|ios|android|windows update|gpu driver)", re.I)
-def rule_label(t):
-    t = str(t or "")
-    if ADS.search(t): return 1
-    if NOV.search(t): return 3
-    if IRR.search(t): return 2
-    return None
-
-# 3) tfidf probs (expand to 4 classes if needed)
+# 2) features that don't change between rounds, computed once:
+#    the vectorizer stays frozen (so the LR can warm-start) and the rules are static
 clf = joblib.load(TFIDF_MODEL)
-classes = clf.named_steps["clf"].classes_
+vec = clf.named_steps["tfidf"]
+lr  = clone(clf.named_steps["clf"]).set_params(warm_start=True)
+lr.coef_, lr.intercept_, lr.classes_ = (clf.named_steps["clf"].coef_.copy(),
+                                        clf.named_steps["clf"].intercept_.copy(),
+                                        clf.named_steps["clf"].classes_)
+blend = load_blend("pair")
+
+#    TF-IDF rows come from the feature store when earlier runs/stages already vectorized these texts
+store = default_store()
+transform = (lambda t: store.tfidf(vec, t)) if store is not None else vec.transform
+X_unl = sp.vstack([transform(texts[i:i+args.chunk]) for i in range(0, len(texts), args.chunk)], format="csr") \
+    if texts else None
+R_unl = onehot_ids(rule_ids(texts))
 
-def expand_proba(p_row):
-    out = np.zeros(4, dtype=float)
-    for i, cls in enumerate(classes):
-        out[int(cls)] = p_row[i]
-    if out.sum() == 0: out[:] = 1.0/4
+X_base = y_base = X_val = y_val = None
+if base_train is not None:
+    X_all = transform(base_train["text"].astype(str))
+    y_all = base_train["label"].astype(int).to_numpy()
+    fit_idx, val_idx = train_test_split(np.arange(len(y_all)), test_size=args.val_frac,
+                                        stratify=y_all, random_state=42)
+    X_base, y_base, X_val, y_val = X_all[fit_idx], y_all[fit_idx], X_all[val_idx], y_all[val_idx]
+    lr.fit(X_base, y_base)   # round 0 without the validation rows, so every round is scored the same way
+X_test = transform(test["text"].astype(str)) if test is not None else None
+
+def score(idx):
+    """blended proba for the given unlabeled rows, in chunks"""
+    out = np.empty((len(idx), 4))
+    for s in range(0, len(idx), args.chunk):
+        rows = idx[s:s+args.chunk]
+        P = expand_proba_matrix(lr.predict_proba(X_unl[rows]), lr.classes_)
+        out[s:s+args.chunk] = blend(tfidf=P, rules=R_unl[rows])
     return out
 
-P = clf.predict_proba(unl["text"].astype(str))
-P = np.vstack([expand_proba(p) for p in P])
+def macro_f1(X, y):
+    if X is None: return None
+    return float(f1_score(y, lr.classes_[lr.decision_function(X).argmax(axis=1)], average="macro", zero_division=0))
 
-# 4) blend with rules (0.6 tfidf / 0.4 rules)
-R = np.zeros_like(P)
-for i, t in enumerate(unl["text"].astype(str)):
-    lbl = rule_label(t)
-    if lbl is not None: R[i, int(lbl)] = 1.0
+def test_f1():
+    return macro_f1(X_test, test["label"].astype(int) if test is not None else None)
 
-proba = 0.6*P + 0.4*R
-pred  = proba.argmax(axis=1)
-conf  = proba.max(axis=1)
+# 3) self-training rounds
+pending  = np.arange(len(texts))               # not yet accepted
+labels   = np.full(len(texts), -1); conf_at = np.zeros(len(texts)); round_at = np.zeros(len(texts), dtype=int)
+counts   = np.bincount(y_base, minlength=4).astype(float) if y_base is not None else np.zeros(4)
+log = [{"round": 0, "added": 0, "pending": len(pending), "val_macro_f1": macro_f1(X_val, y_val),
+        "test_macro_f1": test_f1()}]
+best = (0, log[0]["val_macro_f1"] or -1.0, lr.coef_.copy(), lr.intercept_.copy())   # round, val F1, weights
 
-# 5) keep only high confidence (you can tweak threshold)
-THRESH = 0.80
-mask = conf >= THRESH
-pseudo = unl.loc[mask, ["id","text"]].copy()
-pseudo["label"] = pred[mask]
-pseudo["confidence"] = conf[mask]
+for rnd in range(1, args.rounds + 1):
+    # the refit moves every coefficient, so every pending row has to be rescored;
+    # that is one sparse matmul over the (shrinking) pending rows
+    proba = score(pending)
+    pred, conf = proba.argmax(axis=1), proba.max(axis=1)
+
+    # class-balanced selection: each class gets its own cutoff (never below --thresh)
+    # and may grow by at most --growth of its current size per round
+    take, cutoffs = [], {}
+    for c in range(4):
+        cand = np.flatnonzero((pred == c) & (conf >= args.thresh))
+        cap = max(args.min_new, int(args.growth * counts[c]))
+        cand = cand[np.argsort(-conf[cand], kind="stable")[:cap]]
+        cutoffs[c] = float(conf[cand[-1]]) if len(cand) else None
+        take.append(cand)
+    take = np.concatenate(take)
+    if len(take) < args.min_new:
+        print(f"[self-train] round {rnd}: only {len(take)} new rows, stopping")
+        break
 
+    acc = pending[take]
+    labels[acc], conf_at[acc], round_at[acc] = pred[take], conf[take], rnd
+    counts += np.bincount(pred[take], minlength=4)
+    pending = np.setdiff1d(pending, acc, assume_unique=True)
+
+    # retrain (warm-started from the previous round's coefficients)
+    done = np.flatnonzero(labels >= 0)
+    X_fit = sp.vstack([X_base, X_unl[done]]) if X_base is not None else X_unl[done]
+    y_fit = np.concatenate([y_base, labels[done]]) if y_base is not None else labels[done]
+    lr.fit(X_fit, y_fit)
+
+    log.append({"round": rnd, "added": int(len(take)), "pending": int(len(pending)),
+                "cutoffs": cutoffs, "val_macro_f1": macro_f1(X_val, y_val), "test_macro_f1": test_f1()})
+    print(f"[self-train] round {rnd}: +{len(take)} rows, {len(pending)} pending, "
+          f"val macro-F1={log[-1]['val_macro_f1']}, test macro-F1={log[-1]['test_macro_f1']}")
+    if X_val is None or log[-1]["val_macro_f1"] > best[1]:   # no train.csv: keep the last round
+        best = (rnd, log[-1]["val_macro_f1"], lr.coef_.copy(), lr.intercept_.copy())
+    if not len(pending): break
+
+# keep the rounds up to the one with the best validation macro-F1
+best_round = best[0]
+labels[round_at > best_round] = -1
+lr.coef_, lr.intercept_ = best[2], best[3]
+print(f"[self-train] best round by validation: {best_round} (val macro-F1={best[1]}, test macro-F1={test_f1()})")
+
+# 4) outputs
+mask = labels >= 0
+pseudo = unl.loc[mask, ["id","text"]].copy()
+pseudo["label"] = labels[mask]
+pseudo["confidence"] = conf_at[mask]
+pseudo["round"] = round_at[mask]
 pseudo.to_csv(OUT_PSEUDO, index=False)
-print(f"[pseudolabel] wrote {len(pseudo)} rows -> {OUT_PSEUDO} (threshold={THRESH})")
+print(f"[pseudolabel] wrote {len(pseudo)} rows -> {OUT_PSEUDO} (floor={args.thresh})")
+
+(METRICS/"self_train.json").write_text(json.dumps({"best_round": best_round, "rounds": log}, indent=2))
 
-# 6) optionally merge with labeled train to create a larger set
+# 5) optionally merge with labeled train to create a larger set
 if base_train is not None and len(pseudo) > 0:
     merged = pd.concat([base_train[["id","text","label"]], pseudo[["id","text","label"]]], ignore_index=True)
     merged.to_csv(OUT_MERGED, index=False)
@@ -1,11 +1,21 @@
+import argparse
 import json
 from pathlib import Path
 import numpy as np
 import pandas as pd
 import joblib
-import re
+import sys
 from sklearn.metrics import classification_report
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import load_blend, bulk_score, join_text
+from src.feature_store import default_store
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--with-text", action="store_true",
+                help="also write the review text into ensemble_test.csv (joined back by id)")
+args = ap.parse_args()
+
 # paths
 processed = Path("data/processed")
 outputs   = Path("outputs")
@@ -25,56 +35,17 @@ if not model_path.exists():
     raise FileNotFoundError("Missing TF-IDF model. Run 03_train_tfidf_lr.py first.")
 clf = joblib.load(model_path)
 
-# get class ids the model actually learned (e.g., array([0,2]))
-classes = clf.named_steps["clf"].classes_
-NUM_ALL = 4
-
-def expand_proba(p_row, classes):
-    out = np.zeros(NUM_ALL, dtype=float)
-    for i, cls in enumerate(classes):
-        out[int(cls)] = p_row[i]
-    # if no prob mass assigned (edge case), fallback to uniform
-    if out.sum() == 0:
-        out[:] = 1.0 / NUM_ALL
-    return out
-
-# rules (return class id or None)
-ADS_PAT       = re.compile(r"(http|www|promo|discount|use code|follow\s*@)", re.I)
-NO_VISIT_PAT  = re.compile(r"(never been|haven't been|didn't go|won't go|heard it(?:'s| is))", re.I)
-IRREL_PAT     = re.compile(r"(my phone|ios|android|windows update|gpu driver)", re.I)
-
-def rule_label(text: str):
-    t = str(text)
-    if ADS_PAT.search(t):       return 1
-    if NO_VISIT_PAT.search(t):  return 3
-    if IRREL_PAT.search(t):     return 2
-    return None
-
-def onehot(label):
-    v = np.zeros(NUM_ALL, dtype=float)
-    if label is not None:
-        v[int(label)] = 1.0
-    return v
-
-# predict
-texts = df["text"].astype(str).tolist()
-proba_raw = clf.predict_proba(texts)          # shape [n, len(classes)]
-proba_tf  = np.vstack([expand_proba(p, classes) for p in proba_raw])  # [n,4]
-proba_ru  = np.vstack([onehot(rule_label(t)) for t in texts])         # [n,4]
-
-# soft vote
-w_rules, w_tfidf = 0.4, 0.6
-proba = w_tfidf * proba_tf + w_rules * proba_ru
-pred  = proba.argmax(axis=1)
+# predict: rules + tfidf soft vote (stacked weights if src/11_stack.py has been run),
+# vectorized over the whole column -> float32 [n,4] probabilities, uint8 labels
+pred, proba = bulk_score(clf, df["text"], load_blend("pair"), store=default_store())
 
-# save outputs
+# save outputs: ids only, the text stays in test.csv (--with-text joins it back)
 out_preds = outputs/"preds"/"ensemble_test.csv"
-pd.DataFrame({
-    "id": df.get("id", pd.Series(range(len(df)))),
-    "text": df["text"],
-    "label": df.get("label"),
-    "pred": pred
-}).to_csv(out_preds, index=False)
+ids = df["id"] if "id" in df else pd.Series(np.arange(len(df)), name="id")
+preds = pd.DataFrame({"id": ids.to_numpy(), "label": df.get("label"), "pred": pred})
+if args.with_text:
+    preds = join_text(preds, test_csv) if "id" in df else preds.assign(text=df["text"].to_numpy())
+preds.to_csv(out_preds, index=False)
 
 # metrics if labels available
 if "label" in df.columns:
@@ -1,33 +1,33 @@
+import sys, argparse
 from pathlib import Path
 import pandas as pd
-from sklearn.metrics import classification_report
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.evaluation import summarize
 
 PREDS_DIR = Path("outputs/preds")
 METRICS_DIR = Path("outputs/metrics"); METRICS_DIR.mkdir(parents=True, exist_ok=True)
 
-rows = []
-for fp in PREDS_DIR.glob("*.csv"):
-    try:
-        df = pd.read_csv(fp)
-        if not {"label","pred"}.issubset(df.columns):
-            continue
-        rep = classification_report(df["label"], df["pred"], output_dict=True, zero_division=0)
-        rows.append({
-            "file": fp.name,
-            "accuracy": rep.get("accuracy", 0.0),
-            "macro_f1": rep.get("macro avg", {}).get("f1-score", 0.0),
-            "f1_valid": rep.get("0", {}).get("f1-score", 0.0),
-            "f1_ad": rep.get("1", {}).get("f1-score", 0.0),
-            "f1_irrelevant": rep.get("2", {}).get("f1-score", 0.0),
-            "f1_rant": rep.get("3", {}).get("f1-score", 0.0),
-            "support": int(rep.get("macro avg", {}).get("support", 0))
-        })
-    except Exception as e:
-        print(f"[warn] skipping {fp}: {e}")
+ap = argparse.ArgumentParser()
+ap.add_argument("--bootstrap", type=int, default=5000, help="bootstrap resamples for the CIs")
+ap.add_argument("--alpha", type=float, default=0.05, help="CI level is 1 - alpha")
+ap.add_argument("--workers", type=int, default=None)
+args = ap.parse_args()
+
+summary = summarize(PREDS_DIR, B=args.bootstrap, alpha=args.alpha, workers=args.workers)
 
-if rows:
-    summary = pd.DataFrame(rows).sort_values("macro_f1", ascending=False)
-    print(summary.to_string(index=False))
+if len(summary):
+    pct = int(round(100 * (1 - args.alpha)))
+    view = summary.copy()
+    for m in ["accuracy", "macro_f1", "f1_valid", "f1_ad", "f1_irrelevant", "f1_rant"]:
+        view[m] = [f"{v:.3f} [{lo:.3f}, {hi:.3f}]" for v, lo, hi in zip(view[m], view[f"{m}_lo"], view[f"{m}_hi"])]
+    cols = ["file", "accuracy", "macro_f1", "f1_valid", "f1_ad", "f1_irrelevant", "f1_rant", "support"]
+    if "delta_vs_best" in view:
+        view["vs_best"] = [f"{d:+.3f} [{lo:+.3f}, {hi:+.3f}]" if pd.notna(d) else ""
+                           for d, lo, hi in zip(view["delta_vs_best"], view["delta_lo"], view["delta_hi"])]
+        cols.append("vs_best")
+    print(f"point estimate [{pct}% bootstrap CI, B={args.bootstrap}]")
+    print(view[cols].to_string(index=False))
     summary.to_csv(METRICS_DIR/"summary.csv", index=False)
     print("\nSaved ->", METRICS_DIR/"summary.csv")
 else:
@@ -1,6 +1,10 @@
-import argparse, re, numpy as np, joblib, torch
+import argparse, re, sys, numpy as np, joblib
+from pathlib import Path
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import load_blend, bert_proba
+
 LABELS = {0:"valid",1:"advertisement",2:"irrelevant",3:"rant_no_visit"}
 
 ADS = re.compile(r"(http|www|promo|discount|use code|follow\s*@)", re.I)
@@ -28,6 +32,10 @@ def expand_tfidf(p_row, classes, k=4):
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--text", required=True)
+    ap.add_argument("--stride", type=int, default=None,
+                    help="score overlapping 512-token windows (this many tokens of overlap) instead of truncating")
+    ap.add_argument("--pool", choices=["mean", "max"], default="mean", help="how window probabilities are combined")
+    ap.add_argument("--token-budget", type=int, default=None, help="max tokens scored across all windows")
     args = ap.parse_args()
 
     text = args.text
@@ -41,16 +49,13 @@ def main():
     tok = AutoTokenizer.from_pretrained("models/distilbert")
     mdl = AutoModelForSequenceClassification.from_pretrained("models/distilbert")
     mdl.eval()
-    with torch.no_grad():
-        enc = tok([text], padding=True, truncation=True, return_tensors="pt")
-        p_bert = torch.softmax(mdl(**enc).logits, dim=-1).cpu().numpy()[0]
+    p_bert = bert_proba(tok, mdl, [text], stride=args.stride, pool=args.pool, token_budget=args.token_budget)[0]
 
     # Rules
     p_rules = onehot(rule_id(text))
 
-    # Blend
-    w_bert, w_tfidf, w_rules = 0.5, 0.3, 0.2
-    p = w_bert*p_bert + w_tfidf*p_tfidf + w_rules*p_rules
+    # Blend (stacked weights if src/11_stack.py has been run, else 0.5/0.3/0.2)
+    p = load_blend("triple")(bert=p_bert, tfidf=p_tfidf, rules=p_rules)[0]
     k = int(np.argmax(p))
     print({"label_id": k, "label_name": LABELS[k], "confidence": float(p[k])})
 
@@ -0,0 +1,119 @@
+import sys, json, time
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.metrics import classification_report
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import (TFIDF_MODEL, STUDENT_MODEL, NUM_ALL, rule_ids, onehot_ids,
+                       tfidf_proba, load_bert, bert_proba, load_blend)
+from src.feature_store import default_store
+from src.demo_infer import ADS, NOV, IRR   # the rule patterns src/app.py serves (NOV is wider than utils')
+
+PROC = Path("data/processed")
+OUT  = Path("outputs"); (OUT/"metrics").mkdir(parents=True, exist_ok=True); (OUT/"preds").mkdir(parents=True, exist_ok=True)
+STUDENT_MODEL.parent.mkdir(parents=True, exist_ok=True)
+
+# student sizes to sweep (hashed bag-of-ngrams width, fastText-style)
+SIZES = [2**10, 2**12, 2**14, 2**16, 2**18]
+MAX_F1_DROP = 0.01   # keep the smallest student within this of the best
+
+unl   = pd.read_csv(PROC/"unlabeled.csv")
+train = pd.read_csv(PROC/"train.csv") if (PROC/"train.csv").exists() else None
+test  = pd.read_csv(PROC/"test.csv")
+
+# unlabeled.csv is the full cleaned corpus; don't distill on the test rows
+unl = unl[~unl["id"].isin(test["id"])].reset_index(drop=True)
+
+# 1) teacher = triple ensemble from 08c (falls back to tfidf+rules without DistilBERT)
+tfidf = joblib.load(TFIDF_MODEL)
+tok, bert = load_bert()
+if bert is None:
+    print("[distill] models/distilbert not found; teacher = tfidf+rules blend")
+blend = load_blend("pair" if bert is None else "triple")
+store = default_store()   # cached TF-IDF rows / token ids (src/feature_store.py)
+
+def teacher_proba(texts):
+    p_tfidf = tfidf_proba(tfidf, texts, store=store)
+    p_rules = onehot_ids(rule_ids(texts, ADS, NOV, IRR))
+    if bert is None:
+        return blend(tfidf=p_tfidf, rules=p_rules)
+    return blend(bert=bert_proba(tok, bert, texts, store=store), tfidf=p_tfidf, rules=p_rules)
+
+P_unl = teacher_proba(unl["text"])
+
+# 2) soft targets: repeating each row once per class with sample_weight = teacher prob
+#    makes the LR loss exactly the cross-entropy against the teacher distribution
+texts = unl["text"].astype(str).tolist()
+X = texts * NUM_ALL
+y = np.repeat(np.arange(NUM_ALL), len(texts))
+w = P_unl.T.reshape(-1)
+if train is not None:  # gold labels count as one-hot targets
+    X += train["text"].astype(str).tolist()
+    y = np.concatenate([y, train["label"].astype(int).to_numpy()])
+    w = np.concatenate([w, np.ones(len(train))])
+keep = w > 1e-6
+X = [x for x, k in zip(X, keep) if k]; y = y[keep]; w = w[keep]
+
+def make_student(n_features):
+    return Pipeline([
+        ("hash", HashingVectorizer(ngram_range=(1,2), n_features=n_features, alternate_sign=False)),
+        # no class_weight: per-class weights would rescale the soft targets away from the teacher's
+        ("clf", LogisticRegression(max_iter=1000)),
+    ])
+
+def latency(fn, texts, reps=200):
+    """(p50 ms for a single review, reviews/sec for the whole batch)"""
+    one = []
+    for t in texts[:reps]:
+        t0 = time.perf_counter(); fn([t]); one.append(time.perf_counter() - t0)
+    t0 = time.perf_counter(); fn(texts); batch = time.perf_counter() - t0
+    return 1000*float(np.median(one)), len(texts)/batch
+
+test_texts = test["text"].astype(str).tolist()
+y_test = test["label"].astype(int).to_numpy()
+
+def score(pred):
+    rep = classification_report(y_test, pred, output_dict=True, zero_division=0)
+    return rep["accuracy"], rep["macro avg"]["f1-score"]
+
+# 3) teacher reference point
+P_teacher = teacher_proba(test_texts)
+acc, f1 = score(P_teacher.argmax(axis=1))
+p50, tput = latency(teacher_proba, test_texts)
+rows = [{"model": "teacher", "n_features": None, "accuracy": acc, "macro_f1": f1,
+         "agreement": 1.0, "p50_ms": p50, "reviews_per_s": tput}]
+
+# 4) sweep student sizes
+students = {}
+for n in SIZES:
+    s = make_student(n).fit(X, y, clf__sample_weight=w)
+    students[n] = s
+    pred = s.predict(test_texts)
+    acc, f1 = score(pred)
+    p50, tput = latency(s.predict_proba, test_texts)
+    rows.append({"model": "student", "n_features": n, "accuracy": acc, "macro_f1": f1,
+                 "agreement": float((pred == P_teacher.argmax(axis=1)).mean()),
+                 "p50_ms": p50, "reviews_per_s": tput})
+    print(f"[distill] n_features={n:>6}  macro-F1={f1:.3f}  p50={p50:.2f}ms  {tput:,.0f} rev/s")
+
+curve = pd.DataFrame(rows)
+best = curve.loc[curve["model"] == "student", "macro_f1"].max()
+ok = curve[(curve["model"] == "student") & (curve["macro_f1"] >= best - MAX_F1_DROP)]
+chosen = int(ok["n_features"].min())
+
+student = students[chosen]
+joblib.dump(student, STUDENT_MODEL)
+pd.DataFrame({"id": test["id"], "text": test["text"], "label": test["label"],
+              "pred": student.predict(test_texts)}).to_csv(OUT/"preds"/"student_test.csv", index=False)
+
+curve.to_csv(OUT/"metrics"/"distill_tradeoff.csv", index=False)
+(OUT/"metrics"/"distill_tradeoff.json").write_text(json.dumps(
+    {"teacher": "tfidf+rules" if bert is None else "distilbert+tfidf+rules",
+     "chosen_n_features": chosen, "curve": curve.to_dict(orient="records")}, indent=2))
+
+print(curve.to_string(index=False))
+print(f"[distill] saved student (n_features={chosen}) -> {STUDENT_MODEL}")
+print(f"[distill] trade-off curve -> {OUT/'metrics'/'distill_tradeoff.csv'}")
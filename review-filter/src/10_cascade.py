@@ -0,0 +1,81 @@
+import sys, json, time, argparse
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+from sklearn.metrics import f1_score
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import (TFIDF_MODEL, CASCADE_CFG, rule_ids, onehot_ids, tfidf_proba,
+                       load_bert, bert_proba, cascade_escalate, load_blend)
+from src.demo_infer import ADS, NOV, IRR   # the patterns src/app.py serves with (NOV is wider than utils')
+
+PROC = Path("data/processed")
+OUT  = Path("outputs"); (OUT/"metrics").mkdir(parents=True, exist_ok=True); (OUT/"preds").mkdir(parents=True, exist_ok=True)
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--target-f1", type=float, default=None,
+                help="macro-F1 the cascade must reach (default: full triple ensemble F1 - 0.005)")
+ap.add_argument("--batch-size", type=int, default=32)
+args = ap.parse_args()
+
+test_csv = PROC/"test.csv"
+if not test_csv.exists(): raise FileNotFoundError("Missing data/processed/test.csv. Run 01_clean.py first.")
+test = pd.read_csv(test_csv)
+texts = test["text"].astype(str).tolist()
+y = test["label"].astype(int).to_numpy()
+
+tfidf = joblib.load(TFIDF_MODEL)
+tok, bert = load_bert()
+if bert is None: raise FileNotFoundError("Missing models/distilbert. Run 04_train_distilbert.py first.")
+
+# score every stage once (timed), then replay the cascade for each threshold
+t0 = time.perf_counter(); lbl_rules = rule_ids(texts, ADS, NOV, IRR);                          t_rules = time.perf_counter() - t0
+t0 = time.perf_counter(); p_tfidf = tfidf_proba(tfidf, texts);                  t_tfidf = time.perf_counter() - t0
+t0 = time.perf_counter(); p_bert = bert_proba(tok, bert, texts, args.batch_size); t_bert = time.perf_counter() - t0
+n = len(texts)
+cost_cheap, cost_bert = (t_rules + t_tfidf)/n, t_bert/n   # seconds per review
+
+blend_pair, blend_triple = load_blend("pair"), load_blend("triple")
+p_rules  = onehot_ids(lbl_rules)
+p_cheap  = blend_pair(tfidf=p_tfidf, rules=p_rules)
+p_triple = blend_triple(bert=p_bert, tfidf=p_tfidf, rules=p_rules)
+f1_triple = f1_score(y, p_triple.argmax(axis=1), average="macro", zero_division=0)
+target = args.target_f1 if args.target_f1 is not None else f1_triple - 0.005
+
+rows = []
+for th in np.round(np.arange(0.15, 1.001, 0.025), 3):
+    esc = cascade_escalate(p_cheap, p_tfidf, lbl_rules, th)
+    pred = np.where(esc, p_triple.argmax(axis=1), p_cheap.argmax(axis=1))
+    rows.append({"threshold": float(th), "escalation_rate": float(esc.mean()),
+                 "macro_f1": f1_score(y, pred, average="macro", zero_division=0),
+                 "ms_per_review": 1000*(cost_cheap + esc.mean()*cost_bert)})
+curve = pd.DataFrame(rows)
+
+# cheapest threshold that hits the target; otherwise the best F1 we saw
+ok = curve[curve["macro_f1"] >= target]
+pick = ok.sort_values(["escalation_rate", "threshold"]).iloc[0] if len(ok) else curve.sort_values("macro_f1").iloc[-1]
+th = float(pick["threshold"])
+
+esc = cascade_escalate(p_cheap, p_tfidf, lbl_rules, th)
+pred = np.where(esc, p_triple.argmax(axis=1), p_cheap.argmax(axis=1))
+pd.DataFrame({"id": test["id"], "text": test["text"], "label": test["label"], "pred": pred,
+              "escalated": esc}).to_csv(OUT/"preds"/"cascade_test.csv", index=False)
+
+CASCADE_CFG.write_text(json.dumps({"threshold": th, "target_macro_f1": target,
+                                   "blend_version": blend_pair.version}, indent=2))
+report = {
+    "threshold": th,
+    "target_macro_f1": target,
+    "target_met": bool(len(ok)),
+    "macro_f1": float(pick["macro_f1"]),
+    "macro_f1_triple": float(f1_triple),
+    "escalation_rate": float(pick["escalation_rate"]),
+    "ms_per_review_cascade": float(pick["ms_per_review"]),
+    "ms_per_review_triple": 1000*(cost_cheap + cost_bert),
+    "curve": curve.to_dict(orient="records"),
+}
+(OUT/"metrics"/"cascade.json").write_text(json.dumps(report, indent=2))
+
+print(f"[cascade] threshold={th:.3f}  escalation={report['escalation_rate']:.1%}  "
+      f"macro-F1={report['macro_f1']:.3f} (triple {f1_triple:.3f}, target {target:.3f})")
+print(f"[cascade] cost/review: {report['ms_per_review_cascade']:.2f}ms vs {report['ms_per_review_triple']:.2f}ms always-BERT")
+print(f"[cascade] saved threshold -> {CASCADE_CFG}")
@@ -0,0 +1,105 @@
+import sys, json, hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.metrics import f1_score
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import (TFIDF_MODEL, STACK_MODEL, NUM_ALL, DEFAULT_BLENDS, HOLDOUT_IDS, Blend, rule_ids,
+                       onehot_ids, expand_proba_matrix, tfidf_proba, load_bert, bert_proba)
+from src.feature_store import default_store
+from src.demo_infer import ADS, NOV, IRR   # the rule patterns src/app.py serves (NOV is wider than utils')
+
+PROC = Path("data/processed")
+OUT  = Path("outputs"); (OUT/"metrics").mkdir(parents=True, exist_ok=True)
+STACK_MODEL.parent.mkdir(parents=True, exist_ok=True)
+FOLDS = 5
+
+train = pd.read_csv(PROC/"train.csv")
+test  = pd.read_csv(PROC/"test.csv")
+y_tr, y_te = train["label"].astype(int).to_numpy(), test["label"].astype(int).to_numpy()
+tfidf = joblib.load(TFIDF_MODEL)
+cv = StratifiedKFold(n_splits=FOLDS, shuffle=True, random_state=42)
+
+def macro_f1(y, p): return f1_score(y, p.argmax(axis=1), average="macro", zero_division=0)
+
+def rules(texts): return onehot_ids(rule_ids(texts, ADS, NOV, IRR))
+
+def fit_meta(F, y):
+    """multinomial LR on the stacked probabilities -> Blend (W, b, softmax)"""
+    meta = LogisticRegression(max_iter=2000, class_weight="balanced").fit(F, y)
+    W = np.zeros((F.shape[1], NUM_ALL)); b = np.full(NUM_ALL, -1e9)   # unseen classes never win
+    W[:, meta.classes_] = meta.coef_.T; b[meta.classes_] = meta.intercept_
+    return W, b
+
+def meta_oof(F, y):
+    """out-of-fold predictions of the meta-learner itself, for an honest score"""
+    return expand_proba_matrix(cross_val_predict(LogisticRegression(max_iter=2000, class_weight="balanced"),
+                                                 F, y, cv=cv, method="predict_proba"), np.unique(y))
+
+# 1) pair: out-of-fold TF-IDF probabilities on train.csv + rule indicators
+texts_tr = train["text"].astype(str).tolist()
+oof_raw = cross_val_predict(clone(tfidf), texts_tr, y_tr, cv=cv, method="predict_proba")
+feats_tr = {"tfidf": expand_proba_matrix(oof_raw, np.unique(y_tr)), "rules": rules(texts_tr)}
+store = default_store()
+feats_te = {"tfidf": tfidf_proba(tfidf, test["text"], store=store), "rules": rules(test["text"])}
+
+inputs = DEFAULT_BLENDS["pair"]["inputs"]
+F_tr = np.hstack([feats_tr[k] for k in inputs])
+W, b = fit_meta(F_tr, y_tr)
+stacked = {"pair": Blend(inputs, W, b, softmax=True)}
+fixed = Blend.from_weights(**DEFAULT_BLENDS["pair"])
+report = {"pair": {
+    "fit_on": "train.csv (out-of-fold tfidf)",
+    "oof_macro_f1_fixed":   macro_f1(y_tr, fixed(**feats_tr)),
+    "oof_macro_f1_stacked": macro_f1(y_tr, meta_oof(F_tr, y_tr)),
+    "test_macro_f1_fixed":   macro_f1(y_te, fixed(**feats_te)),
+    "test_macro_f1_stacked": macro_f1(y_te, stacked["pair"](**feats_te)),
+}}
+
+# 2) triple: fit on the holdout of train.csv that 04_train_distilbert.py left out
+#    (DistilBERT probs on it are out-of-sample, TF-IDF's are the out-of-fold ones above);
+#    test.csv is only scored
+tok, bert = load_bert()
+if bert is None:
+    print("[stack] models/distilbert not found; triple blend keeps the default weights")
+elif not HOLDOUT_IDS.exists():
+    print(f"[stack] {HOLDOUT_IDS} not found (DistilBERT trained on all of train.csv); "
+          "triple blend keeps the default weights. Re-run 04_train_distilbert.py without --no-holdout.")
+else:
+    hold = train["id"].astype(str).isin(json.loads(HOLDOUT_IDS.read_text())).to_numpy()
+    texts_ho, y_ho = train.loc[hold, "text"].astype(str).tolist(), y_tr[hold]
+    feats_ho = {"tfidf": feats_tr["tfidf"][hold], "rules": feats_tr["rules"][hold],
+                "bert": bert_proba(tok, bert, texts_ho, store=store)}
+    feats_te["bert"] = bert_proba(tok, bert, test["text"], store=store)
+    inputs = DEFAULT_BLENDS["triple"]["inputs"]
+    F_ho = np.hstack([feats_ho[k] for k in inputs])
+    W, b = fit_meta(F_ho, y_ho)
+    stacked["triple"] = Blend(inputs, W, b, softmax=True)
+    fixed = Blend.from_weights(**DEFAULT_BLENDS["triple"])
+    report["triple"] = {
+        "fit_on": f"train.csv holdout ({int(hold.sum())} rows, unseen by distilbert)",
+        "cv_macro_f1_fixed":     macro_f1(y_ho, fixed(**feats_ho)),
+        "cv_macro_f1_stacked":   macro_f1(y_ho, meta_oof(F_ho, y_ho)),
+        "test_macro_f1_fixed":   macro_f1(y_te, fixed(**feats_te)),
+        "test_macro_f1_stacked": macro_f1(y_te, stacked["triple"](**feats_te)),
+    }
+
+# 3) versioned artifact
+prev = json.loads(STACK_MODEL.read_text())["version"] if STACK_MODEL.exists() else 0
+artifact = {
+    "version": prev + 1,
+    "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    "train_sha1": hashlib.sha1((PROC/"train.csv").read_bytes()).hexdigest(),
+    "blends": {k: v.to_dict() for k, v in stacked.items()},
+}
+STACK_MODEL.write_text(json.dumps(artifact, indent=2))
+(STACK_MODEL.parent/f"blend_v{artifact['version']}.json").write_text(json.dumps(artifact, indent=2))
+(OUT/"metrics"/"stacking.json").write_text(json.dumps({"version": artifact["version"], **report}, indent=2))
+
+for kind, r in report.items():
+    print(f"[stack] {kind}: " + "  ".join(f"{k}={v:.3f}" for k, v in r.items() if k != "fit_on"))
+print(f"[stack] saved blend v{artifact['version']} -> {STACK_MODEL}")
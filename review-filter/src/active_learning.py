@@ -0,0 +1,80 @@
+import argparse, sys
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+from sklearn.cluster import MiniBatchKMeans
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import TFIDF_MODEL, load_blend, rule_ids, onehot_ids, tfidf_proba, load_bert, bert_proba
+from src.feature_store import default_store
+
+
+def uncertainty(P, method="margin"):
+    """higher = less sure. margin: 1 - (p_top1 - p_top2); entropy: -sum p log p"""
+    if method == "entropy":
+        return -(P * np.log(np.clip(P, 1e-12, 1.0))).sum(axis=1)
+    top2 = np.partition(P, -2, axis=1)[:, -2:]
+    return 1.0 - (top2[:, 1] - top2[:, 0])
+
+
+def sample_to_label(csv_path, n=400, method="margin", text_col="text", pool_factor=10,
+                    chunksize=100_000, use_bert=False, seed=42, store=None):
+    """Stream csv_path in chunks, keep the pool_factor*n most uncertain rows, then
+    cluster that pool (mini-batch k-means on TF-IDF) and take the most uncertain row
+    per cluster. Memory is bounded by chunksize + pool, not by the file size.
+    store: optional src.feature_store.FeatureStore for TF-IDF rows / token ids."""
+    clf = joblib.load(TFIDF_MODEL)
+    tok, bert = load_bert() if use_bert else (None, None)
+    blend = load_blend("triple" if bert is not None else "pair")
+    pool_size = pool_factor * n
+
+    pool = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        texts = chunk[text_col].astype(str)
+        feats = {"tfidf": tfidf_proba(clf, texts, store=store), "rules": onehot_ids(rule_ids(texts))}
+        if bert is not None:
+            feats["bert"] = bert_proba(tok, bert, texts, store=store)
+        chunk = chunk[["id", text_col]].assign(uncertainty=uncertainty(blend(**feats), method))
+        pool = chunk.reset_index(drop=True) if pool is None else pd.concat([pool, chunk], ignore_index=True)
+        if len(pool) > pool_size:
+            keep = np.argpartition(-pool["uncertainty"].to_numpy(dtype=float), pool_size)[:pool_size]
+            pool = pool.iloc[keep].reset_index(drop=True)
+
+    if pool is None:
+        return pd.DataFrame(columns=["id", text_col, "uncertainty"])
+    if len(pool) <= n:
+        return pool.sort_values("uncertainty", ascending=False).reset_index(drop=True)
+
+    # diversity: one pick per cluster, most uncertain first; top up from the rest if clusters collapse
+    vec = clf.named_steps["tfidf"]
+    X = store.tfidf(vec, pool[text_col]) if store is not None else vec.transform(pool[text_col].astype(str))
+    km = MiniBatchKMeans(n_clusters=n, batch_size=1024, n_init=3, random_state=seed).fit(X)
+    pool["cluster"] = km.labels_
+    pool = pool.sort_values("uncertainty", ascending=False)
+    picks = pool.drop_duplicates("cluster")
+    if len(picks) < n:
+        picks = pd.concat([picks, pool.drop(picks.index).head(n - len(picks))])
+    return picks.drop(columns="cluster").head(n).reset_index(drop=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", default="data/processed/unlabeled.csv")
+    ap.add_argument("--out", default="data/processed/to_label.csv")
+    ap.add_argument("-n", type=int, default=400)
+    ap.add_argument("--method", choices=["margin", "entropy"], default="margin")
+    ap.add_argument("--text-col", default="text")
+    ap.add_argument("--pool-factor", type=int, default=10)
+    ap.add_argument("--chunksize", type=int, default=100_000)
+    ap.add_argument("--bert", action="store_true", help="also score with models/distilbert")
+    args = ap.parse_args()
+
+    samp = sample_to_label(args.input, args.n, args.method, args.text_col, args.pool_factor,
+                           args.chunksize, args.bert, store=default_store())
+    samp = samp[["id", args.text_col]].copy()
+    samp["label"] = ""
+    samp.to_csv(args.out, index=False, encoding="utf-8")
+    print(f"[active] wrote {len(samp)} rows -> {args.out} (method={args.method})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
-from fastapi import FastAPI
+from typing import List, Literal, Optional
+from collections import OrderedDict
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 import joblib
+import json
 import os
+import pstats
+import time
 import numpy as np
 
-from src.demo_infer import rule_id, LABELS, expand_proba, onehot
+from src.demo_infer import rule_id, LABELS, expand_proba, onehot, ADS, NOV, IRR
+from src.utils import (STUDENT_MODEL, CASCADE_CFG, BERT_WINDOWS, Prediction, rule_id_budgeted, rule_ids, onehot_ids,
+                       expand_proba_matrix, load_bert, bert_proba, cascade_escalate, load_blend)
+from src.similarity import SimilarityIndex, SIMILARITY_INDEX
+from src.shared_models import BertClient, load_pipeline
+from src import metrics, profiling, transport
+from src.metrics import timed
 
 app = FastAPI()
 
@@ -18,33 +31,310 @@ app.add_middleware(
 )
 
 MODEL_PATH = os.path.join("models", "tfidf_lr", "model.joblib")
-clf = joblib.load(MODEL_PATH)
-classes = clf.named_steps["clf"].classes_
+
+# shared mode (src/serve.py): weights memory-mapped from SHARED_MODELS and DistilBERT in a
+# single inference process at BERT_WORKER, instead of a private copy per worker
+SHARED_MODELS = os.environ.get("SHARED_MODELS")
+if SHARED_MODELS:
+    vectorizer, lr = load_pipeline(os.path.join(SHARED_MODELS, "tfidf_lr"))
+else:
+    clf = joblib.load(MODEL_PATH)
+    vectorizer, lr = clf.named_steps["tfidf"], clf.named_steps["clf"]
+classes = lr.classes_
 NUM_ALL = len(LABELS)
 
+# blend weights (models/stacking/blend.json from src/11_stack.py, else the fixed 0.6/0.4 & 0.5/0.3/0.2)
+blend_pair, blend_triple = load_blend("pair"), load_blend("triple")
+
+# distilled student (src/09_distill_student.py), optional
+if SHARED_MODELS and os.path.exists(os.path.join(SHARED_MODELS, "student", "meta.json")):
+    student = load_pipeline(os.path.join(SHARED_MODELS, "student"))
+else:
+    student = joblib.load(STUDENT_MODEL) if STUDENT_MODEL.exists() else None
+student_classes = student.named_steps["clf"].classes_ if student is not None else None
+
+# cascade (src/10_cascade.py): DistilBERT is only loaded on the first escalation.
+# The threshold was tuned on one blend: a newer models/stacking/blend.json invalidates it.
+cascade_threshold, cascade_error = None, "Cascade threshold missing. Run src/10_cascade.py first."
+if CASCADE_CFG.exists():
+    cascade_cfg = json.loads(CASCADE_CFG.read_text())
+    if cascade_cfg.get("blend_version", 0) == blend_pair.version:
+        cascade_threshold = cascade_cfg["threshold"]
+    else:
+        cascade_error = (f"{CASCADE_CFG} was tuned on blend v{cascade_cfg.get('blend_version', 0)} but blend "
+                         f"v{blend_pair.version} is loaded. Re-run src/10_cascade.py.")
+        print(f"[app] cascade mode disabled: {cascade_error}")
+bert = None
+
+def get_bert():
+    global bert
+    if bert is None:
+        tok, mdl = load_bert()
+        if mdl is None:
+            raise HTTPException(status_code=503, detail="DistilBERT missing. Run src/04_train_distilbert.py first.")
+        bert = (tok, mdl)
+    return bert
+
+bert_client = BertClient.from_env()
+
+def bert_probs(texts):
+    if bert_client is None:
+        if SHARED_MODELS:   # never a DistilBERT per worker in shared mode (src/serve.py --no-bert)
+            raise HTTPException(status_code=503, detail="No DistilBERT worker. Start src/serve.py without --no-bert.")
+        return bert_proba(*get_bert(), texts, timer=timed, **BERT_WINDOWS)
+    with timed("bert_worker"):
+        try:
+            return bert_client(texts)
+        except RuntimeError as e:   # worker error or lost connection (BertClient reconnects next call)
+            raise HTTPException(status_code=503, detail=str(e))
+
+# "similar reviews" index (src/similarity.py), loaded on the first /similar/ call
+similar_index = None
+
+def get_similarity():
+    global similar_index
+    if similar_index is None:
+        if not SIMILARITY_INDEX.exists():
+            raise HTTPException(status_code=503, detail="Similarity index missing. Run src/similarity.py build first.")
+        # shared mode maps the index arrays read-only, so workers share the pages too
+        similar_index = SimilarityIndex.load(vectorizer, SIMILARITY_INDEX, mmap_mode="r" if SHARED_MODELS else None)
+    return similar_index
+
+RULE_PATTERNS = {1: "ads", 2: "irrelevant", 3: "no_visit"}
+
+# untrusted input guard for the rules (src/rule_audit.py times the patterns):
+# RULE_MAX_CHARS scans only head+tail of longer texts, RULE_BUDGET_MS makes the rules
+# abstain once a request (all texts of a batch together) has spent that long in them. 0 = off.
+# The budget is checked between scan windows, so it bounds linear-time patterns only.
+RULE_MAX_CHARS = int(os.environ.get("RULE_MAX_CHARS", "0"))
+RULE_BUDGET_MS = float(os.environ.get("RULE_BUDGET_MS", "0"))
+RULES = [(1, ADS), (3, NOV), (2, IRR)]
+
+# most reviews one /predict/batch request may carry
+BATCH_MAX = int(os.environ.get("PREDICT_BATCH_MAX", "10000"))
+
+# optional LRU of recent results; duplicate texts (spam campaigns, retries) skip the models.
+# Off by default: hits bypass the rule guard and profiling and would skew the latency histograms.
+CACHE_SIZE = int(os.environ.get("PREDICT_CACHE_SIZE", "0"))
+cache = OrderedDict()
+
 class ReviewRequest(BaseModel):
     text: str
+    mode: Literal["ensemble", "student", "cascade"] = "ensemble"
 
-@app.post("/predict/")
-async def predict(request: ReviewRequest):
-    text = request.text
+class SimilarRequest(BaseModel):
+    text: Optional[str] = None   # free text, or
+    id: Optional[str] = None     # an indexed review
+    k: int = 10
+    min_score: float = 0.0
+
+class NewReview(BaseModel):
+    id: str
+    text: str
+    label: Optional[int] = None  # scored with the ensemble when missing
+
+class AddReviewsRequest(BaseModel):
+    reviews: List[NewReview]
+    persist: bool = False
+
+def classify(text, mode="ensemble"):
+    """-> (label_id, final proba). Shared by every transport."""
+    if mode == "student":
+        if student is None:
+            raise HTTPException(status_code=503, detail="Student model missing. Run src/09_distill_student.py first.")
+        with timed("student"):
+            p_student = expand_proba(student.predict_proba([text])[0], student_classes)
+        return int(np.argmax(p_student)), p_student
 
     # 1. Rules
-    rule_lbl = rule_id(text)
-    p_rules = onehot(rule_lbl)
-    
+    with timed("rules"):
+        if RULE_MAX_CHARS or RULE_BUDGET_MS:
+            rule_lbl, cut = rule_id_budgeted(text, RULES, RULE_MAX_CHARS, RULE_BUDGET_MS / 1000)
+            if cut is not None:
+                metrics.RULE_CUTS.inc(reason=cut)
+        else:
+            rule_lbl = rule_id(text)
+        p_rules = onehot(rule_lbl)
+    if rule_lbl is not None:
+        metrics.RULE_HITS.inc(pattern=RULE_PATTERNS[rule_lbl])
+
     # 2. Model proba
-    p_tfidf_raw = clf.predict_proba([text])[0]
-    p_tfidf = expand_proba(p_tfidf_raw, classes)
-    
+    with timed("tfidf_vectorize"):
+        X = vectorizer.transform([text])
+    with timed("lr"):
+        p_tfidf = expand_proba(lr.predict_proba(X)[0], classes)
+
     # 3. Weighted ensemble (reuse your CLI logic)
-    p_final = 0.6 * p_tfidf + 0.4 * p_rules
+    with timed("blend"):
+        p_final = blend_pair(tfidf=p_tfidf, rules=p_rules)[0]
     pred_final = int(np.argmax(p_final))
 
-    # Optionally, output model and rule results for debugging
-    # print(f"text: {text}, rule: {rule_lbl}, model: {p_tfidf}, final: {p_final}, pred_final: {pred_final}")
-    
-    return {
-        "label_id": pred_final,
-        "label": LABELS.get(pred_final, "UNKNOWN")
-    }
+    # 4. Cascade: escalate to the triple blend only when tfidf+rules is unsure
+    if mode == "cascade":
+        if cascade_threshold is None:
+            raise HTTPException(status_code=503, detail=cascade_error)
+        lbl = np.array([-1 if rule_lbl is None else rule_lbl])
+        escalate = cascade_escalate(p_final[None, :], p_tfidf[None, :], lbl, cascade_threshold)
+        if escalate[0]:
+            metrics.BATCH_SIZE.observe(1, stage="bert")
+            p_bert = bert_probs([text])
+            p_final = blend_triple(bert=p_bert, tfidf=p_tfidf, rules=p_rules)[0]
+            pred_final = int(np.argmax(p_final))
+
+    return pred_final, p_final
+
+def rule_labels(texts):
+    """rule class per text, -1 where none fires (same patterns and guard as classify).
+    RULE_BUDGET_MS is one budget for the whole batch: texts after it runs out get no rule."""
+    if not (RULE_MAX_CHARS or RULE_BUDGET_MS):
+        return rule_ids(texts, ADS, NOV, IRR)
+    out = np.full(len(texts), -1)
+    deadline = time.perf_counter() + RULE_BUDGET_MS / 1000 if RULE_BUDGET_MS else None
+    for i, text in enumerate(texts):
+        lbl, cut = rule_id_budgeted(text, RULES, RULE_MAX_CHARS, deadline=deadline)
+        if cut is not None:
+            metrics.RULE_CUTS.inc(reason=cut)
+        if lbl is not None:
+            out[i] = lbl
+    return out
+
+def classify_batch(texts, mode="ensemble"):
+    """classify for a list of texts, one model call per stage -> (pred uint8 [n], proba float32 [n, 4])"""
+    if mode == "student":
+        if student is None:
+            raise HTTPException(status_code=503, detail="Student model missing. Run src/09_distill_student.py first.")
+        with timed("student"):
+            p_final = expand_proba_matrix(student.predict_proba(texts), student_classes, dtype=np.float32)
+        return p_final.argmax(axis=1).astype(np.uint8), p_final
+
+    with timed("rules"):
+        rule_lbls = rule_labels(texts)
+        p_rules = onehot_ids(rule_lbls, dtype=np.float32)
+    for lbl, n in zip(*np.unique(rule_lbls[rule_lbls >= 0], return_counts=True)):
+        metrics.RULE_HITS.inc(int(n), pattern=RULE_PATTERNS[int(lbl)])
+
+    with timed("tfidf_vectorize"):
+        X = vectorizer.transform(texts)
+    with timed("lr"):
+        p_tfidf = expand_proba_matrix(lr.predict_proba(X), classes, dtype=np.float32)
+    with timed("blend"):
+        p_final = blend_pair(tfidf=p_tfidf, rules=p_rules)
+
+    if mode == "cascade":
+        if cascade_threshold is None:
+            raise HTTPException(status_code=503, detail=cascade_error)
+        esc = np.flatnonzero(cascade_escalate(p_final, p_tfidf, rule_lbls, cascade_threshold))
+        if len(esc):
+            metrics.BATCH_SIZE.observe(len(esc), stage="bert")
+            p_bert = bert_probs([texts[i] for i in esc])
+            p_final[esc] = blend_triple(bert=p_bert.astype(np.float32), tfidf=p_tfidf[esc], rules=p_rules[esc])
+
+    return p_final.argmax(axis=1).astype(np.uint8), p_final
+
+@app.post("/predict/")
+async def predict(request: ReviewRequest, profile: bool = False):
+    key = (request.mode, request.text)
+    prof = None
+    if CACHE_SIZE and key in cache:
+        cache.move_to_end(key)
+        result = cache[key]
+        metrics.CACHE.inc(result="hit")
+    else:
+        if CACHE_SIZE:
+            metrics.CACHE.inc(result="miss")
+        # off the event loop: a cascade escalation is a DistilBERT forward pass
+        result, prof = await run_in_threadpool(classify_profiled, request.text, request.mode, profile)
+        if CACHE_SIZE:
+            cache[key] = result
+            if len(cache) > CACHE_SIZE:
+                cache.popitem(last=False)
+
+    metrics.BATCH_SIZE.observe(1, stage="request")
+    metrics.PREDICTIONS.inc(label=result.label, mode=request.mode)
+    out = result.to_dict()
+    if profile and prof is not None and prof.capture_id is not None:
+        out["profile_id"] = prof.capture_id
+    return out
+
+def classify_profiled(text, mode, profile=False):
+    """classify under the request profiler -> (Prediction, capture). cProfile only sees its
+    own thread, so the whole capture runs in the threadpool."""
+    # profile=true forces a cProfile capture of this request (only when PROFILING=1)
+    with profiling.request(text, mode, force=profile) as prof:
+        with timed("total"):
+            pred_final, p_final = classify(text, mode)
+    return Prediction(pred_final, p_final[pred_final]), prof
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request, mode: Literal["ensemble", "student", "cascade"] = "ensemble", proba: bool = False):
+    # body and response in the request's Content-Type: msgpack, Arrow IPC stream or JSON (src/transport.py)
+    media = transport.media_type(request.headers.get("content-type"))
+    if media is None:
+        raise HTTPException(status_code=415, detail=f"Send {transport.MSGPACK}, {transport.ARROW} or {transport.JSON}.")
+    if not transport.available(media):
+        raise HTTPException(status_code=415, detail=f"{media} needs {transport.REQUIRES[media]} on the server.")
+    try:
+        texts, ids = transport.decode_request(media, await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if len(texts) > BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX} reviews per batch.")
+    # scoring a batch takes long enough to stall every other request on the event loop
+    body = await run_in_threadpool(score_batch, media, texts, ids, mode, proba)
+    return Response(body, media_type=media)
+
+def score_batch(media, texts, ids, mode, proba):
+    """classify_batch + metrics + encoded response body (runs in the threadpool)"""
+    with timed("batch_total"):
+        pred, p_final = classify_batch(texts, mode) if texts else (np.zeros(0, np.uint8), np.zeros((0, NUM_ALL), np.float32))
+    metrics.BATCH_SIZE.observe(len(texts), stage="request")
+    for lbl, n in zip(*np.unique(pred, return_counts=True)):
+        metrics.PREDICTIONS.inc(int(n), label=LABELS[int(lbl)], mode=mode)
+    return transport.encode_response(media, pred, p_final, ids, proba)
+
+@app.post("/similar/")
+async def similar(request: SimilarRequest):
+    # min_score around 0.8 lists near-duplicates, i.e. the rest of a spam campaign
+    if request.text is None and request.id is None:
+        raise HTTPException(status_code=422, detail="Give a text or the id of an indexed review.")
+    idx = get_similarity()
+    with timed("similar"):
+        try:
+            hits = idx.search(request.text, request.id, max(1, min(request.k, 100)), request.min_score)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return {"neighbours": hits}
+
+@app.post("/similar/reviews")
+async def add_similar(request: AddReviewsRequest):
+    # inserts land in this worker's index only and persist writes this worker's copy over the file,
+    # so they need a single-worker server; with shared multi-worker serving use `similarity.py add`
+    if SHARED_MODELS:
+        raise HTTPException(status_code=409, detail="Inserts need a single-worker server; "
+                                                    "use python src/similarity.py add <csv> instead.")
+    idx = get_similarity()
+    labels = await run_in_threadpool(lambda: [r.label if r.label is not None else classify(r.text)[0]
+                                              for r in request.reviews])
+    added = idx.add([r.id for r in request.reviews], [r.text for r in request.reviews], labels)
+    if request.persist:
+        idx.save(SIMILARITY_INDEX)
+    return {"added": added, "indexed": len(idx)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profiles")
+async def debug_profiles():
+    if not profiling.ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is off. Start the server with PROFILING=1.")
+    return profiling.list_captures()
+
+@app.get("/debug/profiles/{capture_id}")
+async def debug_profile(capture_id: int, sort: pstats.SortKey = pstats.SortKey.CUMULATIVE, limit: int = 40):
+    if not profiling.ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is off. Start the server with PROFILING=1.")
+    capture = profiling.get_capture(capture_id, sort, limit)
+    if capture is None:
+        raise HTTPException(status_code=404, detail=f"No capture {capture_id} (only the last {profiling.KEEP} are kept).")
+    return capture
@@ -0,0 +1,200 @@
+import argparse, asyncio, contextlib, io, json, os, platform, resource, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import (TFIDF_MODEL, load_blend, rule_ids, onehot_ids, expand_proba_matrix,
+                       load_bert, bert_proba, score_csv)
+from src.demo_infer import rule_id   # the rule path /predict/ serves (its wider NOV, one plain string)
+
+RAW = Path("data/raw/reviews.csv")
+OUT = Path("outputs/metrics"); OUT.mkdir(parents=True, exist_ok=True)
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def synthetic_corpus(n, seed=0, source=RAW):
+    """n reviews built from the raw corpus: each is 1-3 sentences drawn from random
+    reviews, so lengths and vocabulary match production but rows aren't duplicates."""
+    rng = np.random.default_rng(seed)
+    sents = (pd.read_csv(source)["text"].dropna().astype(str)
+             .str.split(r"(?<=[.!?])\s+", regex=True).explode().str.strip())
+    sents = sents[sents.str.len() > 0].to_numpy()
+    k = rng.integers(1, 4, size=n)
+    picks = sents[rng.integers(0, len(sents), size=k.sum())]
+    bounds = np.concatenate([[0], np.cumsum(k)])
+    return [" ".join(picks[bounds[i]:bounds[i+1]]) for i in range(n)]
+
+
+def latency_stats(seconds, rows=None):
+    """seconds: per-call wall times. rows: items processed in total (defaults to one per call)."""
+    s = np.asarray(seconds, dtype=float)
+    ms = 1000 * s
+    return {
+        "calls": int(len(s)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "throughput_per_s": float((rows if rows is not None else len(s)) / s.sum()),
+    }
+
+
+def time_calls(fn, items):
+    out = []
+    for x in items:
+        t0 = time.perf_counter(); fn(x); out.append(time.perf_counter() - t0)
+    return out
+
+
+def time_batches(fn, texts, batch_size):
+    return time_calls(fn, [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)])
+
+
+def bench_endpoint(texts):
+    """/predict/ through an in-process ASGI client (no sockets, no server)."""
+    import httpx
+    os.environ.setdefault("PREDICT_CACHE_SIZE", "0")  # measure the models, not the result cache
+    with contextlib.redirect_stdout(io.StringIO()):   # demo_infer.rule_id prints per call
+        from src.app import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            out = []
+            for t in texts:
+                t0 = time.perf_counter()
+                r = await client.post("/predict/", json={"text": t})
+                out.append(time.perf_counter() - t0)
+                r.raise_for_status()
+            return out
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(run())
+
+
+def memory_job(variant, csv_path, out_path):
+    """One bulk scoring job over csv_path. Run it in a fresh process (see bench_memory)
+    so ru_maxrss is the job's own peak."""
+    t0 = time.perf_counter()
+    clf = joblib.load(TFIDF_MODEL)
+    if variant == "legacy":
+        # the old 06_ensemble path: whole file in memory, float64 per-row np.vstack,
+        # text copied into the output frame
+        df = pd.read_csv(csv_path)
+        texts = df["text"].astype(str).tolist()
+        classes = clf.named_steps["clf"].classes_
+        P = np.vstack([expand_proba_matrix(p[None, :], classes)[0] for p in clf.predict_proba(texts)])
+        R = np.vstack([onehot_ids([r])[0] for r in rule_ids(texts)])
+        pred = load_blend("pair")(tfidf=P, rules=R).argmax(axis=1)
+        pd.DataFrame({"id": df["id"], "text": df["text"], "pred": pred}).to_csv(out_path, index=False)
+    else:
+        # streamed chunks, float32 probabilities, uint8 labels, id-only output
+        ids, pred, proba = score_csv(clf, csv_path)
+        pd.DataFrame({"id": ids, "pred": pred}).to_csv(out_path, index=False)
+    return {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "seconds": time.perf_counter() - t0}
+
+
+def bench_memory(rows, variants=("compact", "legacy")):
+    """Peak RSS of a rows-sized scoring job per variant, each in its own process."""
+    out = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp)/"corpus.csv"
+        for s in range(0, rows, 500_000):
+            n = min(500_000, rows - s)
+            pd.DataFrame({"id": np.arange(s, s + n), "text": synthetic_corpus(n, seed=s)}).to_csv(
+                src, mode="a", header=(s == 0), index=False)
+        for v in variants:
+            p = subprocess.run([sys.executable, "-W", "ignore", __file__, "--memory-job", v, str(src), str(Path(tmp)/"out.csv")],
+                               capture_output=True, text=True)
+            if p.returncode == 0:
+                out[v] = json.loads(p.stdout.strip().splitlines()[-1])
+            else:   # -9: killed by the OOM killer
+                out[v] = {"failed": p.returncode, "stderr": p.stderr.strip().splitlines()[-1:]}
+            print(f"[bench] memory {v:<8} {rows:,} rows: {out[v]}")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    ap.add_argument("--latency-sample", type=int, default=2000, help="single-review calls per stage")
+    ap.add_argument("--bulk-chunk", type=int, default=50_000)
+    ap.add_argument("--bert-rows", type=int, default=512)
+    ap.add_argument("--bert-batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    ap.add_argument("--out", default=str(OUT/"benchmark.json"))
+    ap.add_argument("--memory-rows", type=int, default=None,
+                    help="instead of the latency suite, compare peak RSS of compact vs legacy bulk scoring "
+                         "on this many rows (-> outputs/metrics/benchmark_memory.json)")
+    ap.add_argument("--memory-job", nargs=3, metavar=("VARIANT", "CSV", "OUT"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.memory_job:
+        print(json.dumps(memory_job(*args.memory_job)))
+        return
+    if args.memory_rows:
+        out = OUT/"benchmark_memory.json"
+        out.write_text(json.dumps(bench_memory(args.memory_rows), indent=2))
+        print(f"[bench] wrote -> {out}")
+        return
+
+    clf = joblib.load(TFIDF_MODEL)
+    vec, lr = clf.named_steps["tfidf"], clf.named_steps["clf"]
+    blend = load_blend("pair")
+    tok, bert = load_bert()
+
+    def bulk_score(texts):
+        P = expand_proba_matrix(lr.predict_proba(vec.transform(texts)), lr.classes_)
+        return blend(tfidf=P, rules=onehot_ids(rule_ids(texts))).argmax(axis=1)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    results = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpora": {},
+    }
+
+    for name in args.sizes:
+        n = SIZES[name]
+        texts = synthetic_corpus(n, seed=n)
+        sample = texts[:args.latency_sample]
+        r = {"rows": n, "mean_chars": float(np.mean([len(t) for t in texts]))}
+        print(f"[bench] corpus {name}: {n:,} rows")
+
+        # per-review latency (one call per review)
+        with contextlib.redirect_stdout(io.StringIO()):   # rule_id prints per call
+            r["rules"] = latency_stats(time_calls(rule_id, sample))
+        r["tfidf_transform"] = latency_stats(time_calls(lambda t: vec.transform([t]), sample))
+        X1 = [vec.transform([t]) for t in sample]
+        r["lr_predict_proba"] = latency_stats(time_calls(lr.predict_proba, X1))
+        r["predict_endpoint"] = latency_stats(bench_endpoint(sample))
+
+        # bulk scoring: the whole corpus through rules + tfidf + blend, chunk by chunk
+        r["bulk_score"] = latency_stats(time_batches(bulk_score, texts, args.bulk_chunk), rows=n)
+
+        if bert is not None:
+            bt = texts[:args.bert_rows]
+            r["distilbert"] = {f"bs{bs}": latency_stats(time_batches(lambda b: bert_proba(tok, bert, b, bs), bt, bs),
+                                                        rows=len(bt))
+                               for bs in args.bert_batch_sizes}
+
+        for stage, st in r.items():
+            if isinstance(st, dict) and "p50_ms" in st:
+                print(f"  {stage:<18} p50={st['p50_ms']:8.3f}ms  p95={st['p95_ms']:8.3f}ms  "
+                      f"p99={st['p99_ms']:8.3f}ms  {st['throughput_per_s']:>12,.0f}/s")
+        results["corpora"][name] = r
+
+    if bert is None:
+        results["distilbert"] = "skipped: models/distilbert not found"
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    print(f"[bench] wrote -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
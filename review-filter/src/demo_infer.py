@@ -1,5 +1,9 @@
-import argparse, joblib, re
+import argparse, joblib, re, sys
 import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import load_blend
 
 
 LABELS = {0:"valid", 1:"advertisement", 2:"irrelevant", 3:"rant_no_visit"}
@@ -53,9 +57,16 @@ def onehot(label):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--text", required=True)
-    parser.add_argument("--model", choices=["tfidf_lr","ensemble"], default="ensemble")
+    parser.add_argument("--model", choices=["tfidf_lr","ensemble","student"], default="ensemble")
     args = parser.parse_args()
 
+    if args.model == "student":
+        student = joblib.load("models/student/model.joblib")
+        p_student = expand_proba(student.predict_proba([args.text])[0], student.named_steps["clf"].classes_)
+        pred = int(np.argmax(p_student))
+        print(pred, LABELS.get(pred,"UNKNOWN"))
+        return
+
     clf = joblib.load("models/tfidf_lr/model.joblib")
     # Assuming pipeline has 'clf' step with attribute classes_
     classes = clf.named_steps["clf"].classes_
@@ -70,7 +81,7 @@ def main():
 
     rule_lbl = rule_id(args.text)
     p_rules = onehot(rule_lbl)
-    p_final = 0.6 * p_tfidf + 0.4 * p_rules
+    p_final = load_blend("pair")(tfidf=p_tfidf, rules=p_rules)[0]
 
     pred_final = int(np.argmax(p_final))
     print(pred_final, LABELS.get(pred_final,"UNKNOWN"))
@@ -0,0 +1,122 @@
+"""NumPy evaluation engine: confusion-matrix metrics and vectorized bootstrap CIs.
+
+Everything is computed from confusion matrices, so B bootstrap resamples are
+one bincount over a [B, n] index array instead of B classification_report calls.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np, pandas as pd
+
+K = 4
+CLASS_NAMES = {0: "valid", 1: "ad", 2: "irrelevant", 3: "rant"}
+
+
+def confusion(y, p, k=K):
+    return np.bincount(y * k + p, minlength=k * k).reshape(k, k)
+
+
+def confusion_batch(codes, idx, k=K):
+    """codes: [n] y*k+p; idx: [B, n] resample indices -> [B, k, k] confusion matrices"""
+    B = idx.shape[0]
+    flat = codes[idx] + (np.arange(B) * k * k)[:, None]
+    return np.bincount(flat.ravel(), minlength=B * k * k).reshape(B, k, k)
+
+
+def scores(cm):
+    """cm: [..., k, k] (rows = true, cols = pred) -> dict of [...] / [..., k] arrays.
+    Macro averages follow sklearn: over classes present in y_true or y_pred."""
+    cm = np.asarray(cm, dtype=float)
+    tp = np.diagonal(cm, axis1=-2, axis2=-1)
+    support, predicted = cm.sum(axis=-1), cm.sum(axis=-2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall    = np.where(support > 0, tp / support, 0.0)
+        f1        = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        present = (support > 0) | (predicted > 0)
+        macro_f1 = (f1 * present).sum(axis=-1) / present.sum(axis=-1)
+        accuracy = tp.sum(axis=-1) / cm.sum(axis=(-2, -1))
+    return {"accuracy": accuracy, "macro_f1": macro_f1, "precision": precision,
+            "recall": recall, "f1": f1, "support": support}
+
+
+def bootstrap(codes, B=5000, seed=42, max_cells=20_000_000, k=K):
+    """scores() over B bootstrap resamples of the rows, in chunks of <= max_cells indices."""
+    rng = np.random.default_rng(seed)
+    n = len(codes)
+    step = max(1, max_cells // max(n, 1))
+    parts = []
+    for s in range(0, B, step):
+        idx = rng.integers(0, n, size=(min(step, B - s), n))
+        parts.append(confusion_batch(codes, idx, k))
+    return scores(np.concatenate(parts))
+
+
+def read_preds(fp):
+    """(name, DataFrame with id/label/pred) or (name, None) if the file isn't a labeled preds file
+    or can't be read (one broken csv must not stop the summary of the others)."""
+    try:
+        cols = pd.read_csv(fp, nrows=0).columns
+        if not {"label", "pred"}.issubset(cols):
+            return fp.name, None
+        use = [c for c in ("id", "label", "pred") if c in cols]
+        df = pd.read_csv(fp, usecols=use).dropna(subset=["label", "pred"])
+        return fp.name, df.astype({"label": int, "pred": int})
+    except (ValueError, pd.errors.ParserError, OSError) as e:   # EmptyDataError, bad rows, non-int labels
+        print(f"[warn] skipping {fp}: {e}\n", end="")   # one write: read_preds runs in a thread pool
+        return fp.name, None
+
+
+def evaluate(df, B=5000, alpha=0.05, seed=42):
+    y, p = df["label"].to_numpy(), df["pred"].to_numpy()
+    point = scores(confusion(y, p))
+    boot = bootstrap(y * K + p, B, seed)
+    lo, hi = 100 * alpha / 2, 100 * (1 - alpha / 2)
+    row = {"accuracy": float(point["accuracy"]), "macro_f1": float(point["macro_f1"])}
+    for m in ("accuracy", "macro_f1"):
+        row[f"{m}_lo"], row[f"{m}_hi"] = np.percentile(boot[m], [lo, hi])
+    for c, name in CLASS_NAMES.items():
+        row[f"f1_{name}"] = float(point["f1"][c])
+        row[f"f1_{name}_lo"], row[f"f1_{name}_hi"] = np.percentile(boot["f1"][:, c], [lo, hi])
+    row["support"] = int(len(y))
+    return row
+
+
+def paired_delta(a, b, B=5000, alpha=0.05, seed=42):
+    """macro-F1(a) - macro-F1(b) on the same bootstrap resamples of their shared ids."""
+    m = a.merge(b, on=["id", "label"], suffixes=("_a", "_b"))
+    if not len(m):
+        return None
+    y = m["label"].to_numpy()
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(m), size=(B, len(m)))
+    fa = scores(confusion_batch(y * K + m["pred_a"].to_numpy(), idx))["macro_f1"]
+    fb = scores(confusion_batch(y * K + m["pred_b"].to_numpy(), idx))["macro_f1"]
+    d = fa - fb
+    point = (scores(confusion(y, m["pred_a"].to_numpy()))["macro_f1"]
+             - scores(confusion(y, m["pred_b"].to_numpy()))["macro_f1"])
+    lo, hi = np.percentile(d, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return {"delta": float(point), "lo": float(lo), "hi": float(hi), "p_le_0": float((d <= 0).mean())}
+
+
+def summarize(preds_dir, B=5000, alpha=0.05, workers=None):
+    """Read every preds csv and evaluate them in parallel; one row per model, plus a
+    paired macro-F1 difference against the best model where ids line up."""
+    files = sorted(Path(preds_dir).glob("*.csv"))
+    with ThreadPoolExecutor(workers) as pool:
+        frames = {name: df for name, df in pool.map(read_preds, files) if df is not None}
+        rows = dict(zip(frames, pool.map(lambda df: evaluate(df, B, alpha), frames.values())))
+    if not rows:
+        return pd.DataFrame()
+
+    summary = pd.DataFrame([{"file": f, **r} for f, r in rows.items()]).sort_values("macro_f1", ascending=False)
+    best = summary["file"].iloc[0]
+    if "id" in frames[best]:
+        others = [f for f in summary["file"] if f != best and "id" in frames[f]]
+        with ThreadPoolExecutor(workers) as pool:
+            deltas = dict(zip(others, pool.map(lambda f: paired_delta(frames[f], frames[best], B, alpha), others)))
+        for f, d in deltas.items():
+            if d is None: continue
+            i = summary.index[summary["file"] == f][0]
+            summary.loc[i, ["delta_vs_best", "delta_lo", "delta_hi", "p_better_than_best"]] = \
+                [d["delta"], d["lo"], d["hi"], 1 - d["p_le_0"]]
+    return summary.reset_index(drop=True)
@@ -0,0 +1,316 @@
+"""On-disk feature cache shared by the batch scripts, keyed by a hash of each text.
+
+    data/features/tfidf-<fingerprint>/  X-<start>.npz + keys-<start>.npy    (TF-IDF rows)
+    data/features/bert-<fingerprint>/   tokens-<start>.npy + offsets-<start>.npy + keys-<start>.npy
+                                        (token ids without special tokens, ragged;
+                                         loaded memory-mapped)
+
+Every call that meets new texts appends one part: its feature files first, then
+keys-<start>.npy, which is the commit point. Readers only use committed parts.
+Appends hold an exclusive lock on the directory (flock on its `lock` file): the
+writer first picks up parts other processes committed meanwhile, and deletes
+what a crashed writer left behind (a part without its keys file, tmp files), so
+rows and keys can't drift apart and no in-flight part is touched. Appending
+never rewrites earlier parts; `compact` merges them into one.
+
+The fingerprint covers everything that changes the features (vocabulary, idf
+weights and vectorizer params; tokenizer vocab and class), so a retrained
+vectorizer or a new tokenizer gets a fresh directory instead of stale rows.
+`prune` deletes directories that no longer match the current models.
+
+Run `compact` and `prune` while no batch job is using the cache.
+
+    python src/feature_store.py build data/processed/*.csv
+    python src/feature_store.py info
+    python src/feature_store.py compact
+    python src/feature_store.py prune
+
+FEATURE_CACHE=0 turns the cache off for every script (default_store() -> None).
+"""
+import argparse, fcntl, hashlib, json, os, re, shutil, sys
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+import scipy.sparse as sp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FEATURE_DIR = Path("data/features")
+
+
+def text_keys(texts):
+    """16-byte blake2b digest per text -> 'S16' array"""
+    return np.array([hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts], dtype="S16")
+
+
+def vectorizer_fingerprint(vec):
+    h = hashlib.sha1("\n".join(vec.get_feature_names_out()).encode())
+    if hasattr(vec, "idf_"):
+        h.update(np.ascontiguousarray(vec.idf_).tobytes())
+    params = {k: v for k, v in vec.get_params().items() if k not in ("dtype",)}
+    h.update(repr(sorted((k, repr(v)) for k, v in params.items())).encode())
+    return h.hexdigest()[:16]
+
+
+def tokenizer_fingerprint(tok):
+    h = hashlib.sha1(type(tok).__name__.encode())
+    h.update(json.dumps(sorted(tok.get_vocab().items())).encode())
+    h.update(repr(getattr(tok, "do_lower_case", None)).encode())
+    return h.hexdigest()[:16]
+
+
+def _atomic_save(path, save):
+    tmp = path.with_name(path.stem + ".tmp" + path.suffix)
+    save(tmp)
+    os.replace(tmp, path)
+
+
+PART = re.compile(r"^(keys|X|tokens|offsets)-(\d{10})\.(npy|npz)$")
+
+
+def _take(parts, starts, rows, get):
+    """rows (global) from a list of parts -> [get(part, local rows)] blocks and the
+    permutation that puts their concatenation back in the order of rows"""
+    pid = np.searchsorted(starts, rows, side="right") - 1
+    order = np.argsort(pid, kind="stable")
+    blocks = []
+    for p in np.unique(pid):
+        sel = order[pid[order] == p]
+        blocks.append(get(parts[p], rows[sel] - starts[p]))
+    return blocks, np.argsort(order, kind="stable")
+
+
+class _Segment:
+    """keys + row lookup for one featurizer directory, stored as appended parts."""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.tags, self.keys, self.row = [], np.zeros(0, dtype="S16"), {}
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.parts = None   # feature parts, loaded by FeatureStore on first use
+        self.refresh()
+
+    def refresh(self):
+        """pick up parts committed since the last look (by this or another process) -> their tags"""
+        known = set(self.tags)
+        new = sorted(m.group(2) for m in map(PART.match, os.listdir(self.path))
+                     if m and m.group(1) == "keys" and m.group(2) not in known)
+        for tag in new:
+            if int(tag) != len(self.keys):
+                raise ValueError(f"{self.path}: parts don't line up at {tag}; delete the directory to rebuild it")
+            k = np.load(self.path/f"keys-{tag}.npy")
+            self.row.update({key: len(self.keys) + i for i, key in enumerate(k.tolist())})
+            self.keys = np.concatenate([self.keys, k])
+            self.tags.append(tag); self.starts = np.append(self.starts, int(tag))
+        return new
+
+    @contextmanager
+    def _writing(self):
+        """exclusive append lock; inside it nobody else is mid-write, so leftovers are a crash's"""
+        with open(self.path/"lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                committed = {m.group(2) for m in map(PART.match, os.listdir(self.path)) if m and m.group(1) == "keys"}
+                for name in os.listdir(self.path):
+                    m = PART.match(name)
+                    # *.tmp.* files, the old single-file layout, parts without their keys file
+                    if name != "lock" and (m is None or m.group(2) not in committed):
+                        (self.path/name).unlink()
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def lookup(self, keys):
+        """-> row per key (-1 when missing), unique missing keys with the first position of each"""
+        rows = np.fromiter((self.row.get(k, -1) for k in keys.tolist()), np.int64, len(keys))
+        miss = np.flatnonzero(rows < 0)
+        _, first = np.unique(keys[miss], return_index=True)
+        return rows, miss[np.sort(first)]
+
+    def append(self, new_keys, save):
+        """save(tag) writes the part's feature files; then its keys file commits it.
+        Parts other processes committed meanwhile are picked up first (see refresh)."""
+        with self._writing():
+            self.refresh()
+            start = len(self.keys)
+            tag = f"{start:010d}"
+            save(tag)
+            _atomic_save(self.path/f"keys-{tag}.npy", lambda p: np.save(p, new_keys))
+        self.tags.append(tag); self.starts = np.append(self.starts, start)
+        self.keys = np.concatenate([self.keys, new_keys])
+        self.row.update({k: start + i for i, k in enumerate(new_keys.tolist())})
+        return tag
+
+    def load_parts(self, load, last=None):
+        """extend self.parts with load(tag) for the tags it doesn't cover yet (last: the newest part, already in memory)"""
+        missing = self.tags[len(self.parts):]
+        self.parts += [load(t) for t in (missing[:-1] if last is not None else missing)]
+        if last is not None:
+            self.parts.append(last)
+
+    def rows_of(self, keys):
+        return np.fromiter((self.row[k] for k in keys.tolist()), np.int64, len(keys))
+
+
+class FeatureStore:
+    def __init__(self, root=FEATURE_DIR):
+        self.root = Path(root)
+        self._segments = {}
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _lookup(seg, keys, load):
+        """seg.lookup, retried after picking up parts other processes committed when keys are missing"""
+        rows, new = seg.lookup(keys)
+        if len(new) and seg.refresh():
+            seg.load_parts(load)
+            rows, new = seg.lookup(keys)
+        return rows, new
+
+    def _segment(self, kind, fp):
+        key = f"{kind}-{fp}"
+        if key not in self._segments:
+            self._segments[key] = _Segment(self.root/key)
+        return self._segments[key]
+
+    # ---------- TF-IDF ----------
+
+    def tfidf(self, vec, texts):
+        """vec.transform(texts), with rows seen before read from the X-*.npz parts (CSR, vectorizer dtype)"""
+        texts = pd.Series(texts, dtype=object).fillna("").astype(str).tolist()
+        seg = self._segment("tfidf", vectorizer_fingerprint(vec))
+        load = lambda t: sp.load_npz(seg.path/f"X-{t}.npz").tocsr()
+        if seg.parts is None:
+            seg.parts = []; seg.load_parts(load)
+        keys = text_keys(texts)
+        rows, new = self._lookup(seg, keys, load)
+        if len(new):
+            Xn = vec.transform([texts[i] for i in new]).tocsr()
+            seg.append(keys[new], lambda tag: _atomic_save(seg.path/f"X-{tag}.npz",
+                                                           lambda p: sp.save_npz(p, Xn, compressed=False)))
+            seg.load_parts(load, last=Xn)
+            rows = seg.rows_of(keys)
+        self.hits += len(texts) - len(new); self.misses += len(new)
+        if not len(rows):
+            return sp.csr_matrix((0, len(vec.vocabulary_)), dtype=vec.dtype)
+        blocks, back = _take(seg.parts, seg.starts, rows, lambda X, r: X[r])
+        return sp.vstack(blocks, format="csr")[back]
+
+    # ---------- DistilBERT token ids ----------
+
+    def token_ids(self, tok, texts):
+        """-> list of int32 arrays (no special tokens), views into the memory-mapped tokens-*.npy"""
+        texts = pd.Series(texts, dtype=object).fillna("").astype(str).tolist()
+        seg = self._segment("bert", tokenizer_fingerprint(tok))
+        load = lambda t: (np.load(seg.path/f"tokens-{t}.npy", mmap_mode="r"), np.load(seg.path/f"offsets-{t}.npy"))
+        if seg.parts is None:
+            seg.parts = []; seg.load_parts(load)
+        keys = text_keys(texts)
+        rows, new = self._lookup(seg, keys, load)
+        if len(new):
+            enc = tok([texts[i] for i in new], add_special_tokens=False)["input_ids"]
+            lens = np.array([len(x) for x in enc], dtype=np.int64)
+            flat = np.fromiter((t for x in enc for t in x), np.int32, int(lens.sum()))
+            offsets = np.concatenate([[0], np.cumsum(lens)])
+
+            def save(tag):
+                _atomic_save(seg.path/f"tokens-{tag}.npy", lambda p: np.save(p, flat))
+                _atomic_save(seg.path/f"offsets-{tag}.npy", lambda p: np.save(p, offsets))
+            seg.append(keys[new], save)
+            seg.load_parts(load)
+            rows = seg.rows_of(keys)
+        self.hits += len(texts) - len(new); self.misses += len(new)
+        out = [None] * len(rows)
+        pid = np.searchsorted(seg.starts, rows, side="right") - 1
+        for i, (p, r) in enumerate(zip(pid.tolist(), (rows - seg.starts[pid]).tolist())):
+            tokens, offsets = seg.parts[p]
+            out[i] = tokens[offsets[r]:offsets[r + 1]]
+        return out
+
+    # ---------- housekeeping ----------
+
+    def info(self):
+        out = []
+        for d in sorted(p for p in self.root.glob("*-*") if p.is_dir() and "." not in p.name):
+            keys = sorted(d.glob("keys-*.npy"))
+            out.append({"dir": d.name, "parts": len(keys),
+                        "rows": sum(np.load(k, mmap_mode="r").shape[0] for k in keys),
+                        "mb": sum(f.stat().st_size for f in d.iterdir()) / 2**20})
+        return out
+
+    def compact(self):
+        """merge every directory's parts into one -> {dir: parts before}.
+        The merged copy is built next to the directory and swapped in with renames."""
+        done = {}
+        for d in sorted(p for p in self.root.glob("*-*") if p.is_dir() and "." not in p.name):
+            seg = _Segment(d)
+            if len(seg.tags) < 2:
+                continue
+            tmp = d.with_name(d.name + ".compact")
+            shutil.rmtree(tmp, ignore_errors=True); tmp.mkdir()
+            tag = f"{0:010d}"
+            if d.name.startswith("tfidf-"):
+                X = sp.vstack([sp.load_npz(d/f"X-{t}.npz") for t in seg.tags], format="csr")
+                sp.save_npz(tmp/f"X-{tag}.npz", X, compressed=False)
+            else:
+                toks = [np.load(d/f"tokens-{t}.npy") for t in seg.tags]
+                offs = [np.load(d/f"offsets-{t}.npy") for t in seg.tags]
+                base = np.cumsum([0] + [len(t) for t in toks[:-1]])
+                np.save(tmp/f"tokens-{tag}.npy", np.concatenate(toks))
+                np.save(tmp/f"offsets-{tag}.npy", np.concatenate([[0]] + [o[1:] + b for o, b in zip(offs, base)]))
+            np.save(tmp/f"keys-{tag}.npy", seg.keys)
+            old = d.with_name(d.name + ".old")
+            os.replace(d, old); os.replace(tmp, d); shutil.rmtree(old)
+            self._segments.pop(d.name, None)
+            done[d.name] = len(seg.tags)
+        return done
+
+    def prune(self, keep):
+        """delete featurizer directories whose name isn't in keep -> removed names"""
+        gone = []
+        for d in self.root.glob("*-*"):
+            if d.is_dir() and d.name not in keep:
+                shutil.rmtree(d); gone.append(d.name)
+        return gone
+
+
+def default_store():
+    return None if os.environ.get("FEATURE_CACHE", "1") == "0" else FeatureStore()
+
+
+def main():
+    from src.utils import TFIDF_MODEL, load_bert
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=str(FEATURE_DIR))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="featurize the text column of csv files")
+    b.add_argument("paths", nargs="+")
+    b.add_argument("--text-col", default="text")
+    sub.add_parser("info")
+    sub.add_parser("compact", help="merge the appended parts of each cache into one")
+    sub.add_parser("prune", help="drop caches built by an older vectorizer/tokenizer")
+    args = ap.parse_args()
+
+    store = FeatureStore(args.root)
+    if args.cmd == "info":
+        print(json.dumps(store.info(), indent=2))
+        return
+    if args.cmd == "compact":
+        print(f"[features] compacted {store.compact() or 'nothing'}")
+        return
+    vec = joblib.load(TFIDF_MODEL).named_steps["tfidf"]
+    tok, _ = load_bert()
+    if args.cmd == "prune":
+        keep = {f"tfidf-{vectorizer_fingerprint(vec)}"} | ({f"bert-{tokenizer_fingerprint(tok)}"} if tok else set())
+        print(f"[features] removed {store.prune(keep) or 'nothing'}")
+        return
+    for p in args.paths:
+        texts = pd.read_csv(p, usecols=[args.text_col])[args.text_col]
+        store.tfidf(vec, texts)
+        if tok is not None:
+            store.token_ids(tok, texts)
+        print(f"[features] {p}: {len(texts)} texts ({store.misses} new so far)")
+
+
+if __name__ == "__main__":
+    main()
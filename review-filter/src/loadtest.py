@@ -0,0 +1,239 @@
+import argparse, asyncio, json, os, signal, socket, subprocess, sys, threading, time, urllib.request
+from pathlib import Path
+import numpy as np, pandas as pd, psutil
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.benchmark import latency_stats
+
+TEST_CSV = Path("data/processed/test.csv")
+OUT = Path("outputs/metrics"); OUT.mkdir(parents=True, exist_ok=True)
+
+# how each target is started; {port} and {workers} are filled in
+SERVERS = {
+    "fastapi": [sys.executable, "-m", "uvicorn", "src.app:app", "--host", "127.0.0.1",
+                "--port", "{port}", "--workers", "{workers}", "--log-level", "warning"],
+    "flask":   [sys.executable, "-m", "gunicorn", "app:app", "-b", "127.0.0.1:{port}",
+                "-w", "{workers}", "--log-level", "warning"],
+    # src/app.py with the models loaded once and shared by the workers (src/serve.py)
+    "shared":  [sys.executable, "src/serve.py", "--host", "127.0.0.1", "--port", "{port}",
+                "--workers", "{workers}", "--log-level", "warning"],
+}
+DEFAULT_PATH = {"fastapi": "/predict/", "flask": "/api/locations/search", "shared": "/predict/"}
+# --batch payloads ({"texts": [...]}) go to the batch endpoint; /predict/ only takes {"text": ...}
+BATCH_PATH = {"fastapi": "/predict/batch", "shared": "/predict/batch"}
+# app.py (Flask) only has the GET /api/locations/... routes, no prediction endpoint
+DEFAULT_METHOD = {"fastapi": "POST", "flask": "GET", "shared": "POST"}
+
+
+def request_path(target, batch=False, path=None):
+    """route a run hits: --path, else the target's batch or single-review route"""
+    if path:
+        return path
+    if batch:
+        if target not in BATCH_PATH:
+            raise ValueError(f"--target {target} has no batch endpoint; give --path")
+        return BATCH_PATH[target]
+    return DEFAULT_PATH[target]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(target, port, workers, cache=False):
+    cmd = [c.format(port=port, workers=workers) for c in SERVERS[target]]
+    env = {**os.environ, "PREDICT_CACHE_SIZE": os.environ.get("PREDICT_CACHE_SIZE", "10000") if cache else "0"}
+    proc = subprocess.Popen(cmd, cwd=Path(__file__).resolve().parent.parent, env=env,
+                            stdout=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{target} server exited with code {proc.returncode}: {' '.join(cmd)}")
+        try:
+            # any HTTP response means a worker is up (the master alone only accepts the socket)
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2)
+            return proc
+        except urllib.error.HTTPError:
+            return proc
+        except OSError:
+            time.sleep(0.25)
+    stop_server(proc)
+    raise TimeoutError(f"{target} server did not come up on port {port}")
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+class ResourceSampler(threading.Thread):
+    """Samples CPU% and RSS of the server process tree (master + workers)."""
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.root, self.interval = psutil.Process(pid), interval
+        self.cpu, self.rss = [], []
+        self.seen = {}   # pid -> Process; cpu_percent() needs the same object between calls
+        self._done = threading.Event()
+
+    def procs(self):
+        try:
+            tree = [self.root, *self.root.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            return []
+        return [self.seen.setdefault(p.pid, p) for p in tree]
+
+    def run(self):
+        for p in self.procs(): p.cpu_percent(None)   # prime the counters
+        while not self._done.wait(self.interval):
+            cpu = rss = 0.0
+            for p in self.procs():
+                try:
+                    cpu += p.cpu_percent(None); rss += p.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.cpu.append(cpu); self.rss.append(rss / 2**20)
+
+    def stop(self):
+        self._done.set(); self.join()
+        return {
+            "cpu_percent_mean": float(np.mean(self.cpu)) if self.cpu else None,
+            "cpu_percent_max":  float(np.max(self.cpu)) if self.cpu else None,
+            "rss_mb_mean": float(np.mean(self.rss)) if self.rss else None,
+            "rss_mb_max":  float(np.max(self.rss)) if self.rss else None,
+        }
+
+
+def parse_mix(spec):
+    """'1:0.8,4:0.15,16:0.05' -> sizes [1,4,16], probs [.8,.15,.05]"""
+    pairs = [p.split(":") for p in spec.split(",")]
+    sizes = np.array([int(k) for k, _ in pairs]); w = np.array([float(v) for _, v in pairs])
+    return sizes, w / w.sum()
+
+
+def make_payloads(texts, sizes, probs, batch, n, seed=0):
+    """Request bodies: size k means k test reviews, either concatenated into one
+    text or, with batch=True, sent as a list under "texts"."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for k in rng.choice(sizes, size=n, p=probs):
+        picks = [texts[i] for i in rng.integers(0, len(texts), size=k)]
+        out.append({"texts": picks} if batch else {"text": " ".join(picks)})
+    return out
+
+
+def make_queries(texts, n, seed=0):
+    """Query strings for GET routes: one word of a test review as ?q= (location search)."""
+    rng = np.random.default_rng(seed)
+    words = [w for t in texts[:2000] for w in t.split() if w.isalpha() and len(w) > 3] or ["a"]
+    return [{"q": words[i]} for i in rng.integers(0, len(words), size=n)]
+
+
+async def drive(url, payloads, concurrency, duration, method="POST"):
+    import httpx
+    lat, status, errors = [], {}, 0
+    deadline = time.perf_counter() + duration
+    counter = iter(range(10**12))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                body = payloads[next(counter) % len(payloads)]
+                t0 = time.perf_counter()
+                try:
+                    if method == "GET":
+                        r = await client.get(url, params=body)
+                    else:
+                        r = await client.post(url, json=body)
+                    status[r.status_code] = status.get(r.status_code, 0) + 1
+                    if r.status_code >= 400: errors += 1
+                except httpx.HTTPError:
+                    errors += 1; status["exception"] = status.get("exception", 0) + 1
+                lat.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    return lat, status, errors, wall
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--target", choices=list(SERVERS), default="fastapi")
+    ap.add_argument("--path", default=None,
+                    help="route to hit (default: /predict/, /api/locations/search for flask)")
+    ap.add_argument("--method", choices=["POST", "GET"], default=None,
+                    help="POST review payloads or GET with ?q= queries (default: GET for flask, POST otherwise)")
+    ap.add_argument("--url", default=None, help="hit an already running server instead of starting one")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    ap.add_argument("--warmup", type=float, default=2.0)
+    ap.add_argument("--size-mix", default="1:0.8,4:0.15,16:0.05",
+                    help="reviews per request and their weights")
+    ap.add_argument("--batch", action="store_true",
+                    help='send {"texts": [...]} to /predict/batch instead of {"text": ...} to /predict/')
+    ap.add_argument("--cache", action="store_true",
+                    help="keep the server's prediction cache on (payloads repeat, so hits will dominate)")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    try:
+        path = request_path(args.target, args.batch, args.path)
+    except ValueError as e:
+        ap.error(str(e))
+
+    texts = pd.read_csv(TEST_CSV)["text"].astype(str).tolist()
+    sizes, probs = parse_mix(args.size_mix)
+    method = args.method or DEFAULT_METHOD[args.target]
+    if method == "GET":
+        payloads, reviews_per_req = make_queries(texts, n=5000), None
+    else:
+        payloads = make_payloads(texts, sizes, probs, args.batch, n=5000)
+        # without --batch the k reviews are joined into one text: the server classifies one review
+        reviews_per_req = float((sizes * probs).sum()) if args.batch else 1.0
+
+    proc = None
+    if args.url is None:
+        port = free_port()
+        proc = start_server(args.target, port, args.workers, args.cache)
+        base = f"http://127.0.0.1:{port}"
+    else:
+        base = args.url.rstrip("/")
+    url = base + path
+
+    report = {"target": args.target, "url": url, "method": method, "workers": args.workers, "cache": args.cache, "size_mix": args.size_mix,
+              "batch": args.batch, "duration_s": args.duration, "levels": []}
+    try:
+        asyncio.run(drive(url, payloads, 1, args.warmup, method))
+        for c in args.concurrency:
+            sampler = ResourceSampler(proc.pid) if proc else None
+            if sampler: sampler.start()
+            lat, status, errors, wall = asyncio.run(drive(url, payloads, c, args.duration, method))
+            level = {"concurrency": c, "requests": len(lat),
+                     "requests_per_s": len(lat) / wall,
+                     "reviews_per_s": len(lat) * reviews_per_req / wall if reviews_per_req else None,
+                     "error_rate": errors / max(len(lat), 1), "status": {str(k): v for k, v in status.items()},
+                     **{k: v for k, v in latency_stats(lat).items() if k.endswith("_ms")},
+                     "server": sampler.stop() if sampler else None}
+            report["levels"].append(level)
+            srv = level["server"] or {}
+            reviews = f"{level['reviews_per_s']:8.1f} reviews/s  " if reviews_per_req else ""
+            print(f"[load] c={c:<3} {level['requests_per_s']:8.1f} req/s  {reviews}"
+                  f"p50={level['p50_ms']:.1f}ms p95={level['p95_ms']:.1f}ms p99={level['p99_ms']:.1f}ms  "
+                  f"err={level['error_rate']:.2%}  cpu={srv.get('cpu_percent_mean') or 0:.0f}%  "
+                  f"rss={srv.get('rss_mb_max') or 0:.0f}MB")
+    finally:
+        if proc: stop_server(proc)
+
+    out = Path(args.out or OUT/f"loadtest_{args.target}.json")
+    out.write_text(json.dumps(report, indent=2))
+    print(f"[load] wrote -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Persisted per-location review index for the dashboard (SQLite).
+
+Build it offline from a scraped/exported reviews file; re-running only scores
+reviews whose (location, id) isn't indexed yet and bumps the counters. Queries
+are index lookups: location search (name prefix, word prefix, then trigram
+fuzzy match), per-location label counts/stats, and paginated reviews.
+
+    python src/location_index.py build data/raw/locations.csv
+    python src/location_index.py search "blue bottle"
+"""
+import argparse, json, re, sqlite3, sys, time, unicodedata
+from pathlib import Path
+import pandas as pd, joblib
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import TFIDF_MODEL, LABELS, bulk_score, text_id
+
+INDEX_DB = Path("data/index/locations.sqlite")
+LOCATION_CANDS = ["location", "location_name", "place", "place_name", "business", "business_name", "venue", "name", "url"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    loc_id     INTEGER PRIMARY KEY,
+    name       TEXT UNIQUE NOT NULL,
+    norm       TEXT NOT NULL,
+    n_grams    INTEGER NOT NULL,
+    n_reviews  INTEGER NOT NULL DEFAULT 0,
+    n_valid    INTEGER NOT NULL DEFAULT 0,
+    n_ad       INTEGER NOT NULL DEFAULT 0,
+    n_irrelevant INTEGER NOT NULL DEFAULT 0,
+    n_rant     INTEGER NOT NULL DEFAULT 0,
+    rating_sum REAL NOT NULL DEFAULT 0,
+    rating_n   INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS locations_norm ON locations(norm);
+CREATE TABLE IF NOT EXISTS location_tokens (token TEXT NOT NULL, loc_id INTEGER NOT NULL, PRIMARY KEY (token, loc_id));
+CREATE TABLE IF NOT EXISTS location_trigrams (gram TEXT NOT NULL, loc_id INTEGER NOT NULL, PRIMARY KEY (gram, loc_id));
+CREATE TABLE IF NOT EXISTS reviews (
+    loc_id     INTEGER NOT NULL,
+    review_id  TEXT NOT NULL,
+    text       TEXT NOT NULL,
+    label      INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    rating     REAL,
+    date       TEXT,
+    seq        INTEGER NOT NULL,
+    PRIMARY KEY (loc_id, review_id)
+);
+CREATE INDEX IF NOT EXISTS reviews_loc_label ON reviews(loc_id, label, seq);
+CREATE INDEX IF NOT EXISTS reviews_loc_seq ON reviews(loc_id, seq);
+"""
+COUNT_COLS = {0: "n_valid", 1: "n_ad", 2: "n_irrelevant", 3: "n_rant"}
+
+
+def normalize(name):
+    s = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", s.lower()).strip()
+
+
+def trigrams(norm):
+    s = f"  {norm} "
+    return {s[i:i+3] for i in range(len(s) - 2)}
+
+
+class LocationIndex:
+    def __init__(self, path=INDEX_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    # ---------- build / incremental update ----------
+
+    def _location_ids(self, names):
+        ids = {}
+        for name in names:
+            row = self.db.execute("SELECT loc_id FROM locations WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                norm = normalize(name); grams = trigrams(norm)
+                cur = self.db.execute("INSERT INTO locations(name, norm, n_grams) VALUES (?, ?, ?)",
+                                      (name, norm, len(grams)))
+                loc = cur.lastrowid
+                self.db.executemany("INSERT OR IGNORE INTO location_tokens VALUES (?, ?)",
+                                    [(t, loc) for t in set(norm.split())])
+                self.db.executemany("INSERT OR IGNORE INTO location_trigrams VALUES (?, ?)",
+                                    [(g, loc) for g in grams])
+                ids[name] = loc
+            else:
+                ids[name] = row["loc_id"]
+        return ids
+
+    def add_reviews(self, df, clf=None, chunk=50_000):
+        """df: location, id, text [, rating, date]. Only reviews not indexed yet are scored.
+        Without an id column the id is a hash of the text (text_id), so re-running a file or
+        indexing several files doesn't collide on row numbers."""
+        df = df.dropna(subset=["location", "text"]).copy()
+        df["id"] = df["id"].astype(str) if "id" in df else df["text"].map(text_id)
+        df["location"] = df["location"].astype(str)
+        with self.db:
+            loc_ids = self._location_ids(df["location"].unique())
+        df["loc_id"] = df["location"].map(loc_ids)
+
+        df = df.drop_duplicates(["loc_id", "id"])
+        # look up only this chunk's keys (primary key probes), not the whole reviews table
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (loc_id INTEGER NOT NULL, review_id TEXT NOT NULL)")
+        self.db.execute("DELETE FROM incoming")
+        self.db.executemany("INSERT INTO incoming VALUES (?, ?)",
+                            zip(df["loc_id"].astype(int).tolist(), df["id"].tolist()))
+        known = {(r[0], r[1]) for r in self.db.execute(
+            "SELECT i.loc_id, i.review_id FROM incoming i JOIN reviews r "
+            "ON r.loc_id = i.loc_id AND r.review_id = i.review_id")}
+        self.db.execute("DELETE FROM incoming")
+        self.db.commit()
+        if known:
+            df = df[[k not in known for k in zip(df["loc_id"].astype(int), df["id"])]]
+        if not len(df):
+            return 0
+
+        clf = clf or joblib.load(TFIDF_MODEL)
+        pred, proba = bulk_score(clf, df["text"], chunk=chunk)
+        df["label"], df["confidence"] = pred, proba.max(axis=1)
+        rating = pd.to_numeric(df["rating"], errors="coerce") if "rating" in df else pd.Series(float("nan"), index=df.index)
+        date = df["date"].astype(object).where(df["date"].notna(), None) if "date" in df else [None] * len(df)
+        start = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM reviews").fetchone()[0]
+
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(df["loc_id"].astype(int).tolist(), df["id"].tolist(), df["text"].astype(str).tolist(),
+                    df["label"].astype(int).tolist(), df["confidence"].astype(float).tolist(),
+                    [None if pd.isna(v) else float(v) for v in rating], list(date),
+                    range(start + 1, start + 1 + len(df))))
+            df["rating_"] = rating
+            agg = df.groupby("loc_id").agg(n=("label", "size"), r_sum=("rating_", "sum"), r_n=("rating_", "count"),
+                                           **{c: ("label", lambda s, k=k: int((s == k).sum())) for k, c in COUNT_COLS.items()})
+            now = time.time()
+            self.db.executemany(
+                f"""UPDATE locations SET n_reviews = n_reviews + ?, rating_sum = rating_sum + ?, rating_n = rating_n + ?,
+                    {', '.join(f'{c} = {c} + ?' for c in COUNT_COLS.values())}, updated_at = ? WHERE loc_id = ?""",
+                [(int(r.n), float(r.r_sum), int(r.r_n), *[int(getattr(r, c)) for c in COUNT_COLS.values()], now, int(loc))
+                 for loc, r in agg.iterrows()])
+        return len(df)
+
+    # ---------- queries ----------
+
+    def search(self, q, limit=10):
+        """exact/prefix on the full name, then word-prefix, then trigram similarity"""
+        norm = normalize(q)
+        if not norm:
+            return []
+        hits, seen = [], set()
+
+        def take(rows, how):
+            for r in rows:
+                if r["loc_id"] not in seen and len(hits) < limit:
+                    seen.add(r["loc_id"]); hits.append({**dict(r), "match": how})
+
+        cols = "loc_id, name, n_reviews"
+        take(self.db.execute(f"SELECT {cols} FROM locations WHERE norm >= ? AND norm < ? "
+                             "ORDER BY n_reviews DESC LIMIT ?", (norm, norm + "\uffff", limit)), "prefix")
+        if len(hits) < limit:
+            words = norm.split()
+            # every query word must prefix some word of the name
+            sub = " INTERSECT ".join(["SELECT loc_id FROM location_tokens WHERE token >= ? AND token < ?"] * len(words))
+            args = [a for w in words for a in (w, w + "\uffff")]
+            take(self.db.execute(f"SELECT {cols} FROM locations WHERE loc_id IN ({sub}) "
+                                 "ORDER BY n_reviews DESC LIMIT ?", (*args, limit)), "word_prefix")
+        if len(hits) < limit:
+            grams = sorted(trigrams(norm))
+            marks = ",".join("?" * len(grams))
+            rows = self.db.execute(
+                # share of the query's trigrams found in the name; ties go to the closer-length name
+                f"""SELECT l.loc_id, l.name, l.n_reviews
+                    FROM (SELECT loc_id, COUNT(*) AS shared FROM location_trigrams
+                          WHERE gram IN ({marks}) GROUP BY loc_id) t
+                    JOIN locations l USING (loc_id)
+                    WHERE t.shared >= ? * 0.5
+                    ORDER BY t.shared DESC, ABS(l.n_grams - ?), l.n_reviews DESC LIMIT ?""",
+                (*grams, len(grams), len(grams), limit + len(seen)))
+            take(rows, "fuzzy")
+        return hits
+
+    def summary(self, loc_id):
+        r = self.db.execute("SELECT * FROM locations WHERE loc_id = ?", (loc_id,)).fetchone()
+        if r is None:
+            return None
+        stats = self.db.execute("SELECT label, COUNT(*) AS n, AVG(confidence) AS mean_confidence, "
+                                "AVG(rating) AS mean_rating FROM reviews WHERE loc_id = ? GROUP BY label",
+                                (loc_id,)).fetchall()
+        total = r["n_reviews"]
+        return {
+            "loc_id": r["loc_id"], "name": r["name"], "total_reviews": total,
+            "counts": {LABELS[k]: r[c] for k, c in COUNT_COLS.items()},
+            "mean_rating": r["rating_sum"] / r["rating_n"] if r["rating_n"] else None,
+            "categories": {LABELS[s["label"]]: {"count": s["n"], "share": s["n"] / total if total else 0.0,
+                                                "mean_confidence": s["mean_confidence"],
+                                                "mean_rating": s["mean_rating"]} for s in stats},
+            "updated_at": r["updated_at"],
+        }
+
+    def reviews(self, loc_id, label=None, page=1, per_page=20):
+        page, per_page = max(1, int(page)), max(1, min(int(per_page), 200))
+        where, args = "loc_id = ?", [loc_id]
+        if label is not None:
+            where += " AND label = ?"; args.append(int(label))
+        total = self.db.execute(f"SELECT COUNT(*) FROM reviews WHERE {where}", args).fetchone()[0]
+        rows = self.db.execute(f"SELECT review_id, text, label, confidence, rating, date FROM reviews "
+                               f"WHERE {where} ORDER BY seq DESC LIMIT ? OFFSET ?",
+                               (*args, per_page, (page - 1) * per_page)).fetchall()
+        return {"page": page, "per_page": per_page, "total": total,
+                "reviews": [{**dict(r), "label_name": LABELS[r["label"]]} for r in rows]}
+
+
+def find_location_col(df):
+    for c in LOCATION_CANDS:
+        if c in df.columns: return c
+    raise ValueError(f"No location column found (looked for {LOCATION_CANDS}).")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(INDEX_DB))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="index (new) reviews from one or more csv files")
+    b.add_argument("paths", nargs="+")
+    b.add_argument("--location-col", default=None)
+    b.add_argument("--chunksize", type=int, default=200_000)
+    s = sub.add_parser("search"); s.add_argument("query"); s.add_argument("--limit", type=int, default=10)
+    m = sub.add_parser("show"); m.add_argument("loc_id", type=int)
+    args = ap.parse_args()
+
+    idx = LocationIndex(args.db)
+    if args.cmd == "build":
+        clf = joblib.load(TFIDF_MODEL)
+        for p in args.paths:
+            added = 0
+            for chunk in pd.read_csv(p, chunksize=args.chunksize):
+                chunk.columns = [str(c).strip().lower() for c in chunk.columns]
+                col = args.location_col or find_location_col(chunk)
+                added += idx.add_reviews(chunk.rename(columns={col: "location"}), clf)
+            print(f"[index] {p}: indexed {added} new reviews -> {args.db}")
+    elif args.cmd == "search":
+        print(json.dumps(idx.search(args.query, args.limit), indent=2))
+    else:
+        print(json.dumps(idx.summary(args.loc_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
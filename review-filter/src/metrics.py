@@ -0,0 +1,120 @@
+"""Tiny in-process Prometheus metrics: counters, histograms and a stage timer.
+
+Set METRICS_ENABLED=0 to turn every timer/counter into a no-op. Metrics are
+per process; with several uvicorn workers each one exposes its own /metrics.
+"""
+import os, threading, time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# seconds; tuned for sub-ms regex/LR stages up to multi-second BERT batches
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+REGISTRY = []
+
+# per-request stage breakdown: set to a dict (see src/profiling.py) and timed() fills it in
+current_stages = ContextVar("current_stages", default=None)
+
+
+def _labels(names, values):
+    if not names: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, n=1, **labels):
+        if not ENABLED: return
+        key = tuple(str(labels[k]) for k in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + n
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, v in sorted(self.values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, key)} {v}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}   # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        if not ENABLED: return
+        key = tuple(str(labels[k]) for k in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1; s[1] += value; s[2] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, n) in sorted(self.series.items()):
+            cum = 0
+            for le, c in zip([*map(str, self.buckets), "+Inf"], counts):
+                cum += c
+                out.append(f"{self.name}_bucket{_labels((*self.labelnames, 'le'), (*key, le))} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return out
+
+
+STAGE_SECONDS = Histogram("review_stage_seconds", "Time spent per ensemble stage.", ["stage"])
+PREDICTIONS   = Counter("review_predictions_total", "Predictions served, by label and mode.", ["label", "mode"])
+RULE_HITS     = Counter("review_rule_hits_total", "Rule pattern that decided the rule vote.", ["pattern"])
+RULE_CUTS     = Counter("review_rule_cuts_total", "Rule scans shortened by RULE_MAX_CHARS (length) "
+                        "or abandoned at RULE_BUDGET_MS (time).", ["reason"])
+CACHE         = Counter("review_cache_total", "Prediction cache lookups.", ["result"])
+BATCH_SIZE    = Histogram("review_batch_size", "Texts per model call.", ["stage"], buckets=SIZE_BUCKETS)
+
+
+class timed:
+    """with timed("rules"): ...   or   @timed("bert_forward")"""
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        if ENABLED:
+            STAGE_SECONDS.observe(dt, stage=self.stage)
+        stages = current_stages.get()
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + dt
+        return False
+
+    def __call__(self, fn):
+        stage = self.stage
+        def wrapper(*a, **kw):
+            with timed(stage):
+                return fn(*a, **kw)
+        wrapper.__name__, wrapper.__doc__ = fn.__name__, fn.__doc__
+        return wrapper
+
+
+def render():
+    lines = []
+    for m in REGISTRY:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
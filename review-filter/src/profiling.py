@@ -0,0 +1,92 @@
+"""Opt-in request profiling for the API.
+
+PROFILING=1 turns it on. Then a PROFILE_SAMPLE_RATE fraction of requests (and any
+request sent with ?profile=true) runs under cProfile, and every request slower
+than PROFILE_SLOW_MS is captured with its input length and stage timings even
+when it wasn't sampled. The last PROFILE_KEEP captures are kept in memory and
+served by the /debug/profiles endpoints.
+"""
+import cProfile, io, itertools, os, pstats, random, time
+from collections import deque
+from datetime import datetime, timezone
+
+from src.metrics import current_stages
+
+ENABLED     = os.environ.get("PROFILING", "0") == "1"
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01"))
+SLOW_MS     = float(os.environ.get("PROFILE_SLOW_MS", "250"))
+KEEP        = int(os.environ.get("PROFILE_KEEP", "100"))
+PREVIEW_CHARS = 200
+
+captures = deque(maxlen=KEEP)
+_ids = itertools.count(1)
+
+
+class RequestProfile:
+    __slots__ = ("text", "mode", "sampled", "prof", "stages", "token", "t0", "capture_id")
+
+    def __init__(self, text, mode, force=False):
+        self.text, self.mode = text, mode
+        self.sampled = force or random.random() < SAMPLE_RATE
+        self.prof = cProfile.Profile() if self.sampled else None
+        self.capture_id = None
+
+    def __enter__(self):
+        self.stages = {}
+        self.token = current_stages.set(self.stages)
+        if self.prof: self.prof.enable()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = 1000 * (time.perf_counter() - self.t0)
+        if self.prof: self.prof.disable()
+        current_stages.reset(self.token)
+        slow = ms >= SLOW_MS
+        if self.sampled or slow:
+            self.capture_id = next(_ids)
+            captures.append({
+                "id": self.capture_id,
+                "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "latency_ms": ms,
+                "slow": slow,
+                "sampled": self.sampled,
+                "mode": self.mode,
+                "text_len": len(self.text),
+                "text_preview": self.text[:PREVIEW_CHARS],
+                "stages_ms": {k: 1000*v for k, v in self.stages.items()},
+                "error": exc[0].__name__ if exc[0] else None,
+                "_prof": self.prof,
+            })
+        return False
+
+
+class _Off:
+    capture_id = None
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_OFF = _Off()
+
+
+def request(text, mode, force=False):
+    return RequestProfile(text, mode, force) if ENABLED else _OFF
+
+
+def list_captures():
+    return [{k: v for k, v in c.items() if k != "_prof"} | {"has_profile": c["_prof"] is not None}
+            for c in reversed(captures)]
+
+
+def get_capture(capture_id, sort="cumulative", limit=40):
+    """sort: a pstats.SortKey or its value (anything else raises ValueError)"""
+    sort = pstats.SortKey(sort)
+    for c in captures:
+        if c["id"] == capture_id:
+            out = {k: v for k, v in c.items() if k != "_prof"}
+            if c["_prof"] is not None:
+                buf = io.StringIO()
+                pstats.Stats(c["_prof"], stream=buf).sort_stats(sort).print_stats(limit)
+                out["profile"] = buf.getvalue()
+            return out
+    return None
@@ -0,0 +1,273 @@
+"""Speed and safety audit of every rule regex in src/.
+
+Finds the module-level `NAME = re.compile(...)` patterns by parsing the sources
+(the numbered scripts aren't importable), then per distinct pattern:
+  - lint: nested / adjacent overlapping unbounded quantifiers and unanchored
+    leading wildcards, the shapes that backtrack exponentially or quadratically;
+  - timing over a corpus and over adversarial inputs of growing size, with the
+    fitted growth exponent (~1 is linear; >1.5 gets flagged);
+  - hit rate and precision against train.csv labels, per pattern and per
+    top-level alternative, so dead or noisy phrases in a growing alternation
+    show up.
+
+    python src/rule_audit.py
+    python src/rule_audit.py --fail-on-risk      # exit 1 if anything is flagged (CI)
+"""
+import argparse, ast, json, math, re, sys, time
+from pathlib import Path
+import numpy as np, pandas as pd
+
+try:
+    import re._parser as sre_parse
+except ImportError:   # python < 3.11
+    import sre_parse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SRC = Path(__file__).resolve().parent
+TRAIN_CSV = Path("data/processed/train.csv")
+CORPUS_CSV = Path("data/processed/cleaned.csv")
+OUT = Path("outputs/metrics"); OUT.mkdir(parents=True, exist_ok=True)
+
+# which class a rule votes for, by variable name
+CLASS_OF = {"ADS": 1, "ADS_PAT": 1, "NOV": 3, "NO_VISIT_PAT": 3, "IRR": 2, "IRREL_PAT": 2}
+ADVERSARIAL_SIZES = (10_000, 100_000, 1_000_000)
+GROWTH_LIMIT = 1.5
+
+
+# ---------- discovery ----------
+
+def _flags(node):
+    if node is None:
+        return 0
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "re":
+        return getattr(re, node.attr)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        return _flags(node.left) | _flags(node.right)
+    return ast.literal_eval(node)
+
+
+def find_patterns(src_dir=SRC):
+    """{(pattern, flags): {"names": [...], "where": ["file:line", ...]}} for module-level re.compile"""
+    found = {}
+    for fp in sorted(src_dir.glob("*.py")):
+        for node in ast.parse(fp.read_text(encoding="utf-8")).body:
+            if not (isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)):
+                continue
+            call = node.value
+            if not (isinstance(call.func, ast.Attribute) and call.func.attr == "compile"
+                    and isinstance(call.func.value, ast.Name) and call.func.value.id == "re"):
+                continue
+            try:
+                pattern = ast.literal_eval(call.args[0])
+                flags = _flags(call.args[1] if len(call.args) > 1 else
+                               next((k.value for k in call.keywords if k.arg == "flags"), None))
+            except (ValueError, AttributeError, IndexError):
+                continue
+            entry = found.setdefault((pattern, int(flags)), {"names": [], "where": []})
+            for t in node.targets:
+                if isinstance(t, ast.Name) and t.id not in entry["names"]:
+                    entry["names"].append(t.id)
+            entry["where"].append(f"{fp.name}:{node.lineno}")
+    return found
+
+
+def top_level_branches(pattern):
+    """'(a|b\\s+c)' -> ['a', 'b\\s+c']: the outermost alternatives, wrapping group removed."""
+    def split(p):
+        out, depth, cls, cur, i = [], 0, False, "", 0
+        while i < len(p):
+            c = p[i]
+            if c == "\\":
+                cur += p[i:i+2]; i += 2; continue
+            if cls:
+                cls = c != "]"
+            elif c == "[":
+                cls = True
+            elif c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+            elif c == "|" and depth == 0:
+                out.append(cur); cur = ""; i += 1; continue
+            cur += c; i += 1
+        return out + [cur]
+    parts = split(pattern)
+    if len(parts) == 1 and pattern.startswith("(") and pattern.endswith(")") and not pattern.startswith("(?"):
+        inner = pattern[1:-1]
+        if all(d >= 0 for d in np.cumsum([{"(": 1, ")": -1}.get(c, 0) for c in inner])):   # one group spans it all
+            parts = split(inner)
+    return parts
+
+
+# ---------- lint ----------
+
+def _unbounded(op, av):
+    return op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[1] == sre_parse.MAXREPEAT
+
+
+def _has_branch(items):
+    for op, av in items:
+        if op == sre_parse.BRANCH:
+            return True
+        if op == sre_parse.SUBPATTERN and _has_branch(av[-1]):
+            return True
+    return False
+
+
+def _broad(items):
+    """a repeat body that matches a character class rather than one literal"""
+    return any(op in (sre_parse.ANY, sre_parse.IN, sre_parse.CATEGORY) for op, _ in items)
+
+
+def lint(pattern, flags=0):
+    """-> list of {"risk", "why"}; risk is "exponential", "quadratic" or "info"."""
+    issues = []
+
+    def walk(items, under_repeat):
+        prev = None
+        for op, av in items:
+            if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                sub, unb = av[2], _unbounded(op, av)
+                if unb and under_repeat:
+                    issues.append({"risk": "exponential", "why": "unbounded quantifier nested in another"})
+                if unb and _has_branch(sub):
+                    issues.append({"risk": "exponential", "why": "unbounded quantifier over an alternation"})
+                if unb and prev is not None and _unbounded(*prev) and (list(prev[1][2]) == list(sub)
+                                                                        or (_broad(prev[1][2]) and _broad(sub))):
+                    issues.append({"risk": "quadratic", "why": "adjacent unbounded quantifiers can match the same text"})
+                walk(sub, under_repeat or unb)
+            elif op == sre_parse.SUBPATTERN:
+                walk(av[-1], under_repeat)
+            elif op == sre_parse.BRANCH:
+                for b in av[1]:
+                    walk(b, under_repeat)
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                walk(av[1], under_repeat)
+            prev = (op, av)
+
+    tree = sre_parse.parse(pattern, flags)
+    walk(list(tree), False)
+    first = list(tree)[0] if len(tree) else None
+    if first is not None and _unbounded(*first) and _broad(first[1][2]):
+        issues.append({"risk": "quadratic", "why": "leading unbounded wildcard: search() rescans from every offset"})
+    n = len(top_level_branches(pattern))
+    if n > 10:
+        issues.append({"risk": "info", "why": f"{n} alternatives; consider a word-set lookup"})
+    return issues
+
+
+# ---------- timing ----------
+
+def time_search(pat, texts, repeat=3):
+    """best-of-repeat seconds per text"""
+    out = np.empty(len(texts))
+    for i, t in enumerate(texts):
+        best = math.inf
+        for _ in range(repeat):
+            t0 = time.perf_counter(); pat.search(t); best = min(best, time.perf_counter() - t0)
+        out[i] = best
+    return out
+
+
+def adversarial_inputs(pattern, corpus, size):
+    """name -> text of ~size chars built to make the pattern work hard.
+    corpus: texts the pattern does *not* match, so the search has to scan to the end."""
+    rng = np.random.default_rng(size)
+    words = [w for b in top_level_branches(pattern) for w in re.findall(r"[A-Za-z']{2,}", b)[:1]]
+    prefix = " ".join(words) or "a"
+    sample = " ".join(rng.choice(corpus, size=min(len(corpus), 200)))
+    return {
+        "corpus_repeat": (sample * (size // max(len(sample), 1) + 1))[:size],
+        # the first word of every alternative, never completed: every offset starts a partial match
+        "near_miss": ((prefix + " ") * (size // (len(prefix) + 1) + 1))[:size],
+        "whitespace_run": "a" + " " * (size - 2) + "b",
+        "random_letters": "".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz "), size=size)),
+    }
+
+
+def growth(sizes, seconds):
+    """slope of log(time) vs log(size): 1 linear, 2 quadratic"""
+    s, t = np.log(sizes), np.log(np.maximum(seconds, 1e-9))
+    return float(np.polyfit(s, t, 1)[0])
+
+
+# ---------- precision ----------
+
+def hit_stats(pat, texts, labels, cls):
+    hits = np.fromiter((pat.search(t) is not None for t in texts), bool, len(texts))
+    row = {"hits": int(hits.sum()), "hit_rate": float(hits.mean()) if len(texts) else 0.0}
+    if cls is not None and labels is not None:
+        row["precision"] = float((labels[hits] == cls).mean()) if hits.any() else None
+        row["recall"] = float(hits[labels == cls].mean()) if (labels == cls).any() else None
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--train", default=str(TRAIN_CSV))
+    ap.add_argument("--corpus", default=str(CORPUS_CSV))
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(ADVERSARIAL_SIZES))
+    ap.add_argument("--out", default=str(OUT/"rule_audit.json"))
+    ap.add_argument("--fail-on-risk", action="store_true", help="exit 1 when a pattern is flagged")
+    args = ap.parse_args()
+
+    corpus = pd.read_csv(args.corpus)["text"].dropna().astype(str).tolist()
+    train = pd.read_csv(args.train) if Path(args.train).exists() else None
+    tr_texts = train["text"].fillna("").astype(str).tolist() if train is not None else []
+    tr_labels = train["label"].astype(int).to_numpy() if train is not None else None
+
+    report, flagged = [], 0
+    for (pattern, flags), meta in find_patterns().items():
+        pat = re.compile(pattern, flags)
+        cls = next((CLASS_OF[n] for n in meta["names"] if n in CLASS_OF), None)
+        row = {"names": meta["names"], "where": meta["where"], "pattern": pattern, "class": cls,
+               "lint": lint(pattern, flags)}
+
+        sec = time_search(pat, corpus)
+        row["corpus"] = {"texts": len(corpus), "mean_us": 1e6 * float(sec.mean()),
+                         "p99_us": 1e6 * float(np.percentile(sec, 99)), "max_us": 1e6 * float(sec.max()),
+                         "mb_per_s": sum(map(len, corpus)) / 2**20 / float(sec.sum())}
+
+        adv = {}
+        misses = [t for t in corpus if pat.search(t) is None] or ["a"]
+        inputs = {n: adversarial_inputs(pattern, misses, n) for n in args.sizes}
+        for name, text in inputs[args.sizes[0]].items():
+            if pat.search(text):   # matches early, so it says nothing about worst-case scanning
+                adv[name] = {"skipped": "input matches the pattern"}; continue
+            secs = [float(time_search(pat, [inputs[n][name]], repeat=1)[0]) for n in args.sizes]
+            adv[name] = {"ms": dict(zip(map(str, args.sizes), (1000 * s for s in secs))),
+                         "growth": growth(args.sizes, secs)}
+            if adv[name]["growth"] > GROWTH_LIMIT:
+                row["lint"].append({"risk": "superlinear", "why": f"{name}: time grows ~n^{adv[name]['growth']:.1f}"})
+        row["adversarial"] = adv
+
+        if train is not None:
+            row["train"] = hit_stats(pat, tr_texts, tr_labels, cls)
+            branches = top_level_branches(pattern)
+            if len(branches) > 1:
+                row["branches"] = {b: hit_stats(re.compile(b, flags), tr_texts, tr_labels, cls) for b in branches}
+
+        risky = [i for i in row["lint"] if i["risk"] != "info"]
+        flagged += bool(risky)
+        report.append(row)
+
+        tr = row.get("train", {})
+        prec = tr.get("precision")
+        print(f"[rules] {'/'.join(meta['names']):<18} {len(pattern):>4} chars  "
+              f"corpus mean={row['corpus']['mean_us']:6.1f}us p99={row['corpus']['p99_us']:6.1f}us  "
+              f"worst adversarial={max((max(a['ms'].values()) for a in adv.values() if 'ms' in a), default=0):7.1f}ms  "
+              f"hits={tr.get('hits', '-')} precision={'-' if prec is None else f'{prec:.2f}'}  "
+              f"{'RISK: ' + '; '.join(i['why'] for i in risky) if risky else 'ok'}")
+        for b, st in row.get("branches", {}).items():
+            if st["hits"] == 0 or (st.get("precision") is not None and st["precision"] < 0.5):
+                print(f"          branch {b!r}: hits={st['hits']} precision={st.get('precision')}")
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"[rules] {len(report)} patterns, {flagged} flagged -> {args.out}")
+    if args.fail_on_risk and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
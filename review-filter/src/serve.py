@@ -0,0 +1,87 @@
+"""Multi-worker FastAPI server with the models loaded once (see src/shared_models.py).
+
+    python src/serve.py --workers 4 --port 8000
+
+Re-exports the TF-IDF/LR (and student) weights to models/shared/ when their
+model.joblib changed, starts the DistilBERT inference process when
+models/distilbert exists, then runs `uvicorn src.app:app --workers N` with
+SHARED_MODELS / BERT_WORKER set so every worker attaches to them read-only.
+"""
+import argparse, multiprocessing as mp, os, shutil, sys, tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# the supervisor only starts processes and waits: model code is imported in the children,
+# so it doesn't hold its own ~150MB of numpy/sklearn next to the workers
+
+
+def _export_main():
+    import joblib
+    from src.utils import TFIDF_MODEL, STUDENT_MODEL
+    from src.shared_models import SHARED_DIR, export_pipeline, is_current
+    for name, source in (("tfidf_lr", TFIDF_MODEL), ("student", STUDENT_MODEL)):
+        if source.exists() and not is_current(SHARED_DIR/name, source):
+            export_pipeline(joblib.load(source), SHARED_DIR/name, source)
+            print(f"[serve] exported {source} -> {SHARED_DIR/name}")
+
+
+def _bert_main(address, authkey, ready):
+    from src.shared_models import bert_worker
+    bert_worker(address, authkey, ready)
+
+
+def export_all():
+    p = mp.get_context("spawn").Process(target=_export_main)
+    p.start(); p.join()
+    if p.exitcode:
+        sys.exit(f"[serve] exporting the models failed (exit code {p.exitcode})")
+
+
+def start_bert(timeout=300):
+    """-> (process, env vars for the request workers), or (None, {}) without a trained DistilBERT"""
+    address = os.path.join(tempfile.mkdtemp(prefix="review-bert-"), "bert.sock")
+    key = os.urandom(16)
+    ctx = mp.get_context("spawn")
+    ours, theirs = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_bert_main, args=(address, key, theirs), name="bert-worker", daemon=True)
+    proc.start()
+    if not ours.poll(timeout):
+        proc.terminate()
+        raise TimeoutError(f"DistilBERT worker did not start within {timeout}s")
+    if not ours.recv():
+        proc.join()
+        shutil.rmtree(Path(address).parent, ignore_errors=True)
+        print("[serve] no DistilBERT in models/distilbert: cascade mode will answer 503")
+        return None, {}
+    print(f"[serve] DistilBERT worker pid={proc.pid} at {address}")
+    return proc, {"BERT_WORKER": address, "BERT_WORKER_KEY": key.hex()}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--no-bert", action="store_true", help="don't start the DistilBERT worker (cascade mode answers 503)")
+    ap.add_argument("--log-level", default="warning")
+    args = ap.parse_args()
+
+    export_all()
+    os.environ["SHARED_MODELS"] = "models/shared"
+    bert = None
+    if not args.no_bert:
+        bert, env = start_bert()
+        os.environ.update(env)
+
+    import uvicorn
+    try:
+        uvicorn.run("src.app:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+    finally:
+        if bert is not None:
+            bert.terminate(); bert.join(10)
+            shutil.rmtree(Path(os.environ["BERT_WORKER"]).parent, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
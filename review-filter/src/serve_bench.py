@@ -0,0 +1,110 @@
+"""Per-worker memory and throughput scaling: one model copy per worker vs shared models.
+
+For each target (fastapi: `uvicorn --workers N`, shared: src/serve.py) and each
+worker count, starts the server, drives /predict/ with single test reviews at
+2 x workers concurrency and then reads every process's memory:
+
+    rss  resident pages, shared ones counted in every process that maps them
+    pss  shared pages split between the processes mapping them (sums to the real total)
+    uss  pages only this process has
+
+    python src/serve_bench.py --workers 1 2 4 --duration 15
+    python src/serve_bench.py --workers 1 2 4 --similar     # with the similarity index in every worker
+
+The TF-IDF/LR model itself is a few MB (its vocabulary is capped by max_features),
+so on its own most of a worker's memory is the interpreter and libraries, which
+no serving mode can share. The savings show with the large per-worker structures:
+the similarity index (--similar) and DistilBERT in cascade mode.
+"""
+import argparse, asyncio, json, sys
+from pathlib import Path
+import numpy as np, pandas as pd, psutil
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.loadtest import TEST_CSV, DEFAULT_PATH, drive, free_port, make_payloads, start_server, stop_server
+
+OUT = Path("outputs/metrics"); OUT.mkdir(parents=True, exist_ok=True)
+
+
+def role(p, root):
+    try:
+        if any(str(c.laddr).endswith("bert.sock") for c in p.net_connections(kind="unix")):
+            return "bert"
+        if "resource_tracker" in " ".join(p.cmdline()):
+            return "helper"
+    except psutil.Error:
+        return "gone"
+    return "supervisor" if p.pid == root.pid else "worker"
+
+
+def process_memory(pid):
+    """one row per process of the server tree (MB)"""
+    root = psutil.Process(pid)
+    rows = []
+    for p in [root, *root.children(recursive=True)]:
+        try:
+            m = p.memory_full_info()
+        except psutil.Error:
+            continue
+        rows.append({"pid": p.pid, "role": role(p, root),
+                     "rss_mb": m.rss / 2**20, "pss_mb": m.pss / 2**20, "uss_mb": m.uss / 2**20})
+    if not any(r["role"] == "worker" for r in rows):   # --workers 1 serves from the main process
+        for r in rows:
+            if r["role"] == "supervisor": r["role"] = "worker"
+    return rows
+
+
+def bench(target, workers, payloads, duration, warmup, similar=None):
+    port = free_port()
+    proc = start_server(target, port, workers)
+    url = f"http://127.0.0.1:{port}{DEFAULT_PATH[target]}"
+    try:
+        if similar:   # enough /similar/ calls that every worker has loaded the index
+            asyncio.run(drive(f"http://127.0.0.1:{port}/similar/", similar, 4 * workers, warmup))
+        asyncio.run(drive(url, payloads, workers, warmup))
+        lat, status, errors, wall = asyncio.run(drive(url, payloads, 2 * workers, duration))
+        procs = process_memory(proc.pid)
+    finally:
+        stop_server(proc)
+    w = [p for p in procs if p["role"] == "worker"]
+    return {"target": target, "workers": workers, "reviews_per_s": len(lat) / wall,
+            "p95_ms": float(np.percentile(1000 * np.asarray(lat), 95)), "errors": errors,
+            "worker_rss_mb": float(np.mean([p["rss_mb"] for p in w])),
+            "worker_pss_mb": float(np.mean([p["pss_mb"] for p in w])),
+            "worker_uss_mb": float(np.mean([p["uss_mb"] for p in w])),
+            "total_pss_mb": float(sum(p["pss_mb"] for p in procs)),
+            "processes": procs}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--targets", nargs="+", default=["fastapi", "shared"], choices=["fastapi", "shared"])
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--duration", type=float, default=15.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--similar", action="store_true",
+                    help="load the similarity index (data/index/similarity.joblib) in every worker before measuring")
+    ap.add_argument("--out", default=str(OUT/"serve_bench.json"))
+    args = ap.parse_args()
+
+    texts = pd.read_csv(TEST_CSV)["text"].astype(str).tolist()
+    payloads = make_payloads(texts, np.array([1]), np.array([1.0]), batch=False, n=5000)
+    similar = [{"text": t, "k": 10} for t in texts[:500]] if args.similar else None
+    runs = []
+    for target in args.targets:
+        base = None
+        for w in args.workers:
+            r = bench(target, w, payloads, args.duration, args.warmup, similar)
+            base = base or r["reviews_per_s"] / w
+            r["scaling"] = r["reviews_per_s"] / (base * w)   # 1.0 = linear in workers
+            runs.append(r)
+            print(f"[serve] {target:<8} workers={w:<2} {r['reviews_per_s']:7.0f} reviews/s (x{r['scaling'] * w:.2f})  "
+                  f"per worker rss={r['worker_rss_mb']:.0f}MB pss={r['worker_pss_mb']:.0f}MB uss={r['worker_uss_mb']:.0f}MB  "
+                  f"total pss={r['total_pss_mb']:.0f}MB")
+    report = {"cpus": psutil.cpu_count(), "duration_s": args.duration, "similar": args.similar, "runs": runs}
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"[serve] wrote -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Models shared by all workers of a multi-worker server (src/serve.py).
+
+`uvicorn --workers N` unpickles model.joblib (and the student) N times and,
+with the cascade, loads N copies of DistilBERT. In shared mode:
+
+  * the TF-IDF/LR and student weights are exported once to .npy files and every
+    worker opens them with np.load(mmap_mode="r"), so the pages are shared
+    through the page cache instead of copied per worker:
+
+        models/shared/<name>/meta.json   vectorizer params + source fingerprint
+                             terms.npy   TF-IDF vocabulary, sorted (fixed-width unicode)
+                             cols.npy    feature column of each sorted term
+                             idf.npy     idf weights
+                             coef.npy, intercept.npy, classes.npy   (LogisticRegression)
+
+    The vocabulary dict is the one part of a fitted TfidfVectorizer that isn't
+    an array; SharedTfidf looks terms up by binary search in terms.npy instead.
+
+  * DistilBERT lives in one inference process (bert_worker) that all request
+    workers call over a local socket (BertClient), instead of one copy each.
+"""
+import hashlib, json, os, threading, traceback
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import normalize
+
+SHARED_DIR = Path("models/shared")
+
+
+def file_fingerprint(path):
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()[:16]
+
+
+def _params(est):
+    """constructor params that survive json (dtype as its name)"""
+    p = est.get_params()
+    p["dtype"] = np.dtype(p["dtype"]).name
+    if "ngram_range" in p:
+        p["ngram_range"] = list(p["ngram_range"])
+    return p
+
+
+# ---------- export (supervisor, once) ----------
+
+def export_pipeline(clf, out_dir, source):
+    """vectorizer + LogisticRegression pipeline -> .npy arrays and meta.json in out_dir"""
+    out = Path(out_dir); out.mkdir(parents=True, exist_ok=True)
+    (vec_name, vec), (_, lr) = clf.steps
+    meta = {"source": str(source), "fingerprint": file_fingerprint(source),
+            "vectorizer": type(vec).__name__, "vectorizer_step": vec_name,
+            "vectorizer_params": _params(vec), "lr_params": lr.get_params()}
+    if isinstance(vec, TfidfVectorizer):
+        terms = np.array(list(vec.vocabulary_), dtype=str)
+        cols = np.fromiter(vec.vocabulary_.values(), np.int64, len(terms))
+        order = np.argsort(terms)
+        np.save(out/"terms.npy", terms[order]); np.save(out/"cols.npy", cols[order])
+        if vec.use_idf:
+            np.save(out/"idf.npy", vec.idf_)
+    elif not isinstance(vec, HashingVectorizer):
+        raise TypeError(f"can't share a {type(vec).__name__} (only TfidfVectorizer / HashingVectorizer)")
+    np.save(out/"coef.npy", lr.coef_); np.save(out/"intercept.npy", lr.intercept_)
+    np.save(out/"classes.npy", lr.classes_)
+    (out/"meta.json").write_text(json.dumps(meta, indent=2))
+
+
+def is_current(out_dir, source):
+    meta = Path(out_dir)/"meta.json"
+    return meta.exists() and json.loads(meta.read_text())["fingerprint"] == file_fingerprint(source)
+
+
+# ---------- attach (request workers) ----------
+
+class SharedTfidf:
+    """TfidfVectorizer.transform over memory-mapped vocabulary/idf arrays."""
+    def __init__(self, path):
+        path = Path(path)
+        meta = json.loads((path/"meta.json").read_text())
+        params = {**meta["vectorizer_params"], "ngram_range": tuple(meta["vectorizer_params"]["ngram_range"]),
+                  "dtype": np.dtype(meta["vectorizer_params"]["dtype"]).type}
+        self._vec = TfidfVectorizer(**params)     # unfitted: analyzer and params only
+        self.analyzer = self._vec.build_analyzer()
+        self.terms = np.load(path/"terms.npy", mmap_mode="r")
+        self.cols = np.load(path/"cols.npy", mmap_mode="r")
+        self.idf_ = np.load(path/"idf.npy", mmap_mode="r") if self._vec.use_idf else None
+        self.dtype = params["dtype"]
+
+    def transform(self, texts):
+        docs = [self.analyzer(t) for t in texts]
+        toks = np.array([t for d in docs for t in d], dtype=str)
+        rows = np.repeat(np.arange(len(docs)), [len(d) for d in docs])
+        pos = np.searchsorted(self.terms, toks) if len(toks) else np.zeros(0, dtype=np.int64)
+        pos = np.minimum(pos, len(self.terms) - 1)
+        hit = self.terms[pos] == toks if len(toks) else np.zeros(0, dtype=bool)
+        X = sp.csr_matrix((np.ones(hit.sum(), dtype=self.dtype), (rows[hit], self.cols[pos[hit]])),
+                          shape=(len(docs), len(self.terms)), dtype=self.dtype)
+        X.sum_duplicates()
+        # TfidfTransformer.transform
+        if self._vec.binary:
+            X.data[:] = 1
+        if self._vec.sublinear_tf:
+            np.log(X.data, X.data); X.data += 1.0
+        if self._vec.use_idf:
+            X.data *= self.idf_[X.indices]
+        if self._vec.norm is not None:
+            X = normalize(X, norm=self._vec.norm, copy=False)
+        return X
+
+    # enough of the TfidfVectorizer API for vectorizer_fingerprint / SimilarityIndex.
+    # Deliberately no vocabulary_: a dict would be a private copy in every worker.
+    @property
+    def n_terms(self):
+        return len(self.terms)
+
+    def get_params(self, deep=True):
+        return self._vec.get_params(deep)
+
+    def get_feature_names_out(self):
+        return np.asarray(self.terms)[np.argsort(self.cols)].astype(object)
+
+
+def shared_lr(path):
+    """LogisticRegression whose coef_/intercept_ are read-only memory maps"""
+    path = Path(path)
+    meta = json.loads((path/"meta.json").read_text())
+    lr = LogisticRegression(**meta["lr_params"])
+    lr.coef_ = np.load(path/"coef.npy", mmap_mode="r")
+    lr.intercept_ = np.load(path/"intercept.npy", mmap_mode="r")
+    lr.classes_ = np.load(path/"classes.npy")
+    lr.n_features_in_ = lr.coef_.shape[1]
+    return lr
+
+
+def load_pipeline(path):
+    """-> (vectorizer, lr) for a TF-IDF export, Pipeline for a hashing (student) export"""
+    meta = json.loads((Path(path)/"meta.json").read_text())
+    lr = shared_lr(path)
+    if meta["vectorizer"] == "TfidfVectorizer":
+        return SharedTfidf(path), lr
+    params = {**meta["vectorizer_params"], "ngram_range": tuple(meta["vectorizer_params"]["ngram_range"]),
+              "dtype": np.dtype(meta["vectorizer_params"]["dtype"]).type}
+    return Pipeline([(meta["vectorizer_step"], HashingVectorizer(**params)), ("clf", lr)])
+
+
+# ---------- DistilBERT inference process ----------
+
+def bert_worker(address, authkey, ready):
+    """Load DistilBERT once and score texts for every request worker.
+    ready: pipe end, gets True once listening (False, and return, without a model).
+    Runs until killed; one thread per connection, forward passes one at a time."""
+    from src.utils import BERT_WINDOWS, load_bert, bert_proba
+    tok, mdl = load_bert()
+    if mdl is None:
+        ready.send(False)
+        return
+    lock = threading.Lock()
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    ready.send(True)
+
+    def serve(conn):
+        with conn:
+            while True:
+                try:
+                    texts = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    with lock:
+                        conn.send(("ok", bert_proba(tok, mdl, texts, **BERT_WINDOWS)))
+                except Exception:
+                    conn.send(("error", traceback.format_exc(limit=3)))
+
+    while True:
+        threading.Thread(target=serve, args=(listener.accept(),), daemon=True).start()
+
+
+class BertClient:
+    """bert_proba over the shared inference process; one connection per worker process."""
+    def __init__(self, address, authkey):
+        self.address, self.authkey = address, authkey
+        self.conn, self.lock = None, threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        address = os.environ.get("BERT_WORKER")
+        return cls(address, bytes.fromhex(os.environ["BERT_WORKER_KEY"])) if address else None
+
+    def __call__(self, texts):
+        with self.lock:
+            try:
+                if self.conn is None:
+                    self.conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                self.conn.send(list(texts))
+                status, out = self.conn.recv()
+            except (EOFError, OSError) as e:
+                # worker died or restarted: drop the socket so the next call reconnects
+                if self.conn is not None:
+                    try:
+                        self.conn.close()
+                    except OSError:
+                        pass
+                self.conn = None
+                raise RuntimeError(f"bert worker unreachable: {e!r}") from e
+        if status != "ok":
+            raise RuntimeError(f"bert worker failed:\n{out}")
+        return out
+
@@ -0,0 +1,262 @@
+""""Similar reviews" search over the L2-normalised TF-IDF vectors of the corpus.
+
+The index is an inverted file: for every vocabulary term the reviews containing
+it, sorted by term weight (impact-ordered postings). A query keeps its heaviest
+terms (term_mass of its squared norm, at most max_terms), takes the top
+max_postings reviews of each of those postings lists as candidates and re-scores
+the candidates exactly (cosine = dot product, vectors are unit length).
+
+New reviews go to a small unsorted delta segment that is scanned brute force and
+folded into the postings once it grows past delta_limit rows.
+
+Inserts only change the index of the process that makes them, and save()
+replaces the file with that process' copy: add from one writer (this script's
+`add`, or a single-worker server) so concurrent writers can't drop each
+other's reviews.
+
+    python src/similarity.py build data/processed/cleaned.csv
+    python src/similarity.py query "Book now and get 20% off" -k 5
+    python src/similarity.py add new_reviews.csv
+"""
+import argparse, json, os, sys, time
+from pathlib import Path
+import numpy as np, pandas as pd, joblib
+import scipy.sparse as sp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils import TFIDF_MODEL, LABELS, bulk_score, text_id
+from src.feature_store import vectorizer_fingerprint
+
+SIMILARITY_INDEX = Path("data/index/similarity.joblib")
+DEFAULT_CSV = Path("data/processed/cleaned.csv")
+
+
+def impact_ordered(X):
+    """CSR [n, V] -> (indptr, rows): per term, rows sorted by weight descending."""
+    C = X.tocsc()
+    cols = np.repeat(np.arange(C.shape[1]), np.diff(C.indptr))
+    order = np.lexsort((-C.data, cols))
+    return C.indptr.astype(np.int64), C.indices[order].astype(np.int32)
+
+
+def n_terms(vec):
+    """vocabulary size; SharedTfidf (src/shared_models.py) has no vocabulary_ dict"""
+    return vec.n_terms if hasattr(vec, "n_terms") else len(vec.vocabulary_)
+
+
+class SimilarityIndex:
+    def __init__(self, vectorizer, delta_limit=50_000):
+        self.vec = vectorizer
+        self.fingerprint = vectorizer_fingerprint(vectorizer)
+        self.delta_limit = delta_limit
+        V = n_terms(vectorizer)
+        self.X = sp.csr_matrix((0, V), dtype=np.float32)       # postings segment (rows)
+        self.post_indptr = np.zeros(V + 1, dtype=np.int64)
+        self.post_rows = np.zeros(0, dtype=np.int32)
+        self.delta = []                                         # unsorted segment, list of CSR blocks
+        self.n_delta = 0
+        self.ids, self.labels, self.texts = [], [], []
+        self.pos = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def transform(self, texts):
+        return self.vec.transform(texts).astype(np.float32)
+
+    # ---------- insertion ----------
+
+    def add(self, ids, texts, labels=None, compact=True):
+        """Insert reviews (ids already in the index are skipped). -> number added"""
+        ids = [str(i) for i in ids]
+        keep, seen = [], set()
+        for j, i in enumerate(ids):
+            if i not in self.pos and i not in seen:
+                seen.add(i); keep.append(j)
+        if not keep:
+            return 0
+        texts = [str(texts[j]) for j in keep]
+        labels = [-1] * len(keep) if labels is None else [int(labels[j]) for j in keep]
+        Xn = self.transform(texts)
+        for j in keep:
+            self.pos[ids[j]] = len(self.ids); self.ids.append(ids[j])
+        self.labels.extend(labels); self.texts.extend(texts)
+        self.delta.append(Xn); self.n_delta += Xn.shape[0]
+        if compact and self.n_delta > self.delta_limit:
+            self.compact()
+        return len(keep)
+
+    def _delta_matrix(self):
+        if len(self.delta) > 1:
+            self.delta = [sp.vstack(self.delta, format="csr")]
+        return self.delta[0] if self.delta else None
+
+    def compact(self):
+        """Fold the delta segment into the impact-ordered postings."""
+        D = self._delta_matrix()
+        if D is None:
+            return
+        self.X = sp.vstack([self.X, D], format="csr")
+        self.post_indptr, self.post_rows = impact_ordered(self.X)
+        self.delta, self.n_delta = [], 0
+
+    # ---------- search ----------
+
+    def _candidates(self, terms, max_postings):
+        starts = self.post_indptr[terms]
+        ends = np.minimum(self.post_indptr[terms + 1], starts + max_postings)
+        if not len(terms) or (ends - starts).sum() == 0:
+            return np.zeros(0, dtype=np.int32)
+        # dedupe with a bitmap over the rows: cheaper than np.unique for 10^4-10^5 candidates
+        seen = np.zeros(self.X.shape[0], dtype=bool)
+        for s, e in zip(starts, ends):
+            seen[self.post_rows[s:e]] = True
+        return np.flatnonzero(seen)
+
+    def search_vector(self, q, k=10, min_score=0.0, max_terms=12, term_mass=0.95, max_postings=5000, exclude=None):
+        """q: 1 x V CSR row. -> [(row, score)] best first"""
+        w, terms = q.data, q.indices
+        order = np.argsort(-w)
+        cum = np.cumsum(w[order] ** 2)
+        n_terms = min(int(np.searchsorted(cum, term_mass * cum[-1])) + 1, max_terms) if len(cum) else 0
+        qd = q.toarray().ravel()
+
+        rows = self._candidates(terms[order[:n_terms]].astype(np.int64), max_postings)
+        scores = self.X[rows] @ qd if len(rows) else np.zeros(0, dtype=np.float32)
+        D = self._delta_matrix()
+        if D is not None:
+            rows = np.concatenate([rows, self.X.shape[0] + np.arange(D.shape[0])])
+            scores = np.concatenate([scores, D @ qd])
+        if exclude is not None:
+            scores = np.where(rows == exclude, -1.0, scores)
+
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top if scores[i] > 0 and scores[i] >= min_score]
+
+    def row_vector(self, row):
+        if row < self.X.shape[0]:
+            return self.X[row]
+        return self._delta_matrix()[row - self.X.shape[0]]
+
+    def search(self, text=None, id=None, k=10, min_score=0.0, **kw):
+        """Neighbours of a text, or of an indexed review (itself excluded)."""
+        if id is not None:
+            row = self.pos.get(str(id))
+            if row is None:
+                raise KeyError(f"review {id} is not indexed")
+            q, exclude = self.row_vector(row), row
+        else:
+            q, exclude = self.transform([text]), None
+        return [{"id": self.ids[r], "score": s, "label": self.labels[r],
+                 "label_name": LABELS.get(self.labels[r]), "text": self.texts[r]}
+                for r, s in self.search_vector(q, k, min_score, exclude=exclude, **kw)]
+
+    # ---------- persistence ----------
+
+    def save(self, path=SIMILARITY_INDEX):
+        # write a temp file and swap it in: other processes may have the old file memory-mapped
+        # (SimilarityIndex.load(mmap_mode="r")), and truncating it under them is a SIGBUS
+        path = Path(path); path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+        joblib.dump({"fingerprint": self.fingerprint, "delta_limit": self.delta_limit, "X": self.X,
+                     "post_indptr": self.post_indptr, "post_rows": self.post_rows,
+                     "delta": self._delta_matrix(), "ids": np.array(self.ids, dtype=object),
+                     "labels": np.array(self.labels, dtype=np.int8), "texts": np.array(self.texts, dtype=object)},
+                    tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, vectorizer, path=SIMILARITY_INDEX, mmap_mode=None):
+        """mmap_mode="r": the postings and vectors stay on disk, shared between processes"""
+        state = joblib.load(path, mmap_mode=mmap_mode)
+        idx = cls(vectorizer, state["delta_limit"])
+        if state["fingerprint"] != idx.fingerprint:
+            raise ValueError(f"{path} was built with a different TF-IDF vectorizer; rebuild it "
+                             "(python src/similarity.py build ...).")
+        idx.X, idx.post_indptr, idx.post_rows = (state[k] for k in ("X", "post_indptr", "post_rows"))   # older files also have post_vals
+        if state["delta"] is not None:
+            idx.delta, idx.n_delta = [state["delta"]], state["delta"].shape[0]
+        idx.ids, idx.labels, idx.texts = list(state["ids"]), state["labels"].tolist(), list(state["texts"])
+        idx.pos = {i: r for r, i in enumerate(idx.ids)}
+        return idx
+
+
+def read_reviews(path, clf, text_col="text"):
+    """ids, texts, labels from a csv; reviews without a label are scored with the ensemble.
+    Without an id column the id is a hash of the text (text_id): row numbers would repeat
+    in every file, and `add` would skip a second file's reviews as already indexed."""
+    df = pd.read_csv(path).dropna(subset=[text_col])
+    ids = df["id"].astype(str) if "id" in df else df[text_col].map(text_id)
+    labels = pd.to_numeric(df["label"], errors="coerce") if "label" in df else pd.Series(np.nan, index=df.index)
+    missing = labels.isna().to_numpy()
+    if missing.any():
+        labels[missing] = bulk_score(clf, df.loc[missing, text_col])[0]
+    return ids.tolist(), df[text_col].astype(str).tolist(), labels.astype(int).tolist()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", default=str(SIMILARITY_INDEX))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="(re)build the index from csv files")
+    b.add_argument("paths", nargs="*", default=[str(DEFAULT_CSV)])
+    b.add_argument("--synthetic", type=int, default=0, help="add N synthetic reviews (src/benchmark.py) for scale tests")
+    a = sub.add_parser("add", help="insert new reviews into an existing index")
+    a.add_argument("paths", nargs="+")
+    q = sub.add_parser("query")
+    q.add_argument("text", nargs="?")
+    q.add_argument("--id", default=None)
+    q.add_argument("-k", type=int, default=10)
+    q.add_argument("--min-score", type=float, default=0.0)
+    bn = sub.add_parser("bench", help="query latency for random indexed reviews")
+    bn.add_argument("--queries", type=int, default=500)
+    bn.add_argument("-k", type=int, default=10)
+    for p in (b, a):
+        p.add_argument("--text-col", default="text")
+    args = ap.parse_args()
+
+    clf = joblib.load(TFIDF_MODEL)
+    vec = clf.named_steps["tfidf"]
+
+    if args.cmd == "build":
+        idx = SimilarityIndex(vec)
+        for p in args.paths:
+            n = idx.add(*read_reviews(p, clf, args.text_col), compact=False)
+            print(f"[similar] {p}: {n} reviews")
+        if args.synthetic:
+            from src.benchmark import synthetic_corpus
+            texts = synthetic_corpus(args.synthetic, seed=args.synthetic)
+            for s in range(0, len(texts), 200_000):
+                chunk = texts[s:s+200_000]
+                idx.add([f"syn-{s+i}" for i in range(len(chunk))], chunk, bulk_score(clf, chunk)[0], compact=False)
+            print(f"[similar] synthetic: {args.synthetic:,} reviews")
+        t0 = time.perf_counter(); idx.compact()
+        print(f"[similar] postings for {len(idx):,} reviews, nnz={idx.X.nnz:,} in {time.perf_counter()-t0:.1f}s")
+        idx.save(args.index)
+        print(f"[similar] wrote -> {args.index}")
+        return
+
+    idx = SimilarityIndex.load(vec, args.index)
+    if args.cmd == "add":
+        for p in args.paths:
+            n = idx.add(*read_reviews(p, clf, args.text_col))
+            print(f"[similar] {p}: {n} new reviews ({idx.n_delta:,} in the delta segment)")
+        idx.save(args.index)
+    elif args.cmd == "query":
+        if args.text is None and args.id is None:
+            ap.error("query needs a text or --id")
+        t0 = time.perf_counter()
+        hits = idx.search(args.text, args.id, args.k, args.min_score)
+        print(json.dumps(hits, indent=2))
+        print(f"[similar] {len(idx):,} reviews searched in {1000*(time.perf_counter()-t0):.1f}ms")
+    else:
+        from src.benchmark import latency_stats, time_calls
+        rows = np.random.default_rng(0).integers(0, len(idx), size=args.queries)
+        st = latency_stats(time_calls(lambda r: idx.search(id=idx.ids[r], k=args.k), rows))
+        print(f"[similar] {len(idx):,} reviews  p50={st['p50_ms']:.2f}ms  p95={st['p95_ms']:.2f}ms  "
+              f"p99={st['p99_ms']:.2f}ms  {st['throughput_per_s']:,.0f} queries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Batch codecs for POST /predict/batch (src/app.py) and its clients.
+
+One request carries many reviews and the results come back as packed arrays
+instead of one JSON object per review:
+
+    application/msgpack                   {"texts": [...], "ids": [...]}   (ids optional)
+        -> {"n", "label_id": uint8 bytes [n], "confidence": float32 bytes [n],
+            "proba": float32 bytes [n, 4] (with ?proba=true), "ids", "labels"}
+    application/vnd.apache.arrow.stream   record batches with a text [and id] column
+        -> one record batch: id, label_id uint8, confidence float32,
+           proba fixed_size_list<float32>[4] (with ?proba=true)
+    application/json                      {"texts": [...], "ids": [...]}
+        -> {"predictions": [{"id", "label_id", "label", "confidence", "proba"}, ...]}
+
+Packed arrays are little-endian; read them with np.frombuffer. msgpack and
+pyarrow are optional: a missing one only disables its content type.
+
+    from src import transport
+    body = transport.encode_request(transport.MSGPACK, texts, ids)
+    r = httpx.post(url + "/predict/batch", content=body, headers={"content-type": transport.MSGPACK})
+    ids, pred, confidence, proba = transport.decode_response(transport.MSGPACK, r.content)
+"""
+import json
+import numpy as np
+
+from src.utils import LABELS, NUM_ALL
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+JSON = "application/json"
+ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+REQUIRES = {MSGPACK: "msgpack", ARROW: "pyarrow"}
+
+
+def media_type(content_type):
+    """Content-Type header -> MSGPACK / ARROW / JSON, or None if it isn't one of them"""
+    mt = (content_type or JSON).split(";")[0].strip().lower()
+    mt = ALIASES.get(mt, mt)
+    return mt if mt in (MSGPACK, ARROW, JSON) else None
+
+
+def available(media):
+    return {MSGPACK: msgpack is not None, ARROW: pa is not None}.get(media, True)
+
+
+def _texts_ids(texts, ids):
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        raise ValueError('"texts" must be a list of strings')
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) != len(texts):
+            raise ValueError('"ids" must be a list as long as "texts"')
+        ids = [str(i) for i in ids]
+    return texts, ids
+
+
+def _arrow_stream(cols):
+    """{name: pa.Array} -> Arrow IPC stream bytes with a single record batch"""
+    batch = pa.record_batch(list(cols.values()), names=list(cols))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as w:
+        w.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+# ---------- server side ----------
+
+def decode_request(media, body):
+    """-> (texts, ids or None). Raises ValueError on a malformed body."""
+    if media == ARROW:
+        try:
+            table = pa.ipc.open_stream(body).read_all()
+        except (pa.ArrowInvalid, OSError) as e:
+            raise ValueError(f"not an Arrow IPC stream: {e}")
+        if "text" not in table.column_names:
+            raise ValueError('Arrow batch needs a "text" column')
+        texts = [t or "" for t in table.column("text").to_pylist()]
+        ids = table.column("id").to_pylist() if "id" in table.column_names else None
+        return _texts_ids(texts, ids)
+    try:
+        obj = msgpack.unpackb(body, raw=False) if media == MSGPACK else json.loads(body)
+    except Exception as e:   # msgpack raises several unrelated exception types
+        raise ValueError(f"could not decode the {media} body: {e}")
+    if not isinstance(obj, dict) or "texts" not in obj:
+        raise ValueError('body must be a map with a "texts" list')
+    return _texts_ids(obj["texts"], obj.get("ids"))
+
+
+def encode_response(media, pred, proba, ids=None, with_proba=False):
+    """pred uint8 [n], proba float32 [n, 4] -> response body"""
+    pred = np.ascontiguousarray(pred, dtype="<u1")
+    proba = np.ascontiguousarray(proba, dtype="<f4")
+    conf = np.ascontiguousarray(proba[np.arange(len(pred)), pred])
+    if media == MSGPACK:
+        out = {"n": len(pred), "label_id": pred.tobytes(), "confidence": conf.tobytes(), "labels": list(LABELS.values())}
+        if with_proba:
+            out["proba"] = proba.tobytes()
+        if ids is not None:
+            out["ids"] = ids
+        return msgpack.packb(out, use_bin_type=True)
+    if media == ARROW:
+        cols = {"label_id": pa.array(pred), "confidence": pa.array(conf)}
+        if ids is not None:
+            cols = {"id": pa.array(ids, pa.string()), **cols}
+        if with_proba:
+            cols["proba"] = pa.FixedSizeListArray.from_arrays(pa.array(proba.ravel()), NUM_ALL)
+        return _arrow_stream(cols)
+    rows = [{"label_id": int(p), "label": LABELS[int(p)], "confidence": float(c)} for p, c in zip(pred, conf)]
+    if ids is not None:
+        for r, i in zip(rows, ids):
+            r["id"] = i
+    if with_proba:
+        for r, p in zip(rows, proba.tolist()):
+            r["proba"] = p
+    return json.dumps({"predictions": rows}).encode()
+
+
+# ---------- client side ----------
+
+def encode_request(media, texts, ids=None):
+    texts = [str(t) for t in texts]
+    ids = None if ids is None else [str(i) for i in ids]
+    if media == ARROW:
+        cols = {"text": pa.array(texts, pa.string())}
+        if ids is not None:
+            cols = {"id": pa.array(ids, pa.string()), **cols}
+        return _arrow_stream(cols)
+    obj = {"texts": texts} if ids is None else {"texts": texts, "ids": ids}
+    return msgpack.packb(obj, use_bin_type=True) if media == MSGPACK else json.dumps(obj).encode()
+
+
+def decode_response(media, body):
+    """-> (ids or None, pred uint8 [n], confidence float32 [n], proba float32 [n, 4] or None)"""
+    if media == MSGPACK:
+        obj = msgpack.unpackb(body, raw=False)
+        proba = np.frombuffer(obj["proba"], "<f4").reshape(-1, NUM_ALL) if "proba" in obj else None
+        return (obj.get("ids"), np.frombuffer(obj["label_id"], "<u1"),
+                np.frombuffer(obj["confidence"], "<f4"), proba)
+    if media == ARROW:
+        t = pa.ipc.open_stream(body).read_all()
+        proba = (t.column("proba").combine_chunks().flatten().to_numpy().reshape(-1, NUM_ALL)
+                 if "proba" in t.column_names else None)
+        return (t.column("id").to_pylist() if "id" in t.column_names else None,
+                t.column("label_id").to_numpy(), t.column("confidence").to_numpy(), proba)
+    rows = json.loads(body)["predictions"]
+    proba = np.array([r["proba"] for r in rows], dtype=np.float32) if rows and "proba" in rows[0] else None
+    return ([r["id"] for r in rows] if rows and "id" in rows[0] else None,
+            np.array([r["label_id"] for r in rows], dtype=np.uint8),
+            np.array([r["confidence"] for r in rows], dtype=np.float32), proba)
@@ -0,0 +1,139 @@
+"""JSON vs msgpack vs Arrow for batch clients of the FastAPI server.
+
+codec: in-process encode/decode cost of a batch on both sides (no models, no
+       network) and bytes on the wire per review.
+http:  starts src/app.py (uvicorn, prediction cache off) and pushes the same
+       reviews through /predict/ one JSON request per review, and through
+       /predict/batch as JSON, msgpack and Arrow batches. Reports reviews/s and
+       the CPU seconds spent per 1k reviews by the client and by the server.
+
+    python src/transport_bench.py --batch-size 256 --duration 10
+"""
+import argparse, json, sys, time
+from pathlib import Path
+import numpy as np, psutil
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src import transport
+from src.benchmark import synthetic_corpus
+from src.loadtest import free_port, start_server, stop_server
+
+OUT = Path("outputs/metrics"); OUT.mkdir(parents=True, exist_ok=True)
+FORMATS = {"json": transport.JSON, "msgpack": transport.MSGPACK, "arrow": transport.ARROW}
+
+
+def cpu_seconds(proc):
+    """user+system seconds of a process and its children"""
+    total = 0.0
+    for p in [proc, *proc.children(recursive=True)]:
+        try:
+            t = p.cpu_times(); total += t.user + t.system
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+def bench_codec(media, texts, with_proba, repeat=5):
+    """best-of-repeat seconds per stage for one batch, plus body sizes"""
+    n = len(texts)
+    ids = [f"r{i}" for i in range(n)]
+    rng = np.random.default_rng(0)
+    proba = rng.dirichlet(np.ones(transport.NUM_ALL), size=n).astype(np.float32)
+    pred = proba.argmax(axis=1).astype(np.uint8)
+    stages = {
+        "client_encode": lambda: transport.encode_request(media, texts, ids),
+        "server_decode": lambda: transport.decode_request(media, req),
+        "server_encode": lambda: transport.encode_response(media, pred, proba, ids, with_proba),
+        "client_decode": lambda: transport.decode_response(media, resp),
+    }
+    req = transport.encode_request(media, texts, ids)
+    resp = transport.encode_response(media, pred, proba, ids, with_proba)
+    out = {}
+    for name, fn in stages.items():
+        best = np.inf
+        for _ in range(repeat):
+            t0 = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t0)
+        out[f"{name}_us_per_review"] = 1e6 * best / n
+    out["request_bytes_per_review"] = len(req) / n
+    out["response_bytes_per_review"] = len(resp) / n
+    return out
+
+
+def drive(client, url, bodies, headers, decode, duration, per_body):
+    """POST bodies round-robin for duration seconds -> (reviews, wall, client cpu s)"""
+    reviews, i = 0, 0
+    c0, t0 = time.process_time(), time.perf_counter()
+    while time.perf_counter() - t0 < duration:
+        r = client.post(url, content=bodies[i % len(bodies)], headers=headers)
+        r.raise_for_status()
+        decode(r.content)
+        reviews += per_body; i += 1
+    return reviews, time.perf_counter() - t0, time.process_time() - c0
+
+
+def bench_http(texts, batch_size, duration, with_proba, formats):
+    import httpx
+    port = free_port()
+    proc = start_server("fastapi", port, 1)
+    server = psutil.Process(proc.pid)
+    base = f"http://127.0.0.1:{port}"
+    q = "?proba=true" if with_proba else ""
+    batches = [texts[s:s+batch_size] for s in range(0, len(texts) - batch_size + 1, batch_size)]
+    runs = {"json_single": (f"{base}/predict/", [json.dumps({"text": t}).encode() for t in texts],
+                            transport.JSON, json.loads, 1)}
+    for name in formats:
+        media = FORMATS[name]
+        runs[f"{name}_batch"] = (f"{base}/predict/batch{q}",
+                                 [transport.encode_request(media, b, [f"r{i}" for i in range(len(b))]) for b in batches],
+                                 media, lambda body, m=media: transport.decode_response(m, body), batch_size)
+    out = {}
+    try:
+        with httpx.Client(timeout=60.0) as client:
+            for name, (url, bodies, media, decode, per_body) in runs.items():
+                headers = {"content-type": media}
+                drive(client, url, bodies[:5], headers, decode, 1.0, per_body)   # warm-up
+                s0 = cpu_seconds(server)
+                reviews, wall, client_cpu = drive(client, url, bodies, headers, decode, duration, per_body)
+                server_cpu = cpu_seconds(server) - s0
+                out[name] = {"reviews": reviews, "reviews_per_s": reviews / wall,
+                             "client_cpu_s_per_1k": 1000 * client_cpu / reviews,
+                             "server_cpu_s_per_1k": 1000 * server_cpu / reviews}
+                r = out[name]
+                print(f"[transport] {name:<13} {r['reviews_per_s']:9.0f} reviews/s  client cpu "
+                      f"{r['client_cpu_s_per_1k']*1000:6.1f}ms/1k  server cpu {r['server_cpu_s_per_1k']*1000:6.1f}ms/1k")
+    finally:
+        stop_server(proc)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--texts", type=int, default=20_000, help="synthetic reviews (src/benchmark.py)")
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per transport in the http run")
+    ap.add_argument("--proba", action="store_true", help="ask for the full probability vectors too")
+    ap.add_argument("--codec-only", action="store_true", help="skip the http run (no server start)")
+    ap.add_argument("--out", default=str(OUT/"transport_bench.json"))
+    args = ap.parse_args()
+
+    formats = [f for f, m in FORMATS.items() if transport.available(m)]
+    missing = sorted(set(FORMATS) - set(formats))
+    if missing:
+        print(f"[transport] skipping {missing}: {', '.join(transport.REQUIRES[FORMATS[f]] for f in missing)} not installed")
+    texts = synthetic_corpus(args.texts, seed=0)
+
+    report = {"texts": len(texts), "batch_size": args.batch_size, "proba": args.proba, "codec": {}, "http": None}
+    for f in formats:
+        r = report["codec"][f] = bench_codec(FORMATS[f], texts[:args.batch_size], args.proba)
+        total = sum(v for k, v in r.items() if k.endswith("_us_per_review"))
+        print(f"[transport] codec {f:<8} {total:6.2f}us/review  "
+              f"{r['request_bytes_per_review']:6.1f} B/review in  {r['response_bytes_per_review']:5.1f} B/review out")
+    if not args.codec_only:
+        report["http"] = bench_http(texts, args.batch_size, args.duration, args.proba, formats)
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"[transport] wrote -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+from contextlib import nullcontext
+from functools import lru_cache
+from pathlib import Path
+import hashlib, os, re, json
+import numpy as np
+import pandas as pd
+
+LABELS = {0:"valid", 1:"advertisement", 2:"irrelevant", 3:"rant_no_visit"}
+NUM_ALL = 4
+
+TFIDF_MODEL   = Path("models/tfidf_lr/model.joblib")
+BERT_DIR      = Path("models/distilbert")
+STUDENT_MODEL = Path("models/student/model.joblib")
+STACK_MODEL   = Path("models/stacking/blend.json")
+
+# servers: BERT_STRIDE>0 scores long reviews as overlapping 512-token windows pooled with
+# BERT_POOL (mean|max) instead of truncating; BERT_TOKEN_BUDGET caps tokens per request
+BERT_WINDOWS = {
+    "stride": int(os.environ.get("BERT_STRIDE", "0")) or None,
+    "pool": os.environ.get("BERT_POOL", "mean"),
+    "token_budget": int(os.environ.get("BERT_TOKEN_BUDGET", "2048")),
+}
+
+# same rules as the batch scripts (02_rules / 05 / 06 / 08c)
+ADS = re.compile(r"(http|www|promo|discount|use code|follow\s*@)", re.I)
+NOV = re.compile(r"(never been|haven't been|didn't go|won't go|heard it(?:'s| is))", re.I)
+IRR = re.compile(r"(my phone|ios|android|windows update|gpu driver)", re.I)
+
+
+def rule_ids(texts, ads=ADS, nov=NOV, irr=IRR):
+    """Vectorized rule_id: class id per text, -1 where no rule fires (ADS > NOV > IRR)."""
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).tolist()
+    hit_ads = np.fromiter((ads.search(t) is not None for t in texts), bool, len(texts))
+    hit_nov = np.fromiter((nov.search(t) is not None for t in texts), bool, len(texts))
+    hit_irr = np.fromiter((irr.search(t) is not None for t in texts), bool, len(texts))
+    return np.select([hit_ads, hit_nov, hit_irr], [1, 3, 2], default=-1)
+
+
+@lru_cache(maxsize=None)
+def _match_width(pat, cap=256):
+    """longest possible match of pat, capped (unbounded repeats like \\s* count as cap)"""
+    try:
+        import re._parser as sre_parse
+    except ImportError:   # python < 3.11
+        import sre_parse
+    return min(sre_parse.parse(pat.pattern, pat.flags).getwidth()[1], cap)
+
+
+def rule_id_budgeted(text, rules, max_chars=None, budget_s=None, window=8192, deadline=None):
+    """rule_id for untrusted input: (class id or None, cut) with cut in {None, "length", "time"}.
+
+    rules: [(class id, compiled pattern)] in precedence order.
+    max_chars: longer texts are scanned as head + tail (max_chars/2 each).
+    budget_s: patterns scan the text in windows (overlapping by the pattern's
+    longest match) and the rules abstain (None, "time") once the budget is
+    spent, so one huge review can't hold the worker.
+    deadline: absolute time.perf_counter() instead of budget_s, to share one
+    budget between several texts (already past -> (None, "time") at once).
+
+    The clock is only read between windows and patterns: `re` can't interrupt a
+    single search, so this bounds linear-time patterns (what src/rule_audit.py
+    lints for), not catastrophic backtracking inside one window."""
+    import time
+    if deadline is None and budget_s:
+        deadline = time.perf_counter() + budget_s
+    if deadline is not None and time.perf_counter() > deadline:
+        return None, "time"
+    text, cut = str(text), None
+    if max_chars and len(text) > max_chars:
+        half = max_chars // 2
+        text, cut = text[:half] + "\n" + text[-half:], "length"
+    for lbl, pat in rules:
+        if deadline is None or len(text) <= window:
+            hit = pat.search(text) is not None
+        else:
+            overlap, hit = _match_width(pat), False
+            for s in range(0, len(text), window):
+                if pat.search(text, s, s + window + overlap):
+                    hit = True; break
+                if time.perf_counter() > deadline:
+                    return None, "time"
+        if hit:
+            return lbl, cut
+        if deadline is not None and time.perf_counter() > deadline:
+            return None, "time"
+    return None, cut
+
+
+def onehot_ids(ids, k=NUM_ALL, dtype=float):
+    ids = np.asarray(ids)
+    out = np.zeros((len(ids), k), dtype=dtype)
+    hit = ids >= 0
+    out[np.flatnonzero(hit), ids[hit]] = 1.0
+    return out
+
+
+def expand_proba_matrix(P, classes, k=NUM_ALL, dtype=float):
+    """[n, len(classes)] -> [n, k]; rows with no mass fall back to uniform."""
+    out = np.zeros((P.shape[0], k), dtype=dtype)
+    out[:, np.asarray(classes, dtype=int)] = P
+    empty = out.sum(axis=1) == 0
+    out[empty] = 1.0 / k
+    return out
+
+
+def tfidf_proba(clf, texts, dtype=float, store=None):
+    """store: optional src.feature_store.FeatureStore to reuse cached TF-IDF rows"""
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).tolist()
+    if store is not None:
+        P = clf.named_steps["clf"].predict_proba(store.tfidf(clf.named_steps["tfidf"], texts))
+    else:
+        P = clf.predict_proba(texts)
+    return expand_proba_matrix(P, clf.named_steps["clf"].classes_, dtype=dtype)
+
+
+# stacking holdout: the share of train.csv that 04_train_distilbert.py leaves out, so
+# 11_stack.py can fit the triple blend on DistilBERT probabilities it never trained on
+# (test.csv stays for reporting). 04 writes the held-out ids next to the model.
+HOLDOUT_FRAC = 0.2
+HOLDOUT_IDS = BERT_DIR/"holdout_ids.json"
+
+
+def holdout_mask(labels, frac=HOLDOUT_FRAC, seed=42):
+    """bool mask of the stacking holdout rows, stratified by label"""
+    from sklearn.model_selection import train_test_split
+    labels = np.asarray(labels)
+    _, counts = np.unique(labels, return_counts=True)
+    _, hold = train_test_split(np.arange(len(labels)), test_size=frac, random_state=seed,
+                               stratify=labels if counts.min() >= 2 else None)
+    mask = np.zeros(len(labels), dtype=bool); mask[hold] = True
+    return mask
+
+
+def load_bert(model_dir=BERT_DIR):
+    """Returns (tokenizer, model) or (None, None) if DistilBERT hasn't been trained."""
+    if not Path(model_dir).exists():
+        return None, None
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    tok = AutoTokenizer.from_pretrained(str(model_dir))
+    mdl = AutoModelForSequenceClassification.from_pretrained(str(model_dir))
+    mdl.eval()
+    return tok, mdl
+
+
+def _id_windows(tok, ids, max_length, stride):
+    """the tokenizer's overflow windows, rebuilt from cached ids (no special tokens)"""
+    body = max_length - tok.num_special_tokens_to_add()
+    step = max(1, body - stride)
+    input_ids, owner = [], []
+    for i, x in enumerate(ids):
+        s = 0
+        while True:
+            input_ids.append(tok.build_inputs_with_special_tokens(x[s:s+body].tolist())); owner.append(i)
+            if s + body >= len(x): break
+            s += step
+    return input_ids, np.asarray(owner)
+
+
+def bert_windows(tok, texts, max_length=512, stride=128, token_budget=None, ids=None):
+    """Sliding windows of max_length tokens overlapping by stride (needs a fast tokenizer,
+    or ids: cached token ids per text from src.feature_store).
+    -> (per-window features for tok.pad, owner: text index of each window).
+    token_budget caps the total tokens: every text keeps its first window, later
+    windows are taken round-robin (all 2nd windows, then 3rd, ...) while it lasts."""
+    if ids is None:
+        enc = tok(texts, truncation=True, max_length=max_length, stride=stride, return_overflowing_tokens=True)
+        input_ids, owner = enc["input_ids"], np.asarray(enc["overflow_to_sample_mapping"])
+    else:
+        input_ids, owner = _id_windows(tok, ids, max_length, stride)
+    keep = np.arange(len(owner))
+    if token_budget is not None:
+        lens = np.array([len(x) for x in input_ids])
+        nth = keep - np.searchsorted(owner, owner)           # window number within its text
+        order = np.lexsort((owner, nth))
+        ok = (nth[order] == 0) | (np.cumsum(lens[order]) <= token_budget)
+        keep = np.sort(order[ok])
+    feats = [{"input_ids": input_ids[i]} for i in keep]   # tok.pad adds the attention mask
+    return feats, owner[keep]
+
+
+def pool_windows(P, owner, n, pool="mean"):
+    """[windows, k] probabilities -> [n, k]: mean, or max renormalised to sum to 1."""
+    out = np.zeros((n, P.shape[1]))
+    if pool == "max":
+        np.maximum.at(out, owner, P)
+        return out / out.sum(axis=1, keepdims=True)
+    np.add.at(out, owner, P)
+    return out / np.bincount(owner, minlength=n)[:, None]
+
+
+def bert_proba(tok, mdl, texts, batch_size=32, timer=None, stride=None, pool="mean", token_budget=None,
+               max_length=512, store=None):
+    """timer: optional stage -> context manager (e.g. src.metrics.timed) wrapped
+    around tokenization and the forward pass separately.
+    stride=None truncates at max_length tokens. With a stride, long texts are split
+    into overlapping windows (see bert_windows), the windows of all texts are
+    batched together (batch_size windows per forward pass, length-sorted to cut
+    padding) and their probabilities pooled per text.
+    store: optional src.feature_store.FeatureStore; token ids are read from it
+    instead of re-running the tokenizer."""
+    import torch
+    timer = timer or (lambda stage: nullcontext())
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).tolist()
+    ids = store.token_ids(tok, texts) if store is not None else None
+    if stride is not None or ids is not None:
+        with timer("bert_tokenize"):
+            if stride is None:   # truncation from cached ids: each text's first window
+                body = max_length - tok.num_special_tokens_to_add()
+                feats = [{"input_ids": tok.build_inputs_with_special_tokens(x[:body].tolist())} for x in ids]
+                owner = np.arange(len(ids))
+            else:
+                feats, owner = bert_windows(tok, texts, max_length, stride, token_budget, ids)
+        order = np.argsort([len(f["input_ids"]) for f in feats], kind="stable")
+        P = np.zeros((len(feats), mdl.config.num_labels))
+        with torch.no_grad():
+            for i in range(0, len(order), batch_size):
+                idx = order[i:i+batch_size]
+                with timer("bert_tokenize"):
+                    enc = tok.pad([feats[j] for j in idx], return_tensors="pt")
+                with timer("bert_forward"):
+                    P[idx] = torch.softmax(mdl(**enc).logits, dim=-1).cpu().numpy()
+        return pool_windows(P, owner, len(texts), pool)
+    out = []
+    with torch.no_grad():
+        for i in range(0, len(texts), batch_size):
+            with timer("bert_tokenize"):
+                enc = tok(texts[i:i+batch_size], padding=True, truncation=True, max_length=max_length,
+                          return_tensors="pt")
+            with timer("bert_forward"):
+                out.append(torch.softmax(mdl(**enc).logits, dim=-1).cpu().numpy())
+    return np.vstack(out) if out else np.zeros((0, NUM_ALL))
+
+
+# ---------- blending ----------
+
+# the hand-tuned soft votes, used until src/11_stack.py has been run
+DEFAULT_BLENDS = {
+    "pair":   {"inputs": ["tfidf", "rules"],         "weights": [0.6, 0.4]},
+    "triple": {"inputs": ["bert", "tfidf", "rules"], "weights": [0.5, 0.3, 0.2]},
+}
+
+
+class Blend:
+    """proba = [p_in1 | p_in2 | ...] @ W + b, optionally softmaxed.
+
+    A fixed soft vote is W = stacked w_i * I with b = 0; a stacked
+    meta-classifier is a full [4*k, 4] matrix. Either way it's one matmul.
+    """
+    def __init__(self, inputs, W, b, softmax=False, version=0):
+        self.inputs = list(inputs)
+        self.W = np.asarray(W, dtype=float)
+        self.b = np.asarray(b, dtype=float)
+        self.softmax = bool(softmax)
+        self.version = version
+
+    @classmethod
+    def from_weights(cls, inputs, weights, k=NUM_ALL):
+        W = np.vstack([w*np.eye(k) for w in weights])
+        return cls(inputs, W, np.zeros(k))
+
+    def __call__(self, **probs):
+        F = np.hstack([np.atleast_2d(probs[name]) for name in self.inputs])
+        z = F @ self.W.astype(F.dtype, copy=False) + self.b.astype(F.dtype, copy=False)   # float32 in, float32 out
+        if self.softmax:
+            z = np.exp(z - z.max(axis=1, keepdims=True))
+            z /= z.sum(axis=1, keepdims=True)
+        return z
+
+    def to_dict(self):
+        return {"inputs": self.inputs, "W": self.W.tolist(), "b": self.b.tolist(), "softmax": self.softmax}
+
+
+def load_blend(kind, path=STACK_MODEL):
+    """kind: "pair" (tfidf+rules) or "triple" (bert+tfidf+rules)."""
+    path = Path(path)
+    if path.exists():
+        art = json.loads(path.read_text())
+        if kind in art["blends"]:
+            d = art["blends"][kind]
+            return Blend(d["inputs"], d["W"], d["b"], d["softmax"], version=art["version"])
+    return Blend.from_weights(**DEFAULT_BLENDS[kind])
+
+
+CASCADE_CFG = Path("models/cascade.json")
+
+
+def cascade_escalate(p_cheap, p_tfidf, rule_lbls, threshold):
+    """Rows the cheap tfidf+rules blend can't settle: low blended confidence, or
+    a rule fired and disagrees with tfidf."""
+    disagree = (rule_lbls >= 0) & (rule_lbls != p_tfidf.argmax(axis=1))
+    return (p_cheap.max(axis=1) < threshold) | disagree
+
+
+# ---------- compact results ----------
+
+def text_id(text):
+    """review id for files without an id column: the same text gets the same id in any file or re-run"""
+    return "sha1:" + hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:20]
+
+
+class Prediction:
+    """One scored review. With __slots__ it takes ~80 bytes vs ~210 for the equivalent dict."""
+    __slots__ = ("id", "label_id", "confidence")
+
+    def __init__(self, label_id, confidence, id=None):
+        self.id, self.label_id, self.confidence = id, int(label_id), float(confidence)
+
+    @property
+    def label(self):
+        return LABELS.get(self.label_id, "UNKNOWN")
+
+    def to_dict(self):
+        out = {"label_id": self.label_id, "label": self.label, "confidence": self.confidence}
+        if self.id is not None:
+            out["id"] = self.id
+        return out
+
+    def __repr__(self):
+        return f"Prediction(id={self.id!r}, label={self.label!r}, confidence={self.confidence:.3f})"
+
+
+def bulk_score(clf, texts, blend=None, chunk=50_000, store=None):
+    """rules + tfidf (+ pair blend) over many texts, chunk by chunk
+    -> (pred uint8 [n], proba float32 [n, 4]). store: see tfidf_proba"""
+    blend = blend or load_blend("pair")
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).tolist()
+    proba = np.empty((len(texts), NUM_ALL), dtype=np.float32)
+    for i in range(0, len(texts), chunk):
+        part = texts[i:i+chunk]
+        proba[i:i+chunk] = blend(tfidf=tfidf_proba(clf, part, dtype=np.float32, store=store),
+                                 rules=onehot_ids(rule_ids(part), dtype=np.float32))
+    return proba.argmax(axis=1).astype(np.uint8), proba
+
+
+def score_csv(clf, path, text_col="text", id_col="id", chunksize=50_000, blend=None):
+    """bulk_score a csv without holding its text: only ids, uint8 labels and float32
+    probabilities are kept -> (ids, pred [n], proba [n, 4]). Join text back with join_text."""
+    blend = blend or load_blend("pair")
+    ids, preds, probas = [], [], []
+    for part in pd.read_csv(path, usecols=[id_col, text_col], chunksize=chunksize):
+        pred, proba = bulk_score(clf, part[text_col], blend, chunk=chunksize)
+        ids.append(part[id_col].to_numpy()); preds.append(pred); probas.append(proba)
+    if not ids:
+        return np.zeros(0), np.zeros(0, dtype=np.uint8), np.zeros((0, NUM_ALL), dtype=np.float32)
+    return np.concatenate(ids), np.concatenate(preds), np.concatenate(probas)
+
+
+def join_text(preds, source, id_col="id", text_col="text", chunksize=200_000):
+    """Add the text column to an id-keyed preds frame, streaming the source csv."""
+    want = pd.Index(preds[id_col])
+    parts = [c[c[id_col].isin(want)] for c in pd.read_csv(source, usecols=[id_col, text_col], chunksize=chunksize)]
+    texts = pd.concat(parts).drop_duplicates(id_col) if parts else pd.DataFrame(columns=[id_col, text_col])
+    return preds.merge(texts, on=id_col, how="left")
@@ -0,0 +1,6 @@
+import os, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)   # the scripts and src/app.py use paths relative to review-filter/
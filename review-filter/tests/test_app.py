@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src import profiling, transport
+from src.app import app
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+def test_predict(client):
+    r = client.post("/predict/", json={"text": "use code SAVE20 at www.example.com"})
+    assert r.status_code == 200
+    assert r.json()["label"] == "advertisement" and 0 < r.json()["confidence"] <= 1
+
+
+@pytest.mark.parametrize("body", [{}, {"text": 1}, {"text": "x", "mode": "bogus"}])
+def test_predict_rejects_bad_bodies(client, body):
+    assert client.post("/predict/", json=body).status_code == 422
+
+
+def test_batch_matches_single(client):
+    texts = ["lovely pasta", "use code SAVE20 at www.example.com", "my phone died"]
+    r = client.post("/predict/batch", content=transport.encode_request(transport.JSON, texts, ["a", "b", "c"]),
+                    headers={"content-type": transport.JSON})
+    assert r.status_code == 200
+    ids, pred, _, _ = transport.decode_response(transport.JSON, r.content)
+    assert ids == ["a", "b", "c"]
+    assert pred.tolist() == [client.post("/predict/", json={"text": t}).json()["label_id"] for t in texts]
+
+
+@pytest.mark.parametrize("body, content_type, status", [
+    (b'{"text": "one review"}', transport.JSON, 422),        # /predict/ body sent to the batch route
+    (b'{"texts": "not a list"}', transport.JSON, 422),
+    (b"not json", transport.JSON, 422),
+    (b'{"texts": ["a"]}', "text/csv", 415),
+])
+def test_batch_rejects_bad_bodies(client, body, content_type, status):
+    assert client.post("/predict/batch", content=body, headers={"content-type": content_type}).status_code == status
+
+
+@pytest.fixture
+def profiled(client, monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    r = client.post("/predict/?profile=true", json={"text": "lovely pasta"})
+    return r.json()["profile_id"]
+
+
+def test_profile_capture(client, profiled):
+    r = client.get(f"/debug/profiles/{profiled}?sort=cumulative")
+    assert r.status_code == 200 and "classify" in r.json()["profile"] and "total" in r.json()["stages_ms"]
+
+
+def test_profile_rejects_unknown_sort(client, profiled):
+    assert client.get(f"/debug/profiles/{profiled}?sort=bogus").status_code == 422
+    with pytest.raises(ValueError):
+        profiling.get_capture(profiled, sort="bogus")
+
+
+def test_profiles_off_is_404(client):
+    assert client.get("/debug/profiles").status_code == 404
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import accuracy_score, f1_score
+
+from src.evaluation import confusion, confusion_batch, evaluate, paired_delta, read_preds, scores, summarize
+
+rng = np.random.default_rng(0)
+Y = rng.integers(0, 4, 300)
+GOOD = np.where(rng.random(300) < 0.8, Y, rng.integers(0, 4, 300))
+BAD = np.where(rng.random(300) < 0.4, Y, rng.integers(0, 4, 300))
+
+
+def frame(pred):
+    return pd.DataFrame({"id": [f"r{i}" for i in range(len(Y))], "label": Y, "pred": pred})
+
+
+def test_point_scores_match_sklearn():
+    p = GOOD.copy(); p[p == 3] = 2            # class 3 never predicted
+    s = scores(confusion(Y, p))
+    assert s["macro_f1"] == pytest.approx(f1_score(Y, p, average="macro"))
+    assert s["accuracy"] == pytest.approx(accuracy_score(Y, p))
+    np.testing.assert_allclose(s["f1"], f1_score(Y, p, average=None, labels=range(4)))
+    only_two = scores(confusion(np.array([0, 0, 1]), np.array([0, 1, 1])))
+    assert only_two["macro_f1"] == pytest.approx(f1_score([0, 0, 1], [0, 1, 1], average="macro"))
+
+
+def test_confusion_batch_equals_per_resample_confusion():
+    idx = rng.integers(0, len(Y), size=(5, len(Y)))
+    cms = confusion_batch(Y * 4 + GOOD, idx)
+    for b in range(5):
+        np.testing.assert_array_equal(cms[b], confusion(Y[idx[b]], GOOD[idx[b]]))
+
+
+def test_evaluate_and_paired_delta():
+    row = evaluate(frame(GOOD), B=500)
+    assert row["macro_f1"] == pytest.approx(f1_score(Y, GOOD, average="macro"))
+    assert row["macro_f1_lo"] <= row["macro_f1"] <= row["macro_f1_hi"] and row["support"] == len(Y)
+    d = paired_delta(frame(GOOD), frame(BAD), B=500)
+    assert d["delta"] == pytest.approx(f1_score(Y, GOOD, average="macro") - f1_score(Y, BAD, average="macro"))
+    assert d["lo"] > 0 and d["p_le_0"] == 0
+    assert paired_delta(frame(GOOD), frame(BAD).assign(id="other"), B=10) is None
+
+
+def test_read_preds_skips_unusable_files(tmp_path, capsys):
+    (tmp_path/"empty.csv").write_text("")
+    (tmp_path/"nolabels.csv").write_text("id,text\nr1,hello\n")
+    (tmp_path/"strings.csv").write_text("label,pred\n0,ad\n")
+    frame(GOOD).to_csv(tmp_path/"good.csv", index=False)
+    assert read_preds(tmp_path/"empty.csv") == ("empty.csv", None)
+    assert read_preds(tmp_path/"nolabels.csv") == ("nolabels.csv", None)
+    assert read_preds(tmp_path/"strings.csv") == ("strings.csv", None)
+    assert capsys.readouterr().out.count("[warn] skipping") == 2
+    name, df = read_preds(tmp_path/"good.csv")
+    assert name == "good.csv" and list(df.columns) == ["id", "label", "pred"]
+
+
+def test_summarize_ranks_models_and_skips_broken_files(tmp_path):
+    frame(BAD).to_csv(tmp_path/"bad.csv", index=False)
+    frame(GOOD).to_csv(tmp_path/"good.csv", index=False)
+    (tmp_path/"broken.csv").write_text("")
+    s = summarize(tmp_path, B=200)
+    assert s["file"].tolist() == ["good.csv", "bad.csv"]
+    assert np.isnan(s.loc[0, "delta_vs_best"]) and s.loc[1, "delta_vs_best"] < 0
+    assert summarize(tmp_path/"missing", B=10).empty
@@ -0,0 +1,84 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.feature_store import FeatureStore, _Segment, text_keys
+
+TEXTS = ["great pasta", "use code SAVE20", "phone died at dinner", "never been here", "cold pasta"]
+
+
+def vectorizer():
+    return TfidfVectorizer().fit(TEXTS)
+
+
+def test_tfidf_matches_transform_across_appends_reloads_and_compact(tmp_path):
+    vec = vectorizer()
+    batches = [TEXTS[:2], ["great pasta", "cold pasta", "great pasta"], TEXTS + [None, ""], []]
+    store = FeatureStore(tmp_path)
+    for b in batches:
+        texts = ["" if t is None else t for t in b]
+        X = store.tfidf(vec, b)
+        assert X.shape == (len(b), len(vec.vocabulary_))
+        if texts:
+            np.testing.assert_array_equal(X.toarray(), vec.transform(texts).toarray())
+    assert store.misses == len(set(TEXTS) | {""})
+
+    (d,) = tmp_path.iterdir()
+    assert len(_Segment(d).tags) == 3
+    assert FeatureStore(tmp_path).compact() == {d.name: 3}
+    fresh = FeatureStore(tmp_path)
+    np.testing.assert_array_equal(fresh.tfidf(vec, TEXTS[::-1]).toarray(), vec.transform(TEXTS[::-1]).toarray())
+    assert (fresh.hits, fresh.misses) == (len(TEXTS), 0)
+    assert len(_Segment(d).tags) == 1
+
+
+def test_two_stores_append_to_the_same_directory(tmp_path):
+    vec = vectorizer()
+    a, b = FeatureStore(tmp_path), FeatureStore(tmp_path)
+    a.tfidf(vec, TEXTS[:2])
+    b.tfidf(vec, TEXTS[1:])          # picks up a's part instead of featurizing TEXTS[1] again
+    X = a.tfidf(vec, TEXTS)          # and a picks up b's
+    np.testing.assert_array_equal(X.toarray(), vec.transform(TEXTS).toarray())
+    assert (a.misses, b.misses) == (2, 3)
+
+
+def test_uncommitted_part_is_left_to_readers_and_removed_by_the_writer(tmp_path):
+    vec = vectorizer()
+    store = FeatureStore(tmp_path)
+    store.tfidf(vec, TEXTS[:2])
+    (d,) = tmp_path.iterdir()
+    in_flight = d/"X-0000000002.npz"       # another writer's part, keys file not written yet
+    in_flight.write_bytes(b"partial")
+    stale_tmp = d/"keys-0000000002.tmp.npy"
+    stale_tmp.write_bytes(b"partial")
+    seg = _Segment(d)
+    assert seg.tags == ["0000000000"] and in_flight.exists() and stale_tmp.exists()
+    rows, _ = seg.lookup(text_keys(TEXTS[:2]))
+    assert rows.tolist() == [0, 1]
+
+    store.tfidf(vec, TEXTS[2:])            # holds the lock, so the leftover is a crash's
+    assert not stale_tmp.exists() and in_flight.read_bytes() != b"partial"   # replaced by the writer's own part
+    np.testing.assert_array_equal(FeatureStore(tmp_path).tfidf(vec, TEXTS).toarray(),
+                                  vec.transform(TEXTS).toarray())
+
+
+class WordTokenizer:
+    """the slice of the HF tokenizer API the store uses"""
+    def __init__(self):
+        self.vocab = {}
+
+    def get_vocab(self):
+        return {"[PAD]": 0, "[UNK]": 1}
+
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [[self.vocab.setdefault(w, len(self.vocab) + 2) for w in t.split()] for t in texts]}
+
+
+def test_token_ids_round_trip(tmp_path):
+    tok = WordTokenizer()
+    store = FeatureStore(tmp_path)
+    first = [x.tolist() for x in store.token_ids(tok, TEXTS[:3])]
+    again = [x.tolist() for x in FeatureStore(tmp_path).token_ids(tok, TEXTS[::-1] + [""])]
+    expect = tok(TEXTS)["input_ids"]
+    assert first == expect[:3]
+    assert again == expect[::-1] + [[]]
+    assert all(x.dtype == np.int32 for x in store.token_ids(tok, TEXTS))
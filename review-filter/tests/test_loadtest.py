@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from src.loadtest import make_payloads, request_path
+
+
+def test_batch_runs_hit_the_batch_endpoint():
+    assert request_path("fastapi") == "/predict/"
+    assert request_path("fastapi", batch=True) == "/predict/batch"
+    assert request_path("shared", batch=True) == "/predict/batch"
+    assert request_path("flask") == "/api/locations/search"
+    assert request_path("fastapi", batch=True, path="/custom") == "/custom"
+
+
+def test_flask_has_no_batch_endpoint():
+    with pytest.raises(ValueError):
+        request_path("flask", batch=True)
+
+
+def test_payload_shapes():
+    texts = ["a", "b", "c"]
+    single = make_payloads(texts, np.array([2]), np.array([1.0]), batch=False, n=3)
+    batch = make_payloads(texts, np.array([2]), np.array([1.0]), batch=True, n=3)
+    assert all(set(p) == {"text"} and len(p["text"].split()) == 2 for p in single)
+    assert all(set(p) == {"texts"} and len(p["texts"]) == 2 for p in batch)
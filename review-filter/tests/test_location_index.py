@@ -0,0 +1,45 @@
+import joblib
+import pandas as pd
+import pytest
+
+from src.location_index import LocationIndex, normalize
+from src.utils import TFIDF_MODEL
+
+REVIEWS = pd.DataFrame({
+    "location": ["Blue Bottle Coffee", "Blue Bottle Coffee", "Café Olé", "Café Olé"],
+    "text": ["great espresso", "use code SAVE20 at www.x.com", "lovely terrace", "my phone died here"],
+    "rating": [5, 1, 4, None],
+})
+
+
+@pytest.fixture(scope="module")
+def clf():
+    return joblib.load(TFIDF_MODEL)
+
+
+def test_files_without_ids_dont_collide(tmp_path, clf):
+    idx = LocationIndex(tmp_path/"loc.sqlite")
+    # both halves have row index 0..1; ids must come from the text, not the row
+    assert idx.add_reviews(REVIEWS.iloc[:2].reset_index(drop=True), clf) == 2
+    assert idx.add_reviews(REVIEWS.iloc[2:].reset_index(drop=True), clf) == 2
+    assert idx.add_reviews(REVIEWS, clf) == 0   # re-running adds nothing
+    loc = idx.search("blue bottle")[0]
+    assert idx.summary(loc["loc_id"])["total_reviews"] == 2
+
+
+def test_explicit_ids_are_per_location(tmp_path, clf):
+    idx = LocationIndex(tmp_path/"loc.sqlite")
+    df = REVIEWS.assign(id=["1", "2", "1", "2"])
+    assert idx.add_reviews(df, clf) == 4
+    assert idx.add_reviews(df.assign(text="changed"), clf) == 0
+
+
+def test_search_prefix_word_and_fuzzy(tmp_path, clf):
+    idx = LocationIndex(tmp_path/"loc.sqlite")
+    idx.add_reviews(REVIEWS, clf)
+    assert normalize("Café Olé") == "cafe ole"
+    assert idx.search("blue")[0]["match"] == "prefix"
+    assert idx.search("coffee")[0]["match"] == "word_prefix"
+    assert idx.search("blu botle")[0]["name"] == "Blue Bottle Coffee"
+    page = idx.reviews(idx.search("cafe ole")[0]["loc_id"], per_page=1)
+    assert page["total"] == 2 and len(page["reviews"]) == 1
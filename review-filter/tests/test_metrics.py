@@ -0,0 +1,46 @@
+import pytest
+
+from src import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    return metrics.REGISTRY
+
+
+def test_counter_render(registry):
+    c = metrics.Counter("t_total", "Things.", ["kind"])
+    c.inc(kind="a"); c.inc(2, kind="a"); c.inc(kind="b")
+    assert metrics.render() == '# HELP t_total Things.\n# TYPE t_total counter\nt_total{kind="a"} 3\nt_total{kind="b"} 1\n'
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    h = metrics.Histogram("t_seconds", "Time.", buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v)
+    lines = h.render()
+    assert lines[2:] == ['t_seconds_bucket{le="0.1"} 2', 't_seconds_bucket{le="1.0"} 3', 't_seconds_bucket{le="+Inf"} 4',
+                         "t_seconds_sum 3.65", "t_seconds_count 4"]
+
+
+def test_disabled_metrics_record_nothing(registry, monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    c = metrics.Counter("t_total", "Things.")
+    c.inc()
+    assert c.render()[2:] == []
+
+
+def test_timed_fills_the_request_stage_breakdown(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    stages = {}
+    token = metrics.current_stages.set(stages)
+    try:
+        with metrics.timed("t_stage"):
+            pass
+        metrics.timed("t_stage")(lambda: None)()
+    finally:
+        metrics.current_stages.reset(token)
+    assert list(stages) == ["t_stage"] and stages["t_stage"] >= 0
+    assert metrics.STAGE_SECONDS.series[("t_stage",)][2] == 2
@@ -0,0 +1,33 @@
+import re
+
+import numpy as np
+import pytest
+
+from src.rule_audit import find_patterns, growth, hit_stats, lint, top_level_branches
+
+
+@pytest.mark.parametrize("pattern, risk", [(r"(a+)+b", "exponential"), (r"(ab|a)*c", "exponential"),
+                                           (r"foo\s+\s+bar", "quadratic"), (r".*coupon", "quadratic")])
+def test_lint_flags_backtracking_shapes(pattern, risk):
+    assert risk in {i["risk"] for i in lint(pattern)}
+
+
+def test_served_patterns_are_found_and_clean():
+    found = find_patterns()
+    names = {n for e in found.values() for n in e["names"]}
+    assert {"ADS", "NOV", "IRR"} <= names
+    for (pattern, flags), e in found.items():
+        assert not [i for i in lint(pattern, flags) if i["risk"] != "info"], e["where"]
+
+
+def test_top_level_branches_respects_groups_and_classes():
+    assert top_level_branches(r"(a|b\s+c)") == ["a", r"b\s+c"]
+    assert top_level_branches(r"x(?:y|z)|[|]w") == ["x(?:y|z)", "[|]w"]
+
+
+def test_growth_and_hit_stats():
+    sizes = np.array([1e4, 1e5, 1e6])
+    assert growth(sizes, sizes * 1e-9) == pytest.approx(1)
+    assert growth(sizes, sizes ** 2 * 1e-12) == pytest.approx(2)
+    row = hit_stats(re.compile("promo"), ["promo code", "nice", "promo!"], np.array([1, 0, 0]), 1)
+    assert row == {"hits": 2, "hit_rate": pytest.approx(2 / 3), "precision": 0.5, "recall": 1.0}
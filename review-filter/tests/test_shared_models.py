@@ -0,0 +1,54 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from src.shared_models import BertClient, export_pipeline, is_current, load_pipeline
+
+TRAIN = ["great pasta and friendly staff", "use code SAVE20 for a discount", "my phone died during dinner",
+         "never been here but it looks nice", "the pasta was cold", "friendly staff, slow service"] * 3
+LABELS = [0, 1, 2, 3, 0, 0] * 3
+QUERIES = ["Pasta pasta PASTA with friendly staff!", "discount code", "words the model never saw", ""]
+
+
+def exported(tmp_path, vec):
+    clf = Pipeline([("tfidf", vec), ("clf", LogisticRegression(max_iter=1000))]).fit(TRAIN, LABELS)
+    source = tmp_path/"model.joblib"
+    joblib.dump(clf, source)
+    export_pipeline(clf, tmp_path/"shared", source)
+    return clf, source
+
+
+@pytest.mark.parametrize("params", [{}, {"ngram_range": (1, 2), "sublinear_tf": True, "min_df": 2},
+                                    {"binary": True, "norm": "l1", "use_idf": False}])
+def test_shared_tfidf_matches_sklearn(tmp_path, params):
+    clf, _ = exported(tmp_path, TfidfVectorizer(**params))
+    vec, lr = load_pipeline(tmp_path/"shared")
+    X, Xs = clf.named_steps["tfidf"].transform(QUERIES), vec.transform(QUERIES)
+    np.testing.assert_allclose(Xs.toarray(), X.toarray(), rtol=1e-6)
+    np.testing.assert_allclose(lr.predict_proba(Xs), clf.predict_proba(QUERIES), rtol=1e-6)
+    assert vec.n_terms == len(clf.named_steps["tfidf"].vocabulary_)
+    assert list(vec.get_feature_names_out()) == list(clf.named_steps["tfidf"].get_feature_names_out())
+    assert not hasattr(vec, "vocabulary_")   # a dict would be a private copy in every worker
+
+
+def test_hashing_pipeline_and_fingerprint(tmp_path):
+    clf = Pipeline([("hash", HashingVectorizer(n_features=2**10)), ("clf", LogisticRegression(max_iter=1000))])
+    clf.fit(TRAIN, LABELS)
+    source = tmp_path/"student.joblib"
+    joblib.dump(clf, source)
+    export_pipeline(clf, tmp_path/"shared", source)
+    np.testing.assert_allclose(load_pipeline(tmp_path/"shared").predict_proba(QUERIES), clf.predict_proba(QUERIES))
+    assert is_current(tmp_path/"shared", source)
+    joblib.dump(clf.set_params(clf__C=0.5).fit(TRAIN, LABELS), source)
+    assert not is_current(tmp_path/"shared", source)
+
+
+def test_bert_client_unreachable_is_runtime_error(tmp_path):
+    client = BertClient(str(tmp_path/"no-worker.sock"), b"key")
+    for _ in range(2):   # the failed connection is dropped and retried on the next call
+        with pytest.raises(RuntimeError, match="unreachable"):
+            client(["text"])
+        assert client.conn is None
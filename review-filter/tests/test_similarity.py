@@ -0,0 +1,56 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.similarity import SimilarityIndex, read_reviews
+from src.utils import TFIDF_MODEL, text_id
+
+TEXTS = ["great pasta and friendly staff", "use code SAVE20 for a discount", "my phone died during dinner",
+         "never been here but it looks nice", "the pasta was cold", "friendly staff, slow service"]
+
+
+@pytest.fixture(scope="module")
+def vec():
+    return TfidfVectorizer().fit(TEXTS)
+
+
+def test_csv_without_ids_gets_text_hash_ids(tmp_path):
+    pd.DataFrame({"text": TEXTS[:3], "label": [0, 1, 2]}).to_csv(tmp_path/"a.csv", index=False)
+    pd.DataFrame({"text": TEXTS[3:], "label": [3, 0, 0]}).to_csv(tmp_path/"b.csv", index=False)
+    clf = joblib.load(TFIDF_MODEL)
+    ids_a, _, labels = read_reviews(tmp_path/"a.csv", clf)
+    ids_b, _, _ = read_reviews(tmp_path/"b.csv", clf)
+    assert ids_a == [text_id(t) for t in TEXTS[:3]] and labels == [0, 1, 2]
+    assert not set(ids_a) & set(ids_b)   # row numbers would repeat 0..n-1 in both files
+
+
+def test_add_second_file_after_save(tmp_path, vec):
+    idx = SimilarityIndex(vec)
+    assert idx.add([text_id(t) for t in TEXTS[:3]], TEXTS[:3], [0, 1, 2]) == 3
+    idx.save(tmp_path/"sim.joblib")
+    idx = SimilarityIndex.load(vec, tmp_path/"sim.joblib")
+    assert idx.add([text_id(t) for t in TEXTS[3:]], TEXTS[3:], [3, 0, 0]) == 3
+    assert idx.add([text_id(TEXTS[0])], TEXTS[:1], [0]) == 0   # same review again is skipped
+    assert len(idx) == 6
+
+
+def test_search_matches_brute_force(tmp_path, vec):
+    idx = SimilarityIndex(vec, delta_limit=2)
+    idx.add([str(i) for i in range(len(TEXTS))], TEXTS, [0] * len(TEXTS))
+    idx.save(tmp_path/"sim.joblib")
+    for loaded in (idx, SimilarityIndex.load(vec, tmp_path/"sim.joblib", mmap_mode="r")):
+        hits = loaded.search("friendly staff and pasta", k=3)
+        q = vec.transform(["friendly staff and pasta"])
+        scores = (vec.transform(TEXTS) @ q.T).toarray().ravel()
+        assert [h["id"] for h in hits] == [str(i) for i in np.argsort(-scores)[:3]]
+    assert all(h["id"] != "0" for h in idx.search(id="0", k=5))
+    with pytest.raises(KeyError):
+        idx.search(id="missing")
+
+
+def test_load_rejects_other_vectorizer(tmp_path, vec):
+    SimilarityIndex(vec).save(tmp_path/"sim.joblib")
+    with pytest.raises(ValueError):
+        SimilarityIndex.load(TfidfVectorizer().fit(["other words entirely"]), tmp_path/"sim.joblib")
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src import transport
+from src.utils import NUM_ALL
+
+MEDIA = [transport.JSON,
+         pytest.param(transport.MSGPACK, marks=pytest.mark.skipif(not transport.available(transport.MSGPACK),
+                                                                  reason="msgpack not installed")),
+         pytest.param(transport.ARROW, marks=pytest.mark.skipif(not transport.available(transport.ARROW),
+                                                                reason="pyarrow not installed"))]
+TEXTS = ["great food", "visit www.x.com", "", "ünïcode ✓"]
+
+
+@pytest.mark.parametrize("media", MEDIA)
+@pytest.mark.parametrize("ids", [None, ["a", "b", "c", "d"]])
+def test_request_round_trip(media, ids):
+    assert transport.decode_request(media, transport.encode_request(media, TEXTS, ids)) == (TEXTS, ids)
+
+
+@pytest.mark.parametrize("media", MEDIA)
+@pytest.mark.parametrize("with_proba", [False, True])
+def test_response_round_trip(media, with_proba):
+    proba = np.random.default_rng(0).dirichlet(np.ones(NUM_ALL), size=len(TEXTS)).astype(np.float32)
+    pred = proba.argmax(axis=1).astype(np.uint8)
+    ids, p, conf, P = transport.decode_response(media, transport.encode_response(media, pred, proba, ["a", "b", "c", "d"], with_proba))
+    assert ids == ["a", "b", "c", "d"]
+    np.testing.assert_array_equal(p, pred)
+    np.testing.assert_allclose(conf, proba.max(axis=1), rtol=1e-6)
+    if with_proba:
+        np.testing.assert_allclose(P, proba, rtol=1e-6)
+    else:
+        assert P is None
+
+
+@pytest.mark.parametrize("media", MEDIA)
+def test_malformed_bodies_raise_value_error(media):
+    with pytest.raises(ValueError):
+        transport.decode_request(media, b"\xc1 not a valid body")
+
+
+def test_media_type():
+    assert transport.media_type(None) == transport.JSON
+    assert transport.media_type("application/x-msgpack; charset=binary") == transport.MSGPACK
+    assert transport.media_type("text/csv") is None
+    with pytest.raises(ValueError):
+        transport.decode_request(transport.JSON, b'{"texts": "not a list"}')
+    with pytest.raises(ValueError):
+        transport.decode_request(transport.JSON, b'{"texts": ["a"], "ids": ["1", "2"]}')